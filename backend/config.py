@@ -28,6 +28,7 @@ VIDEO_INPAINT_MODEL_PATH = os.path.join(BASE_DIR, 'models', 'video')
 MODEL_VERSION = 'V4'
 DET_MODEL_BASE = os.path.join(BASE_DIR, 'models')
 DET_MODEL_PATH = os.path.join(DET_MODEL_BASE, MODEL_VERSION, 'ch_det')
+DET_FAST_MODEL_PATH = os.path.join(DET_MODEL_BASE, MODEL_VERSION, 'ch_det_fast')
 
 # 查看该路径下是否有模型完整文件，没有的话合并小文件生成完整文件
 if 'big-lama.pt' not in (os.listdir(LAMA_MODEL_PATH)):
@@ -115,8 +116,45 @@ THRESHOLD_HEIGHT_DIFFERENCE = 20
 # 用于判断两个字幕文本的矩形框是否相似，如果X轴和Y轴偏差都在指定阈值内，则认为时同一个文本框
 PIXEL_TOLERANCE_Y = 20  # 允许检测框纵向偏差的像素点数
 PIXEL_TOLERANCE_X = 20  # 允许检测框横向偏差的像素点数
+# 用于跳过重复的字幕检测，字幕区域缩略灰度图与上一个检测帧的平均像素差异小于该值时，直接沿用上一个检测帧的文本框
+# 设置为0则关闭，一般设置为1-3，设置过大可能会漏掉字幕的变化
+SUBTITLE_ROI_CHANGE_THRESHOLD = 0
+# 去字幕时读取、修复、写入三个阶段并行进行，该值为阶段之间缓存的任务数量(STTN为一段视频帧，LAMA为预读的一组帧)
+# 设置越大越能平滑各阶段的速度波动，但会占用更多内存，设置为0则三个阶段依次执行
+INPAINT_PIPELINE_QUEUE_SIZE = 1
 # ×××××××××× 通用设置 end ××××××××××
 
+# ×××××××××× 字幕检测设置 start ××××××××××
+# 字幕检测时一次送入检测模型的视频帧数量，大于1时会将多帧堆叠为一个批次推理，CPU下可以明显提升检测速度
+# 设置越大占用内存越多，设置为1则逐帧检测
+SUBTITLE_DETECT_BATCH_SIZE = 4
+# 设置了字幕区域时，是否只把字幕区域（外加一定边距）裁剪出来送入检测模型，可以大幅减少检测的像素数量
+SUBTITLE_AREA_CROP_DETECTION = True
+# 裁剪字幕区域时向外扩展的像素点数，防止贴近字幕区域边缘的文本框被截断
+SUBTITLE_AREA_DETECT_MARGIN = 50
+# 字幕检测的采样间隔帧数，设置为1则每一帧都检测
+# 大于1时每隔指定帧数检测一帧，相邻采样帧的字幕不一致时再二分查找字幕出现与消失的准确帧号
+# 字幕一般会持续显示1-5秒，设置为视频帧率的1/3左右可以在几乎不损失精度的情况下大幅减少检测次数
+SUBTITLE_DETECT_SAMPLE_INTERVAL = 1
+# 是否开启级联检测，开启后先用快速检测模型(ch_det_fast)筛查每一帧，
+# 只有快速模型检测到文本且文本框与上一帧相比发生变化时，才使用完整检测模型(ch_det)检测该帧
+SUBTITLE_DETECT_CASCADE = False
+# 字幕检测时后台解码线程的视频帧队列长度，解码与检测并行进行，设置为0则不使用后台解码线程
+SUBTITLE_DETECT_QUEUE_SIZE = 16
+# 字幕检测时解码后将视频帧缩小的倍数(整数)，检测模型内部会将图片缩放到960以内，1080p及以上的视频设置为2基本不影响检测精度
+SUBTITLE_DETECT_DOWNSCALE = 1
+# 字幕检测使用的进程数，大于1时将视频按帧号分段，由多个进程并行检测，适合CPU核心较多的机器
+SUBTITLE_DETECT_WORKERS = 1
+# 多进程字幕检测时每个进程的推理线程数，设置为0则按 CPU核心数 / 进程数 自动分配，避免线程数超过CPU核心数
+SUBTITLE_DETECT_THREADS_PER_WORKER = 0
+# 是否缓存字幕检测与场景检测的结果，同一个视频更换算法或参数重新处理时直接读取缓存，跳过检测
+DETECTION_CACHE_ENABLED = True
+# 检测结果缓存目录，可以运行 python backend/tools/detection_cache.py --clear 清空缓存
+DETECTION_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'detection')
+# 检测结果缓存目录的最大占用空间(MB)，超出时删除最久未使用的缓存
+DETECTION_CACHE_MAX_SIZE = 200
+# ×××××××××× 字幕检测设置 end ××××××××××
+
 # ×××××××××× InpaintMode.STTN算法设置 start ××××××××××
 # 以下参数仅适用STTN算法时，才生效
 """
@@ -146,6 +184,23 @@ STTN_REFERENCE_LENGTH = 10
 STTN_MAX_LOAD_NUM = 50
 if STTN_MAX_LOAD_NUM < STTN_REFERENCE_LENGTH * STTN_NEIGHBOR_STRIDE:
     STTN_MAX_LOAD_NUM = STTN_REFERENCE_LENGTH * STTN_NEIGHBOR_STRIDE
+# 存在多个修复区域(如上下都有字幕)时，是否将所有区域作为一个批次送入模型，可以减少推理次数，但会占用更多显存
+STTN_BATCH_STRIPS = True
+# 跳过字幕检测(STTN_SKIP_DETECTION=True)时，视频按STTN_MAX_LOAD_NUM切分为片段处理，该值为相邻两个片段重叠的帧数，设置为0则不重叠
+# 重叠帧的补全结果在前后两个片段之间平滑过渡，可以消除片段交界处的跳变；重叠帧的编码特征会被复用，不会重复编码
+STTN_CLIP_OVERLAP = 0
+# 是否按遮罩的水平范围收窄修复区域，关闭时修复区域总是整帧宽度，开启后窄小的遮罩可以接近原分辨率送入模型，效果更好且缩放开销更小
+STTN_NARROW_STRIPS = True
+# STTN注意力计算方式：'math'为原实现，显存占用随帧数平方增长；'sdpa'使用torch的scaled_dot_product_attention；
+# 'chunked'按STTN_ATTENTION_CHUNK_SIZE分块计算，显存占用随帧数线性增长。三者结果一致(见tests/test_sttn_attention.py)，后两者可以使用更大的STTN_MAX_LOAD_NUM
+STTN_ATTENTION_BACKEND = 'math'
+STTN_ATTENTION_CHUNK_SIZE = 1024
+# STTN生成器的推理后端，'torch'使用PyTorch运行，'onnx'首次运行时将模型导出为ONNX(缓存于STTN模型目录下的onnx文件夹)并使用ONNX Runtime运行，
+# 使用ONNX_PROVIDERS中的加速方式，没有时使用CPU。导出后会与torch的输出比较，导出失败、结果不一致或无法载入时自动改用'torch'
+STTN_BACKEND = 'torch'
+# ONNX Runtime单个算子内与算子间的线程数，0为ONNX Runtime默认值
+STTN_ONNX_INTRA_OP_THREADS = 0
+STTN_ONNX_INTER_OP_THREADS = 0
 # ×××××××××× InpaintMode.STTN算法设置 end ××××××××××
 
 # ×××××××××× InpaintMode.PROPAINTER算法设置 start ××××××××××
@@ -158,5 +213,31 @@ PROPAINTER_MAX_LOAD_NUM = 70
 # ×××××××××× InpaintMode.LAMA算法设置 start ××××××××××
 # 是否开启极速模式，开启后不保证inpaint效果，仅仅对包含文本的区域文本进行去除
 LAMA_SUPER_FAST = False
+# 是否只对mask各连通区域周围的局部区域做推理，关闭时对整帧做推理
+LAMA_CROP_INFERENCE = True
+# 局部区域在mask外接矩形四周保留的上下文像素数，越大修复效果越接近整帧推理，但速度越慢
+LAMA_CROP_MARGIN = 64
+# 局部区域的宽高向上对齐到该值的整数倍
+LAMA_CROP_MODULO = 8
+# 批量修复时一次推理的所有局部区域的像素总数上限，推理占用的显存/内存与该值成正比，显存不足时调小
+LAMA_BATCH_MAX_PIXELS = 1920 * 1088
+# lama模式下预读的帧数，预读的帧中尺寸相同的局部区域合并推理
+LAMA_LOOKAHEAD_FRAMES = 16
+# 局部区域内的mask像素数超过该值时，缩小局部区域后推理，再将修复结果放大合成到原分辨率的mask内，用于加速4K等高分辨率视频中大面积mask的修复
+# 设置为0则始终按原分辨率推理
+LAMA_MASK_PIXEL_BUDGET = 512 * 512
+# 缩小推理时的最小缩放比例
+LAMA_MIN_SCALE = 0.25
+# lama多进程推理池的工作进程数，每个进程各载入一份模型，内存不足时调小；设置为0则自动确定：GPU推理时为1，CPU推理时为CPU核数(最多4个)
+LAMA_WORKER_PROCESSES = 0
+# LaMa的推理后端，'torch'使用TorchScript模型；'onnx'与'onnx-int8'首次运行时将模型导出为fp32或int8动态量化的ONNX模型(缓存于LAMA_MODEL_PATH目录下)，
+# 并使用ONNX Runtime推理(需要安装onnxscript)，适合没有GPU的机器，int8速度更快但效果略差
+# 导出与量化后会与torch的输出比较(int8比较mask内的PSNR)，导出失败或结果不一致时自动改用'torch'，导出需要torch>=2.6
+LAMA_BACKEND = 'torch'
+# ONNX Runtime单个算子内与算子间的线程数，0为ONNX Runtime默认值
+LAMA_ONNX_INTRA_OP_THREADS = 0
+LAMA_ONNX_INTER_OP_THREADS = 0
+# 'onnx-int8'量化后在mask内与torch输出的PSNR(dB)下限，低于该值时不使用量化模型
+LAMA_ONNX_INT8_MIN_PSNR = 30
 # ×××××××××× InpaintMode.LAMA算法设置 end ××××××××××
 # ×××××××××××××××××××× [可以改] end ××××××××××××××××××××
@@ -1,31 +1,137 @@
+import math
 import os
-from typing import Union
+from typing import List, Union
 import torch
 import numpy as np
 from PIL import Image
-from backend.inpaint.utils.lama_util import prepare_img_and_mask
+from backend.inpaint.utils.lama_util import prepare_img_and_mask, ceil_modulo
 from backend import config
+from backend.tools.mask_composite import MaskCompositor
 
 
 class LamaInpaint:
     def __init__(self, device: torch.device = torch.device("cuda" if torch.cuda.is_available() else "cpu"), model_path=None) -> None:
         if model_path is None:
             model_path = os.path.join(config.LAMA_MODEL_PATH, 'big-lama.pt')
-        self.model = torch.jit.load(model_path, map_location=device)
-        self.model.eval()
-        self.model.to(device)
         self.device = device
+        self.model = None
+        if config.LAMA_BACKEND in ('onnx', 'onnx-int8'):
+            # 使用ONNX Runtime推理，以调用方式相同的OnnxLamaModel代替TorchScript模型
+            try:
+                from backend.inpaint.lama_onnx import load_onnx_model
+                self.model = load_onnx_model('int8' if config.LAMA_BACKEND == 'onnx-int8' else 'fp32', device)
+            except Exception as e:
+                print(f'[Warning] failed to load LaMa ONNX model, fall back to torch: {e}')
+        if self.model is None:
+            self.model = torch.jit.load(model_path, map_location=device)
+            self.model.eval()
+            self.model.to(device)
+        # 只对mask周围的局部区域做推理
+        self.crop_inference = config.LAMA_CROP_INFERENCE
+        self.crop_margin = config.LAMA_CROP_MARGIN
+        self.crop_modulo = config.LAMA_CROP_MODULO
+        self.batch_max_pixels = config.LAMA_BATCH_MAX_PIXELS
+        # mask像素数超过预算时缩小推理分辨率
+        self.mask_pixel_budget = config.LAMA_MASK_PIXEL_BUDGET
+        self.min_scale = config.LAMA_MIN_SCALE
 
     def __call__(self, image: Union[Image.Image, np.ndarray], mask: Union[Image.Image, np.ndarray]):
-        if isinstance(image, np.ndarray):
-            orig_height, orig_width = image.shape[:2]
-        else:
-            orig_height, orig_width = np.array(image).shape[:2]
-        image, mask = prepare_img_and_mask(image, mask, self.device)
-        with torch.inference_mode():
-            inpainted = self.model(image, mask)
-            cur_res = inpainted[0].permute(1, 2, 0).detach().cpu().numpy()
-            cur_res = np.clip(cur_res * 255, 0, 255).astype('uint8')
-            cur_res = cur_res[:orig_height, :orig_width]
-            return cur_res
+        return self.inpaint_batch([image], mask)[0]
 
+    def inpaint_batch(self, images: List[Union[Image.Image, np.ndarray]],
+                      masks: Union[Image.Image, np.ndarray, List[Union[Image.Image, np.ndarray]]]):
+        """
+        批量修复多帧，尺寸与缩放比例相同的局部区域合并为一个批次推理，每个批次内的像素总数不超过LAMA_BATCH_MAX_PIXELS
+        局部区域内的mask像素数超过LAMA_MASK_PIXEL_BUDGET时缩小后推理，修复结果放大后只合成到原分辨率的mask内
+        :param images 待修复的帧
+        :param masks 所有帧共用的一个mask，或与images一一对应的mask列表，列表中相同的mask对象只计算一次连通区域
+        :return 修复后的帧，顺序与images一致
+        """
+        if not isinstance(masks, list):
+            masks = [masks] * len(images)
+        results = [np.array(image) for image in images]
+        arrays = {}
+        for mask in masks:
+            if id(mask) not in arrays:
+                arrays[id(mask)] = np.asarray(mask)
+        masks = [arrays[id(mask)] for mask in masks]
+        # 同一个mask对象只创建一次MaskCompositor、局部区域与缩放比例
+        plans = {}
+        # 按局部区域的尺寸与缩放比例分组 {(高, 宽, 缩放比例): [(帧序号, 局部区域)]}
+        groups = {}
+        for i, (result, mask) in enumerate(zip(results, masks)):
+            if id(mask) not in plans:
+                compositor = MaskCompositor(mask)
+                if compositor.bbox is None:
+                    crop_areas = []
+                elif self.crop_inference:
+                    crop_areas = self.get_crop_areas(compositor.boxes, *result.shape[:2], self.crop_margin, self.crop_modulo)
+                else:
+                    crop_areas = [(0, result.shape[0], 0, result.shape[1])]
+                crop_scales = [self.get_scale(int(np.count_nonzero(compositor.mask[ymin:ymax, xmin:xmax])))
+                               for ymin, ymax, xmin, xmax in crop_areas]
+                plans[id(mask)] = compositor, list(zip(crop_areas, crop_scales))
+            for area, scale in plans[id(mask)][1]:
+                groups.setdefault((area[1] - area[0], area[3] - area[2], scale), []).append((i, area))
+        for (height, width, scale), jobs in groups.items():
+            if scale < 1:
+                # 与cv2.resize按缩放比例计算输出尺寸的方式一致
+                height, width = round(height * scale), round(width * scale)
+            batch_size = max(1, self.batch_max_pixels // (ceil_modulo(height, 8) * ceil_modulo(width, 8)))
+            for batch_start in range(0, len(jobs), batch_size):
+                batch = jobs[batch_start:batch_start + batch_size]
+                inputs = [prepare_img_and_mask(results[i][ymin:ymax, xmin:xmax], masks[i][ymin:ymax, xmin:xmax], self.device,
+                                               scale_factor=scale if scale < 1 else None)
+                          for i, (ymin, ymax, xmin, xmax) in batch]
+                with torch.inference_mode():
+                    inpainted = self.model(torch.cat([image for image, _ in inputs]), torch.cat([mask for _, mask in inputs]))
+                    cur_res = inpainted[:, :, :height, :width].permute(0, 2, 3, 1).detach().cpu().numpy()
+                cur_res = np.clip(cur_res * 255, 0, 255).astype('uint8')
+                for (i, area), res in zip(batch, cur_res):
+                    # mask以外的像素保持原图不变，缩小推理的结果在合成时放大到局部区域的尺寸
+                    plans[id(masks[i])][0].composite(results[i], res, area)
+        return results
+
+    def get_scale(self, mask_pixels):
+        """
+        推理分辨率的缩放比例：mask像素数超过预算时按面积缩小到预算以内，不小于LAMA_MIN_SCALE
+        """
+        if self.mask_pixel_budget <= 0 or mask_pixels <= self.mask_pixel_budget:
+            return 1
+        return max(self.min_scale, math.sqrt(self.mask_pixel_budget / mask_pixels))
+
+    @staticmethod
+    def get_crop_areas(boxes, height, width, margin, modulo):
+        """
+        计算推理用的局部区域：mask各连通区域的外接矩形向四周扩展margin像素作为上下文，宽高对齐到modulo的整数倍，
+        相交的区域合并为一个，直到各区域互不相交，保证每个连通区域完整落在一个局部区域内
+        :param boxes mask各连通区域的外接矩形 [(ymin, ymax, xmin, xmax)]
+        :return 局部区域 [(ymin, ymax, xmin, xmax)]
+        """
+        areas = [(max(0, ymin - margin), min(height, ymax + margin), max(0, xmin - margin), min(width, xmax + margin))
+                 for ymin, ymax, xmin, xmax in boxes]
+        while True:
+            areas = [LamaInpaint.align_area(area, height, width, modulo) for area in areas]
+            merged = []
+            for area in sorted(areas):
+                for i, other in enumerate(merged):
+                    if area[0] < other[1] and other[0] < area[1] and area[2] < other[3] and other[2] < area[3]:
+                        merged[i] = (min(area[0], other[0]), max(area[1], other[1]), min(area[2], other[2]), max(area[3], other[3]))
+                        break
+                else:
+                    merged.append(area)
+            if len(merged) == len(areas):
+                return merged
+            areas = merged
+
+    @staticmethod
+    def align_area(area, height, width, modulo):
+        """
+        将区域的宽高向上对齐到modulo的整数倍，优先向下、向右扩展，到达边界后向上、向左扩展，帧本身不足时由推理前的填充补齐
+        """
+        ymin, ymax, xmin, xmax = area
+        ymax = min(height, ymin + ceil_modulo(ymax - ymin, modulo))
+        ymin = max(0, ymax - ceil_modulo(ymax - ymin, modulo))
+        xmax = min(width, xmin + ceil_modulo(xmax - xmin, modulo))
+        xmin = max(0, xmax - ceil_modulo(xmax - xmin, modulo))
+        return ymin, ymax, xmin, xmax
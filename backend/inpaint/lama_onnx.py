@@ -0,0 +1,181 @@
+"""
+big-lama的ONNX导出、int8动态量化与ONNX Runtime推理
+导出的模型高、宽(及批次)为动态维度，fp32与int8两种模型缓存在LAMA_MODEL_PATH目录下，big-lama.pt更新后自动重新导出
+"""
+import os
+import sys
+
+import numpy as np
+import onnxruntime as ort
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from backend import config
+
+TORCH_MODEL_PATH = os.path.join(config.LAMA_MODEL_PATH, 'big-lama.pt')
+# 导出依赖torch.onnx.export的dynamo=True与torch._export.converter.TS2EPConverter
+MIN_TORCH_VERSION = '2.6'
+ONNX_MODEL_PATHS = {'fp32': os.path.join(config.LAMA_MODEL_PATH, 'big-lama.onnx'),
+                    'int8': os.path.join(config.LAMA_MODEL_PATH, 'big-lama.int8.onnx')}
+
+
+def is_export_outdated(precision, model_path=TORCH_MODEL_PATH):
+    """
+    ONNX模型不存在或早于big-lama.pt时需要重新导出
+    """
+    onnx_path = ONNX_MODEL_PATHS[precision]
+    return not os.path.exists(onnx_path) or os.path.getmtime(onnx_path) < os.path.getmtime(model_path)
+
+
+def make_sample_inputs(batch=2, height=256, width=256):
+    """
+    导出与校验用的样例输入，批次大于1且高宽不同，避免这些维度在导出时被固定为常量
+    """
+    image = torch.rand(batch, 3, height, width)
+    mask = torch.zeros(batch, 1, height, width)
+    mask[:, :, height * 3 // 8:height * 5 // 8, width // 4:width * 3 // 4] = 1
+    return image, mask
+
+
+def export_onnx(model_path=TORCH_MODEL_PATH, onnx_path=ONNX_MODEL_PATHS['fp32']):
+    """
+    将TorchScript格式的big-lama导出为fp32的ONNX模型
+    """
+    model = torch.jit.load(model_path, map_location='cpu')
+    model.eval()
+    return export_module(model, onnx_path)
+
+
+def export_module(model, onnx_path, atol=1e-3):
+    """
+    导出TorchScript模型：TorchScript导出器没有fft_rfftn/fft_irfftn的转换规则，因此先将模型转换为ExportedProgram，
+    再由dynamo导出器将FFC中的傅里叶变换转换为DFT算子。导出后在另一尺寸的输入上与torch的输出比较，超出atol时删除导出结果并抛出异常
+    """
+    try:
+        # TS2EPConverter是torch的私有接口，不同版本间可能变化或移除
+        from torch._export.converter import TS2EPConverter
+    except ImportError as e:
+        raise RuntimeError(f'LaMa ONNX export requires torch>={MIN_TORCH_VERSION} with '
+                           f'torch._export.converter.TS2EPConverter, found torch {torch.__version__}') from e
+    image, mask = make_sample_inputs()
+    with torch.no_grad():
+        exported_program = TS2EPConverter(model, (image, mask)).convert()
+        torch.onnx.export(exported_program, (image, mask), onnx_path, dynamo=True,
+                          input_names=['image', 'mask'], output_names=['inpainted'])
+    try:
+        max_diff, _ = check_export(model, onnx_path)
+    except Exception:
+        os.remove(onnx_path)
+        raise
+    print(f'LaMa ONNX model exported to: {onnx_path}, max abs diff: {max_diff:.2e}')
+    if max_diff > atol:
+        os.remove(onnx_path)
+        raise RuntimeError(f'ONNX output differs from torch by {max_diff:.2e} (> {atol})')
+    return onnx_path
+
+
+def check_export(model, onnx_path, batch=1, height=200, width=328):
+    """
+    用与导出时不同的批次与尺寸比较ONNX Runtime与torch的输出，同时检查批次、高、宽是否为动态维度
+    :return (输出的最大绝对误差, mask内的PSNR(dB))
+    """
+    image, mask = make_sample_inputs(batch, height, width)
+    with torch.no_grad():
+        expected = model(image, mask).numpy()
+    actual = OnnxLamaModel(onnx_path, 'cpu', providers=['CPUExecutionProvider'])(image, mask).numpy()
+    inside = np.broadcast_to(mask.numpy() > 0, expected.shape)
+    return float(np.abs(actual - expected).max()), psnr(actual[inside] * 255, expected[inside] * 255)
+
+
+def quantize_onnx(onnx_path=ONNX_MODEL_PATHS['fp32'], int8_path=ONNX_MODEL_PATHS['int8'], model_path=TORCH_MODEL_PATH):
+    """
+    对fp32的ONNX模型做int8动态量化，并与TorchScript格式的big-lama比较
+    """
+    model = torch.jit.load(model_path, map_location='cpu')
+    model.eval()
+    return quantize_module(model, onnx_path, int8_path)
+
+
+def quantize_module(model, onnx_path, int8_path, min_psnr=None):
+    """
+    int8动态量化：权重离线量化，激活值在推理时按实际范围量化，不需要校准数据。
+    量化后mask内与torch输出的PSNR低于min_psnr时删除量化结果并抛出异常
+    :param min_psnr 为None时使用config.LAMA_ONNX_INT8_MIN_PSNR
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    if min_psnr is None:
+        min_psnr = config.LAMA_ONNX_INT8_MIN_PSNR
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+    try:
+        _, quality = check_export(model, int8_path)
+    except Exception:
+        os.remove(int8_path)
+        raise
+    print(f'LaMa int8 ONNX model saved to: {int8_path}, PSNR to torch inside mask: {quality:.2f}dB')
+    if quality < min_psnr:
+        os.remove(int8_path)
+        raise RuntimeError(f'int8 ONNX PSNR to torch inside mask is {quality:.2f}dB (< {min_psnr}dB)')
+    return int8_path
+
+
+def convert(precision='int8'):
+    """
+    按需导出fp32模型，precision为int8时再做量化
+    :return 对应精度的ONNX模型路径
+    """
+    if is_export_outdated('fp32'):
+        print('Exporting LaMa model to ONNX...')
+        export_onnx()
+    if precision == 'int8' and is_export_outdated('int8'):
+        print('Quantizing LaMa ONNX model to int8...')
+        quantize_onnx()
+    return ONNX_MODEL_PATHS[precision]
+
+
+class OnnxLamaModel:
+    """
+    使用ONNX Runtime运行的big-lama，与TorchScript模型的调用方式相同：输入输出均为torch张量
+    """
+
+    def __init__(self, onnx_path, device, providers=None, intra_op_threads=0, inter_op_threads=0):
+        """
+        :param device 输出张量所在的设备
+        :param providers ONNX Runtime的ExecutionProvider列表，为None时使用config.ONNX_PROVIDERS与CPU
+        :param intra_op_threads 单个算子内的线程数，0为ONNX Runtime默认值
+        :param inter_op_threads 算子间的线程数，0为ONNX Runtime默认值
+        """
+        self.device = device
+        if providers is None:
+            providers = config.ONNX_PROVIDERS + ['CPUExecutionProvider']
+        sess_options = ort.SessionOptions()
+        # 更高的优化级别下ONNX Runtime会为DFT算子复用形状不同的输出缓冲区而报错，只使用基础优化
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_BASIC
+        sess_options.intra_op_num_threads = intra_op_threads
+        sess_options.inter_op_num_threads = inter_op_threads
+        self.session = ort.InferenceSession(onnx_path, sess_options, providers=providers)
+
+    def __call__(self, image, mask):
+        output = self.session.run(None, {'image': image.detach().cpu().numpy().astype(np.float32),
+                                         'mask': mask.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(output).to(self.device)
+
+
+def load_onnx_model(precision, device):
+    """
+    按需导出ONNX模型后创建OnnxLamaModel
+    :param precision 'fp32'或'int8'
+    """
+    return OnnxLamaModel(convert(precision), device, intra_op_threads=config.LAMA_ONNX_INTRA_OP_THREADS,
+                         inter_op_threads=config.LAMA_ONNX_INTER_OP_THREADS)
+
+
+def psnr(a, b):
+    """
+    两组uint8图像的峰值信噪比(dB)
+    """
+    mse = np.mean((np.asarray(a, dtype=np.float64) - np.asarray(b, dtype=np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+if __name__ == '__main__':
+    convert('int8')
@@ -108,10 +108,22 @@ class InpaintGenerator(BaseNetwork):
         output = torch.tanh(output)
         return output
 
-    def infer(self, feat):
-        t, c, _, _ = feat.size()
+    def set_attention_backend(self, backend, chunk_size=1024):
+        """
+        Select the attention implementation of every transformer block, see Attention for the options
+        """
+        if backend not in Attention.BACKENDS:
+            raise ValueError(f'unknown attention backend {backend}, expected one of {Attention.BACKENDS}')
+        for module in self.modules():
+            if isinstance(module, Attention):
+                module.backend = backend
+                module.chunk_size = chunk_size
+
+    def infer(self, feat, b=1):
+        # feat: (b*t, c, h, w) encoder features of b independent clips, attention stays within each clip
+        _, c, _, _ = feat.size()
         enc_feat = self.transformer(
-            {'x': feat, 'b': 1, 'c': c})['x']
+            {'x': feat, 'b': b, 'c': c})['x']
         return enc_feat
 
 
@@ -135,15 +147,42 @@ class deconv(nn.Module):
 class Attention(nn.Module):
     """
     Compute 'Scaled Dot Product Attention
+
+    backend:
+        'math': materialize the full scores matrix (original implementation)
+        'sdpa': torch.nn.functional.scaled_dot_product_attention, falls back to 'chunked' before torch 2.0
+        'chunked': split the queries into chunks of chunk_size rows, peak memory grows linearly with the number of tokens
+    The memory-efficient backends do not return the attention map.
     """
+    BACKENDS = ('math', 'sdpa', 'chunked')
+
+    def __init__(self, backend='math', chunk_size=1024):
+        super().__init__()
+        self.backend = backend
+        self.chunk_size = chunk_size
 
     def forward(self, query, key, value):
+        if self.backend == 'sdpa' and hasattr(F, 'scaled_dot_product_attention'):
+            return F.scaled_dot_product_attention(query, key, value), None
+        if self.backend in ('sdpa', 'chunked'):
+            return self.chunked_attention(query, key, value), None
         scores = torch.matmul(query, key.transpose(-2, -1)
                               ) / math.sqrt(query.size(-1))
         p_attn = F.softmax(scores, dim=-1)
         p_val = torch.matmul(p_attn, value)
         return p_val, p_attn
 
+    def chunked_attention(self, query, key, value):
+        # every chunk still sees all keys, so the softmax is exact
+        key_t = key.transpose(-2, -1)
+        p_val = query.new_empty(*query.shape[:-1], value.size(-1))
+        for start in range(0, query.size(-2), self.chunk_size):
+            end = start + self.chunk_size
+            scores = torch.matmul(query[..., start:end, :], key_t) / math.sqrt(query.size(-1))
+            p_attn = F.softmax(scores, dim=-1)
+            p_val[..., start:end, :] = torch.matmul(p_attn, value)
+        return p_val
+
 
 class MultiHeadedAttention(nn.Module):
     """
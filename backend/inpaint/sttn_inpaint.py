@@ -1,10 +1,11 @@
 import copy
+import math
 import time
 
 import cv2
 import numpy as np
 import torch
-from torchvision import transforms
+import torch.nn.functional as F
 from typing import List
 import sys
 import os
@@ -12,13 +13,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from backend import config
 from backend.inpaint.sttn.auto_sttn import InpaintGenerator
-from backend.inpaint.utils.sttn_utils import Stack, ToTorchFormatTensor
-
-# 定义图像预处理方式
-_to_tensors = transforms.Compose([
-    Stack(),  # 将图像堆叠为序列
-    ToTorchFormatTensor()  # 将堆叠的图像转化为PyTorch张量
-])
+from backend.tools.mask_composite import MaskCompositor
+from backend.tools.pipeline_tools import PipelineExecutor
 
 
 class STTNInpaint:
@@ -30,6 +26,16 @@ class STTNInpaint:
         self.model.load_state_dict(torch.load(config.STTN_MODEL_PATH, map_location='cpu')['netG'])
         # 3. # 将模型设置为评估模式
         self.model.eval()
+        # 设置注意力的计算方式
+        self.model.set_attention_backend(config.STTN_ATTENTION_BACKEND, config.STTN_ATTENTION_CHUNK_SIZE)
+        # 使用ONNX Runtime推理时，以接口相同的OnnxInpaintGenerator替换模型
+        if config.STTN_BACKEND == 'onnx':
+            try:
+                from backend.inpaint.sttn_onnx import load_onnx_generator
+                self.model = load_onnx_generator(self.model.cpu(), self.device)
+            except Exception as e:
+                print(f'[Warning] failed to load STTN ONNX model, fall back to torch: {e}')
+                self.model.to(self.device)
         # 模型输入用的宽和高
         self.model_input_width, self.model_input_height = 640, 120
         # 2. 设置相连帧数
@@ -49,45 +55,29 @@ class STTNInpaint:
         # 确定去字幕的垂直高度部分
         split_h = int(W_ori * 3 / 16)
         inpaint_area = self.get_inpaint_area_by_mask(H_ori, split_h, mask)
-        # 初始化帧存储变量
-        # 高分辨率帧存储列表
-        frames_hr = copy.deepcopy(input_frames)
-        frames_scaled = {}  # 存放缩放后帧的字典
         comps = {}  # 存放补全后帧的字典
         # 存储最终的视频帧
         inpainted_frames = []
-        for k in range(len(inpaint_area)):
-            frames_scaled[k] = []  # 为每个去除部分初始化一个列表
-
-        # 读取并缩放帧
-        for j in range(len(frames_hr)):
-            image = frames_hr[j]
-            # 对每个去除部分进行切割和缩放
-            for k in range(len(inpaint_area)):
-                image_crop = image[inpaint_area[k][0]:inpaint_area[k][1], :, :]  # 切割
-                image_resize = cv2.resize(image_crop, (self.model_input_width, self.model_input_height))  # 缩放
-                frames_scaled[k].append(image_resize)  # 将缩放后的帧添加到对应列表
+        # 切割、缩放修复区域并转换为模型输入张量
+        feats = self.preprocess_strips(input_frames, inpaint_area)
 
         # 处理每一个去除部分
-        for k in range(len(inpaint_area)):
-            # 调用inpaint函数进行处理
-            comps[k] = self.inpaint(frames_scaled[k])
+        for k, comp_frames in enumerate(self.inpaint_strips(feats)):
+            comps[k] = comp_frames
 
         # 如果存在去除部分
         if inpaint_area:
-            for j in range(len(frames_hr)):
-                frame = frames_hr[j]  # 取出原始帧
+            compositor = MaskCompositor(mask)
+            for j in range(len(input_frames)):
+                # 复制原始帧后再合成，调用方仍需使用未修改的原始帧(如预览)
+                frame = input_frames[j].copy()
                 # 对于模式中的每一个段落
                 for k in range(len(inpaint_area)):
-                    comp = cv2.resize(comps[k][j], (W_ori, split_h))  # 将补全帧缩放回原大小
-                    comp = cv2.cvtColor(np.array(comp).astype(np.uint8), cv2.COLOR_BGR2RGB)  # 转换颜色空间
-                    # 获取遮罩区域并进行图像合成
-                    mask_area = mask[inpaint_area[k][0]:inpaint_area[k][1], :]  # 取出遮罩区域
-                    # 实现遮罩区域内的图像融合
-                    frame[inpaint_area[k][0]:inpaint_area[k][1], :, :] = mask_area * comp + (1 - mask_area) * frame[inpaint_area[k][0]:inpaint_area[k][1], :, :]
+                    # 将补全帧缩放回原大小并转换颜色空间，只合成遮罩区域内的像素
+                    compositor.composite(frame, comps[k][j], inpaint_area[k], rgb=True)
                 # 将最终帧添加到列表
                 inpainted_frames.append(frame)
-                print(f'processing frame, {len(frames_hr) - j} left')
+                print(f'processing frame, {len(input_frames) - j} left')
         return inpainted_frames
 
     @staticmethod
@@ -113,61 +103,127 @@ class STTNInpaint:
         # 返回参考帧索引列表
         return ref_index
 
+    def preprocess_strips(self, frames: List[np.ndarray], inpaint_area):
+        """
+        将各修复区域从原始帧中切出并堆叠为uint8数组，再通过torch.from_numpy转为张量，
+        BGR转RGB、缩放与归一化都在模型所在设备上批量完成
+        :param frames: 原视频帧
+        :param inpaint_area: 修复区域 (ymin, ymax, xmin, xmax) 的列表
+        :return: 形状为 (区域数, 帧数, 3, 模型输入高, 模型输入宽) 的张量，取值范围为[-1, 1]
+        """
+        if not inpaint_area:
+            return torch.empty(0, len(frames), 3, self.model_input_height, self.model_input_width, device=self.device)
+        feats = []
+        for ymin, ymax, xmin, xmax in inpaint_area:
+            # 只复制修复区域内的像素，转换为张量时与该数组共享内存
+            crops = torch.from_numpy(np.stack([frame[ymin:ymax, xmin:xmax] for frame in frames])).to(self.device)
+            # (帧数, 高, 宽, BGR) -> (帧数, RGB, 高, 宽)
+            crops = crops.permute(0, 3, 1, 2).flip(1).float()
+            # 与cv2.resize的INTER_LINEAR一致，使用像素中心对齐的双线性插值
+            feats.append(F.interpolate(crops, size=(self.model_input_height, self.model_input_width),
+                                       mode='bilinear', align_corners=False))
+        return torch.stack(feats) / 127.5 - 1
+
     def inpaint(self, frames: List[np.ndarray]):
         """
         使用STTN完成空洞填充（空洞即被遮罩的区域）
         """
-        frame_length = len(frames)
-        # 对帧进行预处理转换为张量，并进行归一化
-        feats = _to_tensors(frames).unsqueeze(0) * 2 - 1
-        # 把特征张量转移到指定的设备（CPU或GPU）
-        feats = feats.to(self.device)
-        # 初始化一个与视频长度相同的列表，用于存储处理完成的帧
-        comp_frames = [None] * frame_length
+        return self.inpaint_batch([frames])[0]
+
+    def inpaint_strips(self, feats: torch.Tensor):
+        """
+        对多个修复区域进行填充，开启STTN_BATCH_STRIPS时所有区域作为一个批次推理，否则逐个区域推理
+        :param feats: preprocess_strips得到的模型输入张量
+        :return: 每个修复区域补全后的帧列表
+        """
+        return self.complete_strips(self.encode(feats))
+
+    def complete_strips(self, enc_feats: torch.Tensor):
+        """
+        与inpaint_strips相同，输入为encode得到的编码特征
+        """
+        if config.STTN_BATCH_STRIPS:
+            return self.complete(enc_feats)
+        return [self.complete(enc_feats[k:k + 1])[0] for k in range(enc_feats.size(0))]
+
+    def inpaint_batch(self, strip_frames: List[List[np.ndarray]]):
+        """
+        批量完成多个修复区域的空洞填充，输入为已缩放到模型输入尺寸的BGR帧
+        :param strip_frames: 每个修复区域缩放后的帧列表，各区域的帧数相同
+        :return: 每个修复区域补全后的帧列表
+        """
+        if len(strip_frames) == 0:
+            return []
+        # 每个区域的帧整体作为一个修复区域，与inpaint_strips使用相同的预处理，形状为 (区域数, 帧数, 3, 高, 宽)
+        feats = torch.cat([self.preprocess_strips(frames, [(0, frames[0].shape[0], 0, frames[0].shape[1])])
+                           for frames in strip_frames])
+        return self.inpaint_tensor(feats)
+
+    def inpaint_tensor(self, feats: torch.Tensor):
+        """
+        批量完成多个修复区域的空洞填充，各区域共享模型输入尺寸，编码、Transformer推理与解码都只需执行一次
+        :param feats: 形状为 (区域数, 帧数, 3, 高, 宽)、取值范围为[-1, 1]的RGB张量
+        :return: 每个修复区域补全后的帧列表
+        """
+        return self.complete(self.encode(feats))
+
+    def encode(self, feats: torch.Tensor):
+        """
+        将模型输入张量通过编码器，各帧的编码相互独立，可以分段编码后再拼接
+        :param feats: 形状为 (区域数, 帧数, 3, 高, 宽)、取值范围为[-1, 1]的RGB张量
+        :return: 形状为 (区域数, 帧数, 通道数, 特征高, 特征宽) 的编码特征
+        """
+        strip_count, frame_length = feats.shape[:2]
+        if strip_count * frame_length == 0:
+            return feats
         # 关闭梯度计算，用于推理阶段节省内存并加速
         with torch.no_grad():
             # 将处理好的帧通过编码器，产生特征表示
-            feats = self.model.encoder(feats.view(frame_length, 3, self.model_input_height, self.model_input_width))
-            # 获取特征维度信息
-            _, c, feat_h, feat_w = feats.size()
-            # 调整特征形状以匹配模型的期望输入
-            feats = feats.view(1, frame_length, c, feat_h, feat_w)
-        # 获取重绘区域
+            enc_feats = self.model.encoder(feats.reshape(strip_count * frame_length, 3, self.model_input_height, self.model_input_width))
+        # 调整特征形状以匹配模型的期望输入
+        return enc_feats.view(strip_count, frame_length, *enc_feats.shape[1:])
+
+    def complete(self, feats: torch.Tensor):
+        """
+        根据编码特征完成空洞填充
+        :param feats: encode得到的编码特征
+        :return: 每个修复区域补全后的帧列表
+        """
+        strip_count, frame_length, c, feat_h, feat_w = feats.shape
+        if strip_count == 0:
+            return []
+        # 在设备上累加每个区域补全后的帧
+        accumulator = CompletionAccumulator(strip_count, frame_length, self.model_input_height, self.model_input_width, self.device)
         # 在设定的邻居帧步幅内循环处理视频
         for f in range(0, frame_length, self.neighbor_stride):
             # 计算邻近帧的ID
-            neighbor_ids = [i for i in range(max(0, f - self.neighbor_stride), min(frame_length, f + self.neighbor_stride + 1))]
+            neighbor_start, neighbor_end = max(0, f - self.neighbor_stride), min(frame_length, f + self.neighbor_stride + 1)
+            neighbor_ids = list(range(neighbor_start, neighbor_end))
             # 获取参考帧的索引
             ref_ids = self.get_ref_index(neighbor_ids, frame_length)
-            # 同样关闭梯度计算
+            input_ids = neighbor_ids + ref_ids
             with torch.no_grad():
-                # 通过模型推断特征并传递给解码器以生成完成的帧
-                pred_feat = self.model.infer(feats[0, neighbor_ids + ref_ids, :, :, :])
-                # 将预测的特征通过解码器生成图片，并应用激活函数tanh，然后分离出张量
-                pred_img = torch.tanh(self.model.decoder(pred_feat[:len(neighbor_ids), :, :, :])).detach()
-                # 将结果张量重新缩放到0到255的范围内（图像像素值）
-                pred_img = (pred_img + 1) / 2
-                # 将张量移动回CPU并转为NumPy数组
-                pred_img = pred_img.cpu().permute(0, 2, 3, 1).numpy() * 255
-                # 遍历邻近帧
-                for i in range(len(neighbor_ids)):
-                    idx = neighbor_ids[i]
-                    # 将预测的图片转换为无符号8位整数格式
-                    img = np.array(pred_img[i]).astype(np.uint8)
-                    if comp_frames[idx] is None:
-                        # 如果该位置为空，则赋值为新计算出的图片
-                        comp_frames[idx] = img
-                    else:
-                        # 如果此位置之前已有图片，则将新旧图片混合以提高质量
-                        comp_frames[idx] = comp_frames[idx].astype(np.float32) * 0.5 + img.astype(np.float32) * 0.5
+                # 各区域的特征按区域依次排列，区域之间不做注意力计算
+                pred_feat = self.model.infer(feats[:, input_ids].reshape(strip_count * len(input_ids), c, feat_h, feat_w), strip_count)
+                # 只解码邻近帧
+                pred_feat = pred_feat.view(strip_count, len(input_ids), c, feat_h, feat_w)[:, :len(neighbor_ids)]
+                pred_img = torch.tanh(self.model.decoder(pred_feat.reshape(strip_count * len(neighbor_ids), c, feat_h, feat_w)))
+                accumulator.add(neighbor_start, pred_img.view(strip_count, len(neighbor_ids), *pred_img.shape[1:]))
         # 返回处理完成的帧序列
-        return comp_frames
+        return accumulator.result()
 
     @staticmethod
     def get_inpaint_area_by_mask(H, h, mask):
         """
         获取字幕去除区域，根据mask来确定需要填补的区域和高度
+        开启STTN_NARROW_STRIPS时，再在每个区域内选取包含遮罩且宽高比与模型输入一致的最小窗口，
+        窄小的遮罩(如居中的字幕、角落的台标)可以接近原分辨率送入模型
+        :return: 修复区域 (ymin, ymax, xmin, xmax) 的列表
         """
+        mask = mask.reshape(mask.shape[0], mask.shape[1])
+        W = mask.shape[1]
+        # 每一行遮罩像素的数量，避免每个段落重复扫描整块mask
+        row_counts = np.count_nonzero(mask, axis=1)
         # 存储绘画区域的列表
         inpaint_area = []
         # 从视频底部的字幕位置开始，假设字幕通常位于底部
@@ -182,25 +238,47 @@ class STTNInpaint:
                 # 确定段的上边界
                 from_H = to_H - h
             # 检查当前段落是否包含遮罩像素
-            if not np.all(mask[from_H:to_H, :] == 0) and np.sum(mask[from_H:to_H, :]) > 10:
+            if row_counts[from_H:to_H].sum() > 10:
                 # 如果不是第一个段落，向下移动以确保没遗漏遮罩区域
                 if to_H != H:
                     move = 0
-                    while to_H + move < H and not np.all(mask[to_H + move, :] == 0):
+                    while to_H + move < H and row_counts[to_H + move] > 0:
                         move += 1
                     # 确保没有越过底部
                     if to_H + move < H and move < h:
                         to_H += move
                         from_H += move
                 # 将该段落添加到列表中
-                if (from_H, to_H) not in inpaint_area:
-                    inpaint_area.append((from_H, to_H))
+                if (from_H, to_H, 0, W) not in inpaint_area:
+                    inpaint_area.append((from_H, to_H, 0, W))
                 else:
                     break
             # 移动到下一个段落
             to_H -= h
+        if config.STTN_NARROW_STRIPS:
+            inpaint_area = [STTNInpaint.get_narrow_area(mask, from_H, to_H) for from_H, to_H, _, _ in inpaint_area]
         return inpaint_area  # 返回绘画区域列表
 
+    @staticmethod
+    def get_narrow_area(mask, from_H, to_H, model_width=640, model_height=120):
+        """
+        在[from_H, to_H)的行范围内，选取包含全部遮罩像素、宽高比与模型输入一致的最小窗口，窗口不小于模型输入尺寸
+        :return: (ymin, ymax, xmin, xmax)
+        """
+        W = mask.shape[1]
+        band = mask[from_H:to_H] != 0
+        rows = np.flatnonzero(band.any(axis=1))
+        cols = np.flatnonzero(band.any(axis=0))
+        ymin, ymax = from_H + int(rows[0]), from_H + int(rows[-1]) + 1
+        xmin, xmax = int(cols[0]), int(cols[-1]) + 1
+        aspect = model_width / model_height
+        width = min(W, max(xmax - xmin, math.ceil((ymax - ymin) * aspect), model_width))
+        height = min(to_H - from_H, max(ymax - ymin, round(width / aspect)))
+        # 窗口以遮罩为中心，并限制在帧与段落的范围内
+        x0 = min(max(0, (xmin + xmax - width) // 2), W - width)
+        y0 = min(max(from_H, (ymin + ymax - height) // 2), to_H - height)
+        return y0, y0 + height, x0, x0 + width
+
     @staticmethod
     def get_inpaint_area_by_selection(input_sub_area, mask):
         print('use selection area for inpainting')
@@ -211,15 +289,44 @@ class STTNInpaint:
         inpaint_area = []
         # 计算并存储标准区间
         for i in range(ymin, ymax, interval_size):
-            inpaint_area.append((i, i + interval_size))
+            inpaint_area.append((i, i + interval_size, 0, width))
         # 检查最后一个区间是否达到了最大值
         if inpaint_area[-1][1] != ymax:
             # 如果没有，则创建一个新的区间，开始于最后一个区间的结束，结束于扩大后的值
             if inpaint_area[-1][1] + interval_size <= height:
-                inpaint_area.append((inpaint_area[-1][1], inpaint_area[-1][1] + interval_size))
+                inpaint_area.append((inpaint_area[-1][1], inpaint_area[-1][1] + interval_size, 0, width))
         return inpaint_area  # 返回绘画区域列表
 
 
+class CompletionAccumulator:
+    """
+    在模型所在设备上累加STTN各邻近帧窗口的补全结果，重叠的帧取所有窗口结果的平均值，最后一次性拷贝回主机
+    """
+
+    def __init__(self, strip_count, frame_length, height, width, device):
+        # 补全结果之和，取值范围与模型输出一致为[-1, 1]
+        self.comp_sum = torch.zeros(strip_count, frame_length, 3, height, width, device=device)
+        # 每一帧被累加的次数
+        self.weight = torch.zeros(frame_length, device=device)
+
+    def add(self, start, pred_img: torch.Tensor):
+        """
+        :param start: 窗口内第一帧的索引
+        :param pred_img: 形状为 (区域数, 窗口帧数, 3, 高, 宽) 的模型输出
+        """
+        end = start + pred_img.size(1)
+        self.comp_sum[:, start:end] += pred_img
+        self.weight[start:end] += 1
+
+    def result(self):
+        """
+        :return: 每个修复区域补全后的帧列表，帧为 (高, 宽, 3) 的uint8数组
+        """
+        comp = (self.comp_sum / self.weight.clamp(min=1).view(1, -1, 1, 1, 1) + 1) * 127.5
+        comp = comp.clamp(0, 255).to(torch.uint8).permute(0, 1, 3, 4, 2).contiguous().cpu().numpy()
+        return [list(strip_comp) for strip_comp in comp]
+
+
 class STTNVideoInpaint:
 
     def read_frame_info_from_video(self):
@@ -235,7 +342,7 @@ class STTNVideoInpaint:
         # 返回视频读取对象、帧信息和视频写入对象
         return reader, frame_info
 
-    def __init__(self, video_path, mask_path=None, clip_gap=None):
+    def __init__(self, video_path, mask_path=None, clip_gap=None, clip_overlap=None):
         # STTNInpaint视频修复实例初始化
         self.sttn_inpaint = STTNInpaint()
         # 视频和掩码路径
@@ -251,6 +358,10 @@ class STTNVideoInpaint:
             self.clip_gap = config.STTN_MAX_LOAD_NUM
         else:
             self.clip_gap = clip_gap
+        # 相邻片段重叠的帧数，不能超过片段长度
+        if clip_overlap is None:
+            clip_overlap = config.STTN_CLIP_OVERLAP
+        self.clip_overlap = max(0, min(clip_overlap, self.clip_gap - 1))
 
     def __call__(self, input_mask=None, input_sub_remover=None, tbar=None):
         reader = None
@@ -264,8 +375,6 @@ class STTNVideoInpaint:
                 # 创建视频写入对象，用于输出修复后的视频
                 writer = cv2.VideoWriter(self.video_out_path, cv2.VideoWriter_fourcc(*"mp4v"), frame_info['fps'], (frame_info['W_ori'], frame_info['H_ori']))
             
-            # 计算需要迭代修复视频的次数
-            rec_time = frame_info['len'] // self.clip_gap if frame_info['len'] % self.clip_gap == 0 else frame_info['len'] // self.clip_gap + 1
             # 计算分割高度，用于确定修复区域的大小
             split_h = int(frame_info['W_ori'] * 3 / 16)
             
@@ -278,75 +387,98 @@ class STTNVideoInpaint:
                 
             # 得到修复区域位置
             inpaint_area = self.sttn_inpaint.get_inpaint_area_by_mask(frame_info['H_ori'], split_h, mask)
+            compositor = MaskCompositor(mask)
             
-            # 遍历每一次的迭代次数
-            for i in range(rec_time):
-                start_f = i * self.clip_gap  # 起始帧位置
-                end_f = min((i + 1) * self.clip_gap, frame_info['len'])  # 结束帧位置
-                print('Processing:', start_f + 1, '-', end_f, ' / Total:', frame_info['len'])
-                
-                frames_hr = []  # 高分辨率帧列表
-                frames = {}  # 帧字典，用于存储裁剪后的图像
-                comps = {}  # 组合字典，用于存储修复后的图像
-                
-                # 初始化帧字典
-                for k in range(len(inpaint_area)):
-                    frames[k] = []
-                    
-                # 读取和修复高分辨率帧
-                valid_frames_count = 0
-                for j in range(start_f, end_f):
-                    success, image = reader.read()
-                    if not success:
-                        print(f"Warning: Failed to read frame {j}.")
-                        break
-                    
-                    frames_hr.append(image)
-                    valid_frames_count += 1
-                    
-                    for k in range(len(inpaint_area)):
-                        # 裁剪、缩放并添加到帧字典
-                        image_crop = image[inpaint_area[k][0]:inpaint_area[k][1], :, :]
-                        image_resize = cv2.resize(image_crop, (self.sttn_inpaint.model_input_width, self.sttn_inpaint.model_input_height))
-                        frames[k].append(image_resize)
-                
-                # 如果没有读取到有效帧，则跳过当前迭代
-                if valid_frames_count == 0:
-                    print(f"Warning: No valid frames found in range {start_f+1}-{end_f}. Skipping this segment.")
-                    continue
-                    
-                # 对每个修复区域运行修复
-                for k in range(len(inpaint_area)):
-                    if len(frames[k]) > 0:  # 确保有帧可以处理
-                        comps[k] = self.sttn_inpaint.inpaint(frames[k])
+            def read_clips():
+                """
+                按clip_gap读取视频片段，相邻片段重叠clip_overlap帧，返回 (与上一片段重叠的帧数, 片段内的视频帧)
+                """
+                overlap_frames = []
+                start_f = 0  # 片段中新读取的第一帧位置
+                while start_f < frame_info['len']:
+                    end_f = min(start_f + self.clip_gap - len(overlap_frames), frame_info['len'])  # 结束帧位置
+                    print('Processing:', start_f + 1 - len(overlap_frames), '-', end_f, ' / Total:', frame_info['len'])
+                    frames_hr = []  # 高分辨率帧列表
+                    # 读取高分辨率帧
+                    for j in range(start_f, end_f):
+                        success, image = reader.read()
+                        if not success:
+                            print(f"Warning: Failed to read frame {j}.")
+                            break
+                        frames_hr.append(image)
+                    # 如果没有读取到有效帧，则跳过当前迭代
+                    if len(frames_hr) == 0:
+                        print(f"Warning: No valid frames found in range {start_f+1}-{end_f}. Skipping this segment.")
                     else:
-                        comps[k] = []
-                
-                # 如果有要修复的区域
-                if inpaint_area and valid_frames_count > 0:
-                    for j in range(valid_frames_count):
-                        if input_sub_remover is not None and input_sub_remover.gui_mode:
-                            original_frame = copy.deepcopy(frames_hr[j])
-                        else:
-                            original_frame = None
-                            
-                        frame = frames_hr[j]
-                        
-                        for k in range(len(inpaint_area)):
-                            if j < len(comps[k]):  # 确保索引有效
-                                # 将修复的图像重新扩展到原始分辨率，并融合到原始帧
-                                comp = cv2.resize(comps[k][j], (frame_info['W_ori'], split_h))
-                                comp = cv2.cvtColor(np.array(comp).astype(np.uint8), cv2.COLOR_BGR2RGB)
-                                mask_area = mask[inpaint_area[k][0]:inpaint_area[k][1], :]
-                                frame[inpaint_area[k][0]:inpaint_area[k][1], :, :] = mask_area * comp + (1 - mask_area) * frame[inpaint_area[k][0]:inpaint_area[k][1], :, :]
-                        
-                        writer.write(frame)
-                        
-                        if input_sub_remover is not None:
-                            if tbar is not None:
-                                input_sub_remover.update_progress(tbar, increment=1)
-                            if original_frame is not None and input_sub_remover.gui_mode:
-                                input_sub_remover.preview_frame = cv2.hconcat([original_frame, frame])
+                        frames_hr = overlap_frames + frames_hr
+                        yield len(overlap_frames), frames_hr
+                        overlap_frames = frames_hr[max(0, len(frames_hr) - self.clip_overlap):]
+                    start_f = end_f
+
+            # 上一片段最后clip_overlap帧的编码特征
+            overlap_feats = None
+
+            def inpaint_clip(task):
+                nonlocal overlap_feats
+                reuse, frames_hr = task
+                if not inpaint_area:
+                    return reuse, frames_hr, []
+                # 裁剪、缩放修复区域后编码，与上一片段重叠的帧直接复用已有的编码特征
+                enc_feats = self.sttn_inpaint.encode(self.sttn_inpaint.preprocess_strips(frames_hr[reuse:], inpaint_area))
+                if reuse > 0:
+                    enc_feats = torch.cat([overlap_feats, enc_feats], dim=1)
+                overlap_feats = enc_feats[:, max(0, len(frames_hr) - self.clip_overlap):]
+                # 对所有修复区域运行修复
+                return reuse, frames_hr, self.sttn_inpaint.complete_strips(enc_feats)
+
+            def write_frames(frames_hr, comps):
+                for j in range(len(frames_hr)):
+                    if input_sub_remover is not None and input_sub_remover.gui_mode:
+                        original_frame = copy.deepcopy(frames_hr[j])
+                    else:
+                        original_frame = None
+
+                    frame = frames_hr[j]
+
+                    for k in range(len(inpaint_area)):
+                        if j < len(comps[k]):  # 确保索引有效
+                            # 将修复的图像重新扩展到原始分辨率，只将遮罩区域内的像素融合到原始帧
+                            compositor.composite(frame, comps[k][j], inpaint_area[k], rgb=True)
+
+                    writer.write(frame)
+
+                    if input_sub_remover is not None:
+                        if tbar is not None:
+                            input_sub_remover.update_progress(tbar, increment=1)
+                        if original_frame is not None and input_sub_remover.gui_mode:
+                            input_sub_remover.preview_frame = cv2.hconcat([original_frame, frame])
+
+            # 上一片段中等待与下一片段混合后再写入的帧及其补全结果
+            pending_frames, pending_comps = [], []
+
+            def write_clip(result):
+                nonlocal pending_frames, pending_comps
+                reuse, frames_hr, comps = result
+                # 如果没有要修复的区域
+                if not inpaint_area:
+                    return
+                # 重叠帧在前后两个片段中各有一个补全结果，按位置线性过渡混合，避免片段交界处出现跳变
+                for j in range(reuse):
+                    weight = (j + 1) / (reuse + 1)
+                    for k in range(len(inpaint_area)):
+                        comps[k][j] = (pending_comps[k][j].astype(np.float32) * (1 - weight) + comps[k][j].astype(np.float32) * weight).astype(np.uint8)
+                # 最后clip_overlap帧留到与下一片段混合后再写入
+                write_count = len(frames_hr) - min(self.clip_overlap, len(frames_hr))
+                write_frames(frames_hr[:write_count], [strip_comps[:write_count] for strip_comps in comps])
+                pending_frames, pending_comps = frames_hr[write_count:], [strip_comps[write_count:] for strip_comps in comps]
+
+            # 读取、修复与写入三个阶段并行进行
+            pipeline = PipelineExecutor(config.INPAINT_PIPELINE_QUEUE_SIZE)
+            pipeline.run(read_clips(), inpaint_clip, write_clip)
+            pipeline.print_stats()
+            # 写入最后一个片段保留的帧
+            if inpaint_area:
+                write_frames(pending_frames, pending_comps)
         except Exception as e:
             print(f"Error during video processing: {str(e)}")
             # 不抛出异常，允许程序继续执行
@@ -0,0 +1,174 @@
+"""
+STTN生成器的ONNX导出与ONNX Runtime推理
+编码器、Transformer与解码器分别导出为三个ONNX模型，帧数(及修复区域数)为动态维度，
+导出结果缓存在STTN_MODEL_PATH所在目录的onnx文件夹下，模型权重更新后自动重新导出
+"""
+import os
+import sys
+
+import numpy as np
+import onnxruntime as ort
+import torch
+import torch.nn as nn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from backend import config
+from backend.inpaint.sttn.auto_sttn import Attention
+
+ONNX_DIR = os.path.join(os.path.dirname(config.STTN_MODEL_PATH), 'onnx')
+PARTS = ('encoder', 'transformer', 'decoder')
+
+
+class TransformerWrapper(nn.Module):
+    """
+    将InpaintGenerator.infer包装为输入 (区域数, 帧数, 通道数, 高, 宽) 的模块，区域数由输入形状决定，导出后为动态维度
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, feats):
+        b, t, c, h, w = feats.shape
+        return self.model.infer(feats.reshape(b * t, c, h, w), b).view(b, t, c, h, w)
+
+
+def get_onnx_paths(onnx_dir=ONNX_DIR):
+    return {part: os.path.join(onnx_dir, f'sttn_{part}.onnx') for part in PARTS}
+
+
+def is_export_outdated(model_path=config.STTN_MODEL_PATH, onnx_dir=ONNX_DIR):
+    """
+    ONNX模型不存在或早于模型权重文件时需要重新导出
+    """
+    model_mtime = os.path.getmtime(model_path)
+    return any(not os.path.exists(path) or os.path.getmtime(path) < model_mtime for path in get_onnx_paths(onnx_dir).values())
+
+
+def remove_onnx_files(onnx_dir=ONNX_DIR):
+    for path in get_onnx_paths(onnx_dir).values():
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def export_onnx(model, onnx_dir=ONNX_DIR, input_height=120, input_width=640, opset_version=17, atol=1e-3):
+    """
+    导出STTN生成器的编码器、Transformer与解码器，固定使用TorchScript导出器(新版torch默认的dynamo导出器会在opset 17的模型中生成opset 18的Split)
+    导出后与torch的输出比较，超出atol或ONNX Runtime无法载入时删除导出结果并抛出异常
+    :param model 已载入权重的InpaintGenerator
+    """
+    os.makedirs(onnx_dir, exist_ok=True)
+    paths = get_onnx_paths(onnx_dir)
+    # 分块或SDPA注意力中含有与输入尺寸相关的Python控制流，导出时使用原始实现
+    attentions = [(module, module.backend, module.chunk_size) for module in model.modules() if isinstance(module, Attention)]
+    model.set_attention_backend('math')
+    model.eval()
+    try:
+        with torch.no_grad():
+            frames = torch.randn(2, 3, input_height, input_width)
+            feats = model.encoder(frames)
+            torch.onnx.export(model.encoder, frames, paths['encoder'], opset_version=opset_version, dynamo=False,
+                              input_names=['frames'], output_names=['feats'],
+                              dynamic_axes={'frames': {0: 'frame_count'}, 'feats': {0: 'frame_count'}})
+            feats = feats.unsqueeze(0).repeat(2, 1, 1, 1, 1)
+            torch.onnx.export(TransformerWrapper(model), feats, paths['transformer'], opset_version=opset_version, dynamo=False,
+                              input_names=['feats'], output_names=['pred_feats'],
+                              dynamic_axes={'feats': {0: 'strip_count', 1: 'frame_count'},
+                                            'pred_feats': {0: 'strip_count', 1: 'frame_count'}})
+            torch.onnx.export(model.decoder, feats[0], paths['decoder'], opset_version=opset_version, dynamo=False,
+                              input_names=['feats'], output_names=['frames'],
+                              dynamic_axes={'feats': {0: 'frame_count'}, 'frames': {0: 'frame_count'}})
+        max_diff = check_export(model, onnx_dir, input_height, input_width)
+    except Exception:
+        remove_onnx_files(onnx_dir)
+        raise
+    finally:
+        for module, backend, chunk_size in attentions:
+            module.backend, module.chunk_size = backend, chunk_size
+    print(f'STTN ONNX models exported to: {onnx_dir}, max abs diff: {max_diff:.2e}')
+    if max_diff > atol:
+        remove_onnx_files(onnx_dir)
+        raise RuntimeError(f'ONNX output differs from torch by {max_diff:.2e} (> {atol})')
+    return paths
+
+
+def check_export(model, onnx_dir=ONNX_DIR, input_height=120, input_width=640, shapes=((1, 3), (2, 5))):
+    """
+    在与导出时不同的 (区域数, 帧数) 上分别比较编码器、Transformer与解码器在ONNX Runtime与torch中的输出，同时检查动态维度
+    :return 三个模型输出的最大绝对误差
+    """
+    onnx_generator = OnnxInpaintGenerator('cpu', onnx_dir, providers=['CPUExecutionProvider'])
+    max_diff = 0.0
+    for strip_count, frame_count in shapes:
+        frames = torch.rand(strip_count * frame_count, 3, input_height, input_width) * 2 - 1
+        with torch.no_grad():
+            feats = model.encoder(frames)
+            pred_feats = model.infer(feats, strip_count)
+            outputs = [(feats, onnx_generator.encoder(frames)),
+                       (pred_feats, onnx_generator.infer(feats, strip_count)),
+                       (model.decoder(pred_feats), onnx_generator.decoder(pred_feats))]
+        for expected, actual in outputs:
+            max_diff = max(max_diff, float((actual - expected).abs().max()))
+    return max_diff
+
+
+class OnnxInpaintGenerator:
+    """
+    使用ONNX Runtime运行的STTN生成器，提供与InpaintGenerator相同的encoder、infer与decoder接口，输入输出均为torch张量
+    """
+
+    def __init__(self, device, onnx_dir=ONNX_DIR, providers=None, intra_op_threads=0, inter_op_threads=0):
+        """
+        :param device 输出张量所在的设备，与STTNInpaint中其它张量保持一致
+        :param providers ONNX Runtime的ExecutionProvider列表，为None时使用config.ONNX_PROVIDERS与CPU
+        :param intra_op_threads 单个算子内的线程数，0为ONNX Runtime默认值
+        :param inter_op_threads 算子间的线程数，0为ONNX Runtime默认值
+        """
+        self.device = device
+        if providers is None:
+            providers = config.ONNX_PROVIDERS + ['CPUExecutionProvider']
+        sess_options = ort.SessionOptions()
+        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        sess_options.intra_op_num_threads = intra_op_threads
+        sess_options.inter_op_num_threads = inter_op_threads
+        self.sessions = {part: ort.InferenceSession(path, sess_options, providers=providers)
+                         for part, path in get_onnx_paths(onnx_dir).items()}
+
+    def run(self, part, tensor):
+        session = self.sessions[part]
+        output = session.run(None, {session.get_inputs()[0].name: tensor.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(output).to(self.device)
+
+    def encoder(self, frames):
+        return self.run('encoder', frames)
+
+    def infer(self, feat, b=1):
+        bt, c, h, w = feat.shape
+        return self.run('transformer', feat.reshape(b, bt // b, c, h, w)).view(bt, c, h, w)
+
+    def decoder(self, feats):
+        return self.run('decoder', feats)
+
+
+def load_onnx_generator(model, device):
+    """
+    按需导出ONNX模型后创建OnnxInpaintGenerator
+    :param model 已载入权重的InpaintGenerator
+    """
+    if is_export_outdated():
+        print('Exporting STTN model to ONNX...')
+        export_onnx(model)
+    try:
+        return OnnxInpaintGenerator(device, intra_op_threads=config.STTN_ONNX_INTRA_OP_THREADS,
+                                    inter_op_threads=config.STTN_ONNX_INTER_OP_THREADS)
+    except Exception:
+        # 缓存的ONNX模型无法载入时删除，下次运行时重新导出
+        remove_onnx_files()
+        raise
+
+
+if __name__ == '__main__':
+    from backend.inpaint.sttn.auto_sttn import InpaintGenerator
+    generator = InpaintGenerator()
+    generator.load_state_dict(torch.load(config.STTN_MODEL_PATH, map_location='cpu')['netG'])
+    export_onnx(generator)
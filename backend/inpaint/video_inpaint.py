@@ -14,6 +14,7 @@ from backend.inpaint.video.model.recurrent_flow_completion import RecurrentFlowC
 from backend.inpaint.video.model.propainter import InpaintGenerator
 from backend.inpaint.video.core.utils import to_tensors
 from backend.inpaint.video.model.misc import get_device
+from backend.tools.mask_composite import MaskCompositor
 
 import warnings
 
@@ -175,27 +176,31 @@ class VideoInpaint:
 
     def inpaint(self, frames, mask):
         if isinstance(frames[0], np.ndarray):
+            frames_bgr = frames
             frames = [Image.fromarray(cv2.cvtColor(f, cv2.COLOR_BGR2RGB)) for f in frames]
+        else:
+            frames_bgr = [cv2.cvtColor(np.array(f), cv2.COLOR_RGB2BGR) for f in frames]
         size = frames[0].size
         frames_len = len(frames)
         flow_masks, masks_dilated = read_mask(mask, frames_len, size,
                                               flow_mask_dilates=self.mask_dilation,
                                               mask_dilates=self.mask_dilation)
         w, h = size
-        # for saving the masked frames or video
-        masked_frame_for_save = []
-        for i in range(len(frames)):
-            mask_ = np.expand_dims(np.array(masks_dilated[i]), 2).repeat(3, axis=2) / 255.
-            img = np.array(frames[i])
-            green = np.zeros([h, w, 3])
-            green[:, :, 1] = 255
-            alpha = 0.6
-            # alpha = 1.0
-            fuse_img = (1 - alpha) * img + alpha * green
-            fuse_img = mask_ * fuse_img + (1 - mask_) * img
-            masked_frame_for_save.append(fuse_img.astype(np.uint8))
-
-        frames_inp = [np.array(f).astype(np.uint8) for f in frames]
+        # 每一帧的mask合成器，相同的mask共用一个
+        compositors = {}
+        for mask_dilated in masks_dilated:
+            if id(mask_dilated) not in compositors:
+                compositors[id(mask_dilated)] = MaskCompositor(np.array(mask_dilated))
+        frame_compositors = [compositors[id(mask_dilated)] for mask_dilated in masks_dilated]
+        bboxes = [compositor.bbox for compositor in compositors.values() if compositor.bbox is not None]
+        # mask为空时无需修复
+        if not bboxes:
+            return [frame.copy() for frame in frames_bgr]
+        # 所有mask的外接矩形，只有矩形内的补全结果需要拷贝回CPU并合成
+        bbox = (min(box[0] for box in bboxes), max(box[1] for box in bboxes),
+                min(box[2] for box in bboxes), max(box[3] for box in bboxes))
+        ymin, ymax, xmin, xmax = bbox
+
         frames = to_tensors()(frames).unsqueeze(0) * 2 - 1
         flow_masks = to_tensors()(flow_masks).unsqueeze(0)
         masks_dilated = to_tensors()(masks_dilated).unsqueeze(0)
@@ -303,7 +308,6 @@ class VideoInpaint:
                 updated_masks = updated_local_masks.view(b, t, 1, h, w)
                 torch.cuda.empty_cache()
 
-        ori_frames = frames_inp
         comp_frames = [None] * video_length
 
         neighbor_stride = self.neighbor_length // 2
@@ -331,13 +335,11 @@ class VideoInpaint:
                 pred_img = self.model(selected_imgs, selected_pred_flows_bi, selected_masks, selected_update_masks, l_t)
                 pred_img = pred_img.view(-1, 3, h, w)
                 pred_img = (pred_img + 1) / 2
-                pred_img = pred_img.cpu().permute(0, 2, 3, 1).numpy() * 255
-                binary_masks = masks_dilated[0, neighbor_ids, :, :, :].cpu().permute(
-                    0, 2, 3, 1).numpy().astype(np.uint8)
+                # mask以外的像素保持原始帧不变，只拷贝mask外接矩形内的补全结果
+                pred_img = pred_img[:, :, ymin:ymax, xmin:xmax].cpu().permute(0, 2, 3, 1).numpy() * 255
                 for i in range(len(neighbor_ids)):
                     idx = neighbor_ids[i]
-                    img = np.array(pred_img[i]).astype(np.uint8) * binary_masks[i] \
-                          + ori_frames[idx] * (1 - binary_masks[i])
+                    img = np.array(pred_img[i]).astype(np.uint8)
                     if comp_frames[idx] is None:
                         comp_frames[idx] = img
                     else:
@@ -345,7 +347,8 @@ class VideoInpaint:
                     comp_frames[idx] = comp_frames[idx].astype(np.uint8)
             torch.cuda.empty_cache()
         # save videos frame
-        comp_frames = [cv2.cvtColor(i, cv2.COLOR_RGB2BGR) for i in comp_frames]
+        comp_frames = [frame_compositors[idx].composite(frames_bgr[idx].copy(), comp_frames[idx], bbox, rgb=True)
+                       for idx in range(video_length)]
         return comp_frames
 
 
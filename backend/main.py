@@ -6,6 +6,7 @@ from pathlib import Path
 import threading
 import cv2
 import sys
+import numpy as np
 from functools import cached_property
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -18,11 +19,16 @@ from backend.inpaint.sttn_inpaint import STTNInpaint, STTNVideoInpaint
 from backend.inpaint.lama_inpaint import LamaInpaint
 from backend.inpaint.video_inpaint import VideoInpaint
 from backend.tools.inpaint_tools import create_mask, batch_generator
+from backend.tools.detection_cache import DetectionCache, get_model_signature
+from backend.tools.detection_store import DetectionStore, DetectionStoreBuilder, dt_boxes_to_coordinates, to_detection_store
+from backend.tools.box_tracks import (link_tracks, get_continuous_ranges, get_same_mask_ranges, box_iou_matrix,
+                                      get_area_max_boxes, get_united_boxes)
+from backend.tools.pipeline_tools import PipelineExecutor, ThreadedFrameReader
+from backend.tools.interval_index import IntervalIndex
 import importlib
 import platform
 import tempfile
 import multiprocessing
-from shapely.geometry import Polygon
 import time
 from tqdm import tqdm
 
@@ -32,12 +38,32 @@ class SubtitleDetect:
     文本框检测类，用于检测视频帧中是否存在文本框
     """
 
-    def __init__(self, video_path, sub_area=None):
+    def __init__(self, video_path, sub_area=None, cpu_threads=None):
         self.video_path = video_path
         self.sub_area = sub_area
+        # 检测模型在CPU上推理使用的线程数，为None时使用paddleocr的默认设置
+        self.cpu_threads = cpu_threads
+        # 检测统计信息，frames为处理的帧数，detected为实际送入检测模型的帧数，
+        # skipped为区域未变化而跳过检测的帧数，escalated为级联模式下送入完整模型的帧数，detect_time为检测耗时
+        self.stats = {'frames': 0, 'detected': 0, 'skipped': 0, 'escalated': 0, 'detect_time': 0.0}
+        # 送入检测的视频帧相对原视频帧的缩小倍数
+        self.detect_scale = 1
+        # 级联检测模式下，上一帧快速模型的检测框与完整模型的检测框
+        self.last_fast_coordinates = None
+        self.last_dt_boxes = None
+        # 区域变化门控使用的上一个实际检测帧的签名与检测结果
+        self.last_roi_signature = None
+        self.last_roi_coordinates = None
 
     @cached_property
     def text_detector(self):
+        return self.create_text_detector(config.DET_MODEL_PATH)
+
+    @cached_property
+    def fast_text_detector(self):
+        return self.create_text_detector(config.DET_FAST_MODEL_PATH)
+
+    def create_text_detector(self, model_dir):
         import paddle
         paddle.disable_signal_handler()
         from paddleocr.tools.infer import utility
@@ -46,15 +72,203 @@ class SubtitleDetect:
         importlib.reload(config)
         args = utility.parse_args()
         args.det_algorithm = 'DB'
-        args.det_model_dir = self.convertToOnnxModelIfNeeded(config.DET_MODEL_PATH)
+        args.det_model_dir = self.convertToOnnxModelIfNeeded(model_dir)
         args.use_onnx=len(config.ONNX_PROVIDERS) > 0
         args.onnx_providers=config.ONNX_PROVIDERS
+        if self.cpu_threads is not None:
+            # 多进程检测时限制每个进程的推理线程数，避免CPU超额占用
+            args.cpu_threads = self.cpu_threads
+            if args.use_onnx:
+                import onnxruntime as ort
+                sess_options = ort.SessionOptions()
+                sess_options.intra_op_num_threads = self.cpu_threads
+                sess_options.inter_op_num_threads = 1
+                args.onnx_sess_options = sess_options
         return TextDetector(args)
 
-    def detect_subtitle(self, img):
-        dt_boxes, elapse = self.text_detector(img)
+    def detect_subtitle(self, img, detector=None):
+        if detector is None:
+            detector = self.text_detector
+        dt_boxes, elapse = detector(img)
         return dt_boxes, elapse
 
+    def detect_subtitle_batch(self, img_list, detector=None):
+        """
+        批量检测文本框，将预处理后尺寸相同的多帧堆叠为一个批次，只调用一次DB模型推理
+        :param img_list 视频帧列表
+        :param detector 使用的检测模型，默认为完整模型
+        :return list 每一帧对应的检测框
+        """
+        if detector is None:
+            detector = self.text_detector
+        if len(img_list) == 1:
+            dt_boxes, _ = self.detect_subtitle(img_list[0], detector)
+            return [dt_boxes]
+        from paddleocr.tools.infer.predict_det import transform
+        # 按预处理后的尺寸分组，同一视频的帧尺寸一致，通常只有一组
+        groups = {}
+        for i, img in enumerate(img_list):
+            img_data, shape = transform({'image': img}, detector.preprocess_op)
+            groups.setdefault(img_data.shape, []).append((i, img_data, shape))
+        dt_boxes_list = [None] * len(img_list)
+        for items in groups.values():
+            batch = np.stack([item[1] for item in items])
+            shape_list = np.stack([item[2] for item in items])
+            if detector.use_onnx:
+                outputs = detector.predictor.run(detector.output_tensors, {detector.input_tensor.name: batch})
+            else:
+                detector.input_tensor.copy_from_cpu(batch)
+                detector.predictor.run()
+                outputs = [output_tensor.copy_to_cpu() for output_tensor in detector.output_tensors]
+            # DB后处理支持批量输入，按批次索引返回每一帧的检测框
+            post_result = detector.postprocess_op({'maps': outputs[0]}, shape_list)
+            for (i, _, _), result in zip(items, post_result):
+                dt_boxes_list[i] = detector.filter_tag_det_res(result['points'], img_list[i].shape)
+        return dt_boxes_list
+
+    def detect_subtitle_cascade(self, img_list):
+        """
+        级联检测：先用快速模型筛查所有帧，只有快速模型检测到文本且文本框与上一帧相比发生变化时，才使用完整模型检测，
+        快速模型检测到的文本框与上一帧一致时，直接沿用上一帧完整模型的检测结果
+        :param img_list 视频帧列表
+        :return list 每一帧对应的检测框
+        """
+        fast_dt_boxes_list = self.detect_subtitle_batch(img_list, self.fast_text_detector)
+        # 每一帧检测结果的来源，None表示没有文本，-1表示沿用上一批次最后的结果，其他为需要完整模型检测的帧索引
+        sources = []
+        escalate_indexes = []
+        last_source = -1 if self.last_dt_boxes is not None else None
+        for i, fast_dt_boxes in enumerate(fast_dt_boxes_list):
+            fast_coordinates = dt_boxes_to_coordinates(fast_dt_boxes)
+            if len(fast_coordinates) == 0:
+                source = None
+            elif (last_source is not None and self.last_fast_coordinates is not None
+                  and self.are_same_boxes(fast_coordinates, self.last_fast_coordinates)):
+                source = last_source
+            else:
+                source = i
+                escalate_indexes.append(i)
+            sources.append(source)
+            last_source = source
+            self.last_fast_coordinates = fast_coordinates
+        escalated_dt_boxes = {}
+        if len(escalate_indexes) > 0:
+            heavy_dt_boxes_list = self.detect_subtitle_batch([img_list[i] for i in escalate_indexes])
+            escalated_dt_boxes = dict(zip(escalate_indexes, heavy_dt_boxes_list))
+        self.stats['escalated'] += len(escalate_indexes)
+        dt_boxes_list = []
+        for source in sources:
+            if source is None:
+                dt_boxes = np.zeros((0, 4, 2), dtype=np.float32)
+            elif source == -1:
+                dt_boxes = self.last_dt_boxes
+            else:
+                dt_boxes = escalated_dt_boxes[source]
+            dt_boxes_list.append(dt_boxes)
+        self.last_dt_boxes = dt_boxes_list[-1] if sources[-1] is not None else None
+        return dt_boxes_list
+
+    def get_detect_area(self, frame_shape):
+        """
+        获取送入检测模型的裁剪区域(字幕区域外加边距)
+        :return (ymin, ymax, xmin, xmax)，不需要裁剪时返回None
+        """
+        if self.sub_area is None or not config.SUBTITLE_AREA_CROP_DETECTION:
+            return None
+        height, width = frame_shape[:2]
+        margin = config.SUBTITLE_AREA_DETECT_MARGIN
+        s_ymin, s_ymax, s_xmin, s_xmax = self.sub_area
+        ymin, ymax = max(0, int(s_ymin) - margin), min(height, int(s_ymax) + margin)
+        xmin, xmax = max(0, int(s_xmin) - margin), min(width, int(s_xmax) + margin)
+        # 区域不合法或者覆盖整帧时不需要裁剪
+        if ymin >= ymax or xmin >= xmax or (ymin, ymax, xmin, xmax) == (0, height, 0, width):
+            return None
+        return ymin, ymax, xmin, xmax
+
+    def detect_subtitle_frames(self, frames):
+        """
+        检测多帧图像中的字幕
+        :param frames 视频帧列表
+        :return list 每一帧位于字幕区域内的文本框坐标数组，形状为 (n, 4)
+        """
+        start_time = time.time()
+        scale = self.detect_scale
+        detect_area = self.get_detect_area((frames[0].shape[0] * scale, frames[0].shape[1] * scale))
+        if detect_area is not None:
+            # 将原视频帧坐标系下的检测区域换算到缩小后的视频帧上
+            ymin, ymax, xmin, xmax = detect_area
+            ymin, ymax, xmin, xmax = ymin // scale, -(-ymax // scale), xmin // scale, -(-xmax // scale)
+            frames = [frame[ymin:ymax, xmin:xmax] for frame in frames]
+        # 每一帧检测结果的来源帧索引，-1表示沿用上一次检测的结果
+        if config.SUBTITLE_ROI_CHANGE_THRESHOLD > 0:
+            sources = self.get_roi_gate_sources(frames)
+        else:
+            sources = list(range(len(frames)))
+        detect_indexes = [i for i, source in enumerate(sources) if source == i]
+        self.stats['detected'] += len(detect_indexes)
+        self.stats['skipped'] += len(frames) - len(detect_indexes)
+        detect_frames = [frames[i] for i in detect_indexes]
+        detected_coordinates = {}
+        if len(detect_frames) > 0:
+            if config.SUBTITLE_DETECT_CASCADE:
+                dt_boxes_list = self.detect_subtitle_cascade(detect_frames)
+            else:
+                dt_boxes_list = self.detect_subtitle_batch(detect_frames)
+            for i, dt_boxes in zip(detect_indexes, dt_boxes_list):
+                if detect_area is not None and len(dt_boxes) > 0:
+                    # 将裁剪区域内的坐标映射回原视频帧坐标
+                    dt_boxes = dt_boxes + np.array([xmin, ymin], dtype=dt_boxes.dtype)
+                if scale > 1 and len(dt_boxes) > 0:
+                    dt_boxes = dt_boxes * scale
+                detected_coordinates[i] = self.get_sub_area_coordinates(dt_boxes)
+        coordinates_list = [detected_coordinates[source] if source >= 0 else self.last_roi_coordinates
+                            for source in sources]
+        self.last_roi_coordinates = coordinates_list[-1]
+        self.stats['detect_time'] += time.time() - start_time
+        return coordinates_list
+
+    @staticmethod
+    def get_roi_signature(roi):
+        """
+        计算检测区域的签名：缩小后的灰度图
+        """
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if roi.ndim == 3 else roi
+        height, width = gray.shape[:2]
+        thumb_width = min(width, 128)
+        thumb_height = max(1, min(height, round(thumb_width * height / width)))
+        return cv2.resize(gray, (thumb_width, thumb_height), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def get_roi_gate_sources(self, frames):
+        """
+        区域变化门控：将每一帧检测区域的签名与上一个实际检测帧的签名比较，
+        平均像素差异小于SUBTITLE_ROI_CHANGE_THRESHOLD时沿用上一个实际检测帧的结果，不再送入检测模型
+        :return list 每一帧检测结果的来源帧索引，-1表示沿用上一次调用中最后检测的结果
+        """
+        sources = []
+        last_source = -1 if self.last_roi_signature is not None else None
+        for i, frame in enumerate(frames):
+            signature = self.get_roi_signature(frame)
+            if (last_source is not None and signature.shape == self.last_roi_signature.shape
+                    and np.mean(np.abs(signature - self.last_roi_signature)) < config.SUBTITLE_ROI_CHANGE_THRESHOLD):
+                sources.append(last_source)
+            else:
+                sources.append(i)
+                last_source = i
+                self.last_roi_signature = signature
+        return sources
+
+    def get_sub_area_coordinates(self, dt_boxes):
+        """
+        将检测框转换为坐标，并过滤掉不在字幕区域内的文本框
+        :return 坐标数组，形状为 (n, 4)，每行为 (xmin, xmax, ymin, ymax)
+        """
+        coordinates = dt_boxes_to_coordinates(dt_boxes)
+        if self.sub_area is not None:
+            s_ymin, s_ymax, s_xmin, s_xmax = self.sub_area
+            xmin, xmax, ymin, ymax = coordinates.T
+            coordinates = coordinates[(s_xmin <= xmin) & (xmax <= s_xmax) & (s_ymin <= ymin) & (ymax <= s_ymax)]
+        return coordinates
+
     @staticmethod
     def get_coordinates(dt_box):
         """
@@ -77,40 +291,71 @@ class SubtitleDetect:
                 coordinate_list.append((xmin, xmax, ymin, ymax))
         return coordinate_list
 
+    @staticmethod
+    def get_detection_cache(video_path):
+        """
+        获取检测结果缓存对象，未开启缓存或者处理的是图片时返回None
+        """
+        if not config.DETECTION_CACHE_ENABLED or is_image_file(str(video_path)):
+            return None
+        return DetectionCache(config.DETECTION_CACHE_DIR, config.DETECTION_CACHE_MAX_SIZE)
+
+    def get_cache_settings(self):
+        """
+        获取影响字幕检测结果的参数，作为缓存键的一部分
+        """
+        return {
+            'model': os.path.relpath(config.DET_MODEL_PATH, config.DET_MODEL_BASE),
+            'model_files': get_model_signature(config.DET_MODEL_PATH),
+            'fast_model': os.path.relpath(config.DET_FAST_MODEL_PATH, config.DET_MODEL_BASE) if config.SUBTITLE_DETECT_CASCADE else None,
+            'fast_model_files': get_model_signature(config.DET_FAST_MODEL_PATH) if config.SUBTITLE_DETECT_CASCADE else None,
+            # Paddle与ONNX Runtime(及不同的ExecutionProvider)的检测结果可能略有差异
+            'backend': 'onnx' if config.ONNX_PROVIDERS else 'paddle',
+            'onnx_providers': list(config.ONNX_PROVIDERS),
+            'sub_area': list(self.sub_area) if self.sub_area is not None else None,
+            'pixel_tolerance': [config.PIXEL_TOLERANCE_X, config.PIXEL_TOLERANCE_Y],
+            'crop': [config.SUBTITLE_AREA_CROP_DETECTION, config.SUBTITLE_AREA_DETECT_MARGIN],
+            'downscale': config.SUBTITLE_DETECT_DOWNSCALE,
+            'sample_interval': config.SUBTITLE_DETECT_SAMPLE_INTERVAL,
+            'roi_change_threshold': config.SUBTITLE_ROI_CHANGE_THRESHOLD,
+        }
+
     def find_subtitle_frame_no(self, sub_remover=None):
+        # 先重置统计信息，命中缓存时不保留上一次检测的统计结果
+        self.stats = {'frames': 0, 'detected': 0, 'skipped': 0, 'escalated': 0, 'detect_time': 0.0}
+        self.last_fast_coordinates, self.last_dt_boxes = None, None
+        self.last_roi_signature, self.last_roi_coordinates = None, None
+        detection_cache = self.get_detection_cache(self.video_path)
+        if detection_cache is not None:
+            subtitle_store = detection_cache.load_subtitle_store(self.video_path, self.get_cache_settings())
+            if subtitle_store is not None:
+                print('[Finished] Loaded subtitles from detection cache...')
+                if sub_remover:
+                    sub_remover.progress_total = 50
+                return subtitle_store
         video_cap = cv2.VideoCapture(self.video_path)
         frame_count = video_cap.get(cv2.CAP_PROP_FRAME_COUNT)
         tbar = tqdm(total=int(frame_count), unit='frame', position=0, file=sys.__stdout__, desc='Subtitle Finding')
-        current_frame_no = 0
-        subtitle_frame_no_box_dict = {}
-        print('[Processing] start finding subtitles...')
-        while video_cap.isOpened():
-            ret, frame = video_cap.read()
-            # 如果读取视频帧失败（视频读到最后一帧）
-            if not ret:
-                break
-            # 读取视频帧成功
-            current_frame_no += 1
-            dt_boxes, elapse = self.detect_subtitle(frame)
-            coordinate_list = self.get_coordinates(dt_boxes.tolist())
-            if coordinate_list:
-                temp_list = []
-                for coordinate in coordinate_list:
-                    xmin, xmax, ymin, ymax = coordinate
-                    if self.sub_area is not None:
-                        s_ymin, s_ymax, s_xmin, s_xmax = self.sub_area
-                        if (s_xmin <= xmin and xmax <= s_xmax
-                                and s_ymin <= ymin
-                                and ymax <= s_ymax):
-                            temp_list.append((xmin, xmax, ymin, ymax))
-                    else:
-                        temp_list.append((xmin, xmax, ymin, ymax))
-                if len(temp_list) > 0:
-                    subtitle_frame_no_box_dict[current_frame_no] = temp_list
-            tbar.update(1)
+
+        def update_progress(current_frame_no, increment):
+            tbar.update(increment)
             if sub_remover:
                 sub_remover.progress_total = (100 * float(current_frame_no) / float(frame_count)) // 2
-        subtitle_frame_no_box_dict = self.unify_regions(subtitle_frame_no_box_dict)
+
+        print('[Processing] start finding subtitles...')
+        workers = config.SUBTITLE_DETECT_WORKERS
+        if workers > 1 and int(frame_count) > workers:
+            video_cap.release()
+            subtitle_store = self.find_subtitle_frame_no_parallel(int(frame_count), workers, update_progress)
+            self.print_stats()
+        else:
+            # 在后台线程中解码视频帧，使解码与检测并行
+            frame_reader = ThreadedFrameReader(video_cap, config.SUBTITLE_DETECT_QUEUE_SIZE, config.SUBTITLE_DETECT_DOWNSCALE)
+            subtitle_store = self.detect_frames(frame_reader, update_progress)
+            video_cap.release()
+            self.print_stats()
+            frame_reader.print_stats('detect', self.stats['detect_time'])
+        subtitle_store = self.unify_regions(subtitle_store)
         # if config.UNITE_COORDINATES:
         #     subtitle_frame_no_box_dict = self.get_subtitle_frame_no_box_dict_with_united_coordinates(subtitle_frame_no_box_dict)
         #     if sub_remover is not None:
@@ -123,11 +368,149 @@ class SubtitleDetect:
         #             pass
         #     subtitle_frame_no_box_dict = self.prevent_missed_detection(subtitle_frame_no_box_dict)
         print('[Finished] Finished finding subtitles...')
-        new_subtitle_frame_no_box_dict = dict()
-        for key in subtitle_frame_no_box_dict.keys():
-            if len(subtitle_frame_no_box_dict[key]) > 0:
-                new_subtitle_frame_no_box_dict[key] = subtitle_frame_no_box_dict[key]
-        return new_subtitle_frame_no_box_dict
+        if detection_cache is not None:
+            detection_cache.save_subtitle_store(self.video_path, self.get_cache_settings(), subtitle_store)
+        return subtitle_store
+
+    def detect_frames(self, frame_reader, update_progress):
+        """
+        检测视频帧读取器中所有视频帧的字幕
+        :return DetectionStore 未经统一的检测结果
+        """
+        self.detect_scale = frame_reader.downscale
+        sample_interval = max(1, config.SUBTITLE_DETECT_SAMPLE_INTERVAL)
+        if sample_interval > 1:
+            return self.find_subtitle_frame_no_sparse(frame_reader, sample_interval, update_progress)
+        return self.find_subtitle_frame_no_dense(frame_reader, update_progress)
+
+    def find_subtitle_frame_no_parallel(self, frame_count, workers, update_progress):
+        """
+        多进程检测字幕：将视频按帧号分为workers段，每个进程跳转到各自的起始帧，使用独立的检测模型检测，
+        最后按帧号顺序合并各段的结果，跨段的文本框统一交由后续的unify_regions处理
+        """
+        cpu_threads = config.SUBTITLE_DETECT_THREADS_PER_WORKER
+        if cpu_threads < 1:
+            cpu_threads = max(1, multiprocessing.cpu_count() // workers)
+        segment_length = -(-frame_count // workers)
+        # 最后一段不设结束帧号，读到视频末尾，CAP_PROP_FRAME_COUNT不准确时与单进程检测的帧范围一致
+        frame_ranges = [(start, start + segment_length - 1 if start + segment_length <= frame_count else None)
+                        for start in range(1, frame_count + 1, segment_length)]
+        print(f'[Processing] detecting subtitles with {len(frame_ranges)} processes, {cpu_threads} threads each')
+        tasks = [(self.video_path, self.sub_area, start, end, cpu_threads) for start, end in frame_ranges]
+        segment_results = [None] * len(tasks)
+        finished_frames = 0
+        # paddle在fork出的子进程中可能死锁，统一使用spawn方式创建进程
+        with multiprocessing.get_context('spawn').Pool(processes=len(tasks)) as pool:
+            for index, (segment_store, segment_stats) in pool.imap_unordered(find_subtitle_frame_no_in_range, enumerate(tasks)):
+                segment_results[index] = segment_store
+                for key, value in segment_stats.items():
+                    self.stats[key] += value
+                finished_frames += segment_stats['frames']
+                update_progress(finished_frames, segment_stats['frames'])
+        return DetectionStore.concatenate(segment_results)
+
+    def find_subtitle_frame_no_dense(self, frame_reader, update_progress):
+        """
+        逐帧检测字幕，每凑满一个批次送入检测模型一次
+        """
+        detection_builder = DetectionStoreBuilder()
+        batch_size = max(1, config.SUBTITLE_DETECT_BATCH_SIZE)
+        # 待检测的视频帧批次
+        frame_no_batch, frame_batch = [], []
+
+        def detect_batch():
+            for frame_no, coordinates in zip(frame_no_batch, self.detect_subtitle_frames(frame_batch)):
+                detection_builder.add(frame_no, coordinates)
+            self.stats['frames'] += len(frame_batch)
+            update_progress(frame_no_batch[-1], len(frame_batch))
+
+        for current_frame_no, frame in frame_reader:
+            frame_no_batch.append(current_frame_no)
+            frame_batch.append(frame)
+            # 批次已满时，对当前批次进行检测
+            if len(frame_batch) >= batch_size:
+                detect_batch()
+                frame_no_batch, frame_batch = [], []
+        # 视频读到最后一帧时，检测剩余的视频帧
+        if len(frame_batch) > 0:
+            detect_batch()
+        return detection_builder.build()
+
+    def find_subtitle_frame_no_sparse(self, frame_reader, sample_interval, update_progress):
+        """
+        稀疏检测字幕：每隔sample_interval帧采样检测一帧，相邻采样帧的文本框一致时，认为中间帧的文本框也一致，
+        不一致时通过二分查找定位字幕出现与消失的准确帧号
+        """
+        detection_builder = DetectionStoreBuilder()
+        batch_size = max(1, config.SUBTITLE_DETECT_BATCH_SIZE)
+        frame_iter = iter(frame_reader)
+        # 上一个采样帧的文本框
+        last_sample_boxes = None
+        finished = False
+        while not finished:
+            # 读取若干段视频帧，每一段的最后一帧为采样帧，所有段的采样帧作为一个批次检测
+            segments = []
+            while len(segments) < batch_size and not finished:
+                segment = []
+                # 第一帧单独作为一个采样帧
+                segment_size = 1 if last_sample_boxes is None and len(segments) == 0 else sample_interval
+                while len(segment) < segment_size:
+                    item = next(frame_iter, None)
+                    if item is None:
+                        finished = True
+                        break
+                    segment.append(item)
+                if len(segment) > 0:
+                    segments.append(segment)
+            if len(segments) == 0:
+                break
+            sample_boxes_list = self.detect_subtitle_frames([segment[-1][1] for segment in segments])
+            for segment, sample_boxes in zip(segments, sample_boxes_list):
+                sample_frame_no = segment[-1][0]
+                detection_builder.add(sample_frame_no, sample_boxes)
+                if last_sample_boxes is not None:
+                    self.resolve_frames_between_samples(last_sample_boxes, segment[:-1], sample_boxes, detection_builder)
+                last_sample_boxes = sample_boxes
+                self.stats['frames'] += len(segment)
+                update_progress(sample_frame_no, len(segment))
+        return detection_builder.build()
+
+    def resolve_frames_between_samples(self, start_boxes, frames, end_boxes, detection_builder):
+        """
+        确定两个采样帧之间每一帧的文本框
+        :param start_boxes 前一个采样帧的文本框
+        :param frames 两个采样帧之间的视频帧列表[(帧号, 视频帧)]
+        :param end_boxes 后一个采样帧的文本框
+        :param detection_builder 收集检测结果的DetectionStoreBuilder
+        """
+        if len(frames) == 0:
+            return
+        # 前后文本框一致，说明中间没有发生字幕切换
+        if self.are_same_boxes(start_boxes, end_boxes):
+            for frame_no, _ in frames:
+                detection_builder.add(frame_no, start_boxes)
+            return
+        # 前后不一致，检测中间帧，对两侧继续二分
+        mid = len(frames) // 2
+        mid_frame_no, mid_frame = frames[mid]
+        mid_boxes = self.detect_subtitle_frames([mid_frame])[0]
+        detection_builder.add(mid_frame_no, mid_boxes)
+        self.resolve_frames_between_samples(start_boxes, frames[:mid], mid_boxes, detection_builder)
+        self.resolve_frames_between_samples(mid_boxes, frames[mid + 1:], end_boxes, detection_builder)
+
+    def print_stats(self):
+        """
+        打印字幕检测的统计信息
+        """
+        frames, detected = self.stats['frames'], self.stats['detected']
+        if frames > 0:
+            print(f'[Info] detector ran on {detected}/{frames} frames ({100 * detected / frames:.1f}%)')
+        if config.SUBTITLE_ROI_CHANGE_THRESHOLD > 0 and frames > 0:
+            skipped = self.stats['skipped']
+            print(f'[Info] {skipped}/{frames} frames skipped by subtitle area change gating ({100 * skipped / frames:.1f}%)')
+        if config.SUBTITLE_DETECT_CASCADE and detected > 0:
+            escalated = self.stats['escalated']
+            print(f'[Info] {escalated}/{detected} frames escalated to the full detection model ({100 * escalated / detected:.1f}%)')
 
     def convertToOnnxModelIfNeeded(self, model_dir, model_filename="inference.pdmodel", params_filename="inference.pdiparams", opset_version=14):
         """Converts a Paddle model to ONNX if ONNX providers are available and the model does not already exist."""
@@ -177,32 +560,23 @@ class SubtitleDetect:
 
     @staticmethod
     def split_range_by_scene(intervals, points):
-        # 确保离散值列表是有序的
-        points.sort()
-        # 用于存储结果区间的列表
-        result_intervals = []
-        # 遍历区间
-        for start, end in intervals:
-            # 在当前区间内的点
-            current_points = [p for p in points if start <= p <= end]
-
-            # 遍历当前区间内的离散点
-            for p in current_points:
-                # 如果当前离散点不是区间的起始点，添加从区间开始到离散点前一个数字的区间
-                if start < p:
-                    result_intervals.append((start, p - 1))
-                # 更新区间开始为当前离散点
-                start = p
-            # 添加从最后一个离散点或区间开始到区间结束的区间
-            result_intervals.append((start, end))
-        # 输出结果
-        return result_intervals
+        """
+        按场景切换帧号切分字幕区间，场景切换帧作为新区间的起始帧
+        """
+        return IntervalIndex(intervals).split_by_points(points)
 
     @staticmethod
     def get_scene_div_frame_no(v_path):
         """
         获取发生场景切换的帧号
         """
+        detection_cache = SubtitleDetect.get_detection_cache(v_path)
+        cache_settings = {'detector': 'ContentDetector'}
+        if detection_cache is not None:
+            scene_div_frame_no_list = detection_cache.load_scene_div_frame_no(v_path, cache_settings)
+            if scene_div_frame_no_list is not None:
+                print('[Finished] Loaded scene cuts from detection cache...')
+                return scene_div_frame_no_list
         scene_div_frame_no_list = []
         scene_list = scene_detect(v_path, ContentDetector())
         for scene in scene_list:
@@ -211,6 +585,8 @@ class SubtitleDetect:
                 pass
             else:
                 scene_div_frame_no_list.append(start.frame_num + 1)
+        if detection_cache is not None:
+            detection_cache.save_scene_div_frame_no(v_path, cache_settings, scene_div_frame_no_list)
         return scene_div_frame_no_list
 
     @staticmethod
@@ -222,95 +598,33 @@ class SubtitleDetect:
         return abs(xmin1 - xmin2) <= config.PIXEL_TOLERANCE_X and abs(xmax1 - xmax2) <= config.PIXEL_TOLERANCE_X and \
             abs(ymin1 - ymin2) <= config.PIXEL_TOLERANCE_Y and abs(ymax1 - ymax2) <= config.PIXEL_TOLERANCE_Y
 
-    def unify_regions(self, raw_regions):
-        """将连续相似的区域统一，保持列表结构。"""
-        if len(raw_regions) > 0:
-            keys = sorted(raw_regions.keys())  # 对键进行排序以确保它们是连续的
-            unified_regions = {}
-
-            # 初始化
-            last_key = keys[0]
-            unify_value_map = {last_key: raw_regions[last_key]}
-
-            for key in keys[1:]:
-                current_regions = raw_regions[key]
-
-                # 新增一个列表来存放匹配过的标准区间
-                new_unify_values = []
-
-                for idx, region in enumerate(current_regions):
-                    last_standard_region = unify_value_map[last_key][idx] if idx < len(unify_value_map[last_key]) else None
+    def are_same_boxes(self, boxes1, boxes2):
+        """判断两帧的文本框集合是否相同，数量一致且一一相似。"""
+        boxes1, boxes2 = np.asarray(boxes1, dtype=np.int32).reshape(-1, 4), np.asarray(boxes2, dtype=np.int32).reshape(-1, 4)
+        if len(boxes1) != len(boxes2):
+            return False
+        # 与按元组排序一致：先按xmin排序，再依次按xmax、ymin、ymax排序
+        boxes1, boxes2 = boxes1[np.lexsort(boxes1.T[::-1])], boxes2[np.lexsort(boxes2.T[::-1])]
+        diff = np.abs(boxes1 - boxes2)
+        return bool(np.all(diff[:, :2] <= config.PIXEL_TOLERANCE_X) and np.all(diff[:, 2:] <= config.PIXEL_TOLERANCE_Y))
 
-                    # 如果当前的区间与前一个键的对应区间相似，我们统一它们
-                    if last_standard_region and self.are_similar(region, last_standard_region):
-                        new_unify_values.append(last_standard_region)
-                    else:
-                        new_unify_values.append(region)
-
-                # 更新unify_value_map为最新的区间值
-                unify_value_map[key] = new_unify_values
-                last_key = key
-
-            # 将最终统一后的结果传递给unified_regions
-            for key in keys:
-                unified_regions[key] = unify_value_map[key]
-            return unified_regions
-        else:
-            return raw_regions
+    def unify_regions(self, raw_regions):
+        """将连续相似的区域统一，保持列表结构，并为每个文本框分配轨迹编号。"""
+        return link_tracks(to_detection_store(raw_regions), config.PIXEL_TOLERANCE_X, config.PIXEL_TOLERANCE_Y)
 
     @staticmethod
     def find_continuous_ranges(subtitle_frame_no_box_dict):
         """
         获取字幕出现的起始帧号与结束帧号
         """
-        numbers = sorted(list(subtitle_frame_no_box_dict.keys()))
-        ranges = []
-        start = numbers[0]  # 初始区间开始值
-
-        for i in range(1, len(numbers)):
-            # 如果当前数字与前一个数字间隔超过1，
-            # 则上一个区间结束，记录当前区间的开始与结束
-            if numbers[i] - numbers[i - 1] != 1:
-                end = numbers[i - 1]  # 则该数字是当前连续区间的终点
-                ranges.append((start, end))
-                start = numbers[i]  # 开始下一个连续区间
-        # 添加最后一个区间
-        ranges.append((start, numbers[-1]))
-        return ranges
+        return get_continuous_ranges(to_detection_store(subtitle_frame_no_box_dict))
 
     @staticmethod
     def find_continuous_ranges_with_same_mask(subtitle_frame_no_box_dict):
-        numbers = sorted(list(subtitle_frame_no_box_dict.keys()))
-        ranges = []
-        start = numbers[0]  # 初始区间开始值
-        for i in range(1, len(numbers)):
-            # 如果当前帧号与前一个帧号间隔超过1，
-            # 则上一个区间结束，记录当前区间的开始与结束
-            if numbers[i] - numbers[i - 1] != 1:
-                end = numbers[i - 1]  # 则该数字是当前连续区间的终点
-                ranges.append((start, end))
-                start = numbers[i]  # 开始下一个连续区间
-            # 如果当前帧号与前一个帧号间隔为1，且当前帧号对应的坐标点与上一帧号对应的坐标点不一致
-            # 记录当前区间的开始与结束
-            if numbers[i] - numbers[i - 1] == 1:
-                if subtitle_frame_no_box_dict[numbers[i]] != subtitle_frame_no_box_dict[numbers[i - 1]]:
-                    end = numbers[i - 1]  # 则该数字是当前连续区间的终点
-                    ranges.append((start, end))
-                    start = numbers[i]  # 开始下一个连续区间
-        # 添加最后一个区间
-        ranges.append((start, numbers[-1]))
-        return ranges
-
-    @staticmethod
-    def sub_area_to_polygon(sub_area):
         """
-        xmin, xmax, ymin, ymax = sub_area
+        获取字幕出现的起始帧号与结束帧号，区间内每一帧的文本框完全一致
         """
-        s_xmin = sub_area[0]
-        s_xmax = sub_area[1]
-        s_ymin = sub_area[2]
-        s_ymax = sub_area[3]
-        return Polygon([[s_xmin, s_ymin], [s_xmax, s_ymin], [s_xmax, s_ymax], [s_xmin, s_ymax]])
+        return get_same_mask_ranges(to_detection_store(subtitle_frame_no_box_dict))
 
     @staticmethod
     def expand_and_merge_intervals(intervals, expand_size=config.STTN_NEIGHBOR_STRIDE*config.STTN_REFERENCE_LENGTH, max_length=config.STTN_MAX_LOAD_NUM):
@@ -354,17 +668,16 @@ class SubtitleDetect:
         合并传入的字幕起始区间，确保区间大小最低为STTN_REFERENCE_LENGTH
         """
         expanded = []
+        interval_index = IntervalIndex(intervals)
         # 首先单独处理单点区间以扩展它们
         for start, end in intervals:
             if start == end:  # 单点区间
                 # 扩展到接近的目标长度，但保证前后不重叠
                 prev_end = expanded[-1][1] if expanded else float('-inf')
-                next_start = float('inf')
                 # 查找下一个区间的起始点
-                for ns, ne in intervals:
-                    if ns > end:
-                        next_start = ns
-                        break
+                next_start = interval_index.find_next_start(end)
+                if next_start is None:
+                    next_start = float('inf')
                 # 确定新的扩展起点和终点
                 new_start = max(start - (target_length - 1) // 2, prev_end + 1)
                 new_end = min(start + (target_length - 1) // 2, next_start - 1)
@@ -393,116 +706,31 @@ class SubtitleDetect:
                 merged.append((start, end))
         return merged
 
-    def compute_iou(self, box1, box2):
-        box1_polygon = self.sub_area_to_polygon(box1)
-        box2_polygon = self.sub_area_to_polygon(box2)
-        intersection = box1_polygon.intersection(box2_polygon)
-        if intersection.is_empty:
-            return -1
-        else:
-            union_area = (box1_polygon.area + box2_polygon.area - intersection.area)
-            if union_area > 0:
-                intersection_area_rate = intersection.area / union_area
-            else:
-                intersection_area_rate = 0
-            return intersection_area_rate
+    @staticmethod
+    def compute_iou(box1, box2):
+        """
+        计算两个文本框的IoU，不相交时返回-1
+        """
+        return float(box_iou_matrix([box1], [box2])[0, 0])
 
     def get_area_max_box_dict(self, sub_frame_no_list_continuous, subtitle_frame_no_box_dict):
-        _area_max_box_dict = dict()
-        for start_no, end_no in sub_frame_no_list_continuous:
-            # 寻找面积最大文本框
-            current_no = start_no
-            # 查找当前区间矩形框最大面积
-            area_max_box_list = []
-            while current_no <= end_no:
-                for coord in subtitle_frame_no_box_dict[current_no]:
-                    # 取出每一个文本框坐标
-                    xmin, xmax, ymin, ymax = coord
-                    # 计算当前文本框坐标面积
-                    current_area = abs(xmax - xmin) * abs(ymax - ymin)
-                    # 如果区间最大框列表为空，则当前面积为区间最大面积
-                    if len(area_max_box_list) < 1:
-                        area_max_box_list.append({
-                            'area': current_area,
-                            'xmin': xmin,
-                            'xmax': xmax,
-                            'ymin': ymin,
-                            'ymax': ymax
-                        })
-                    # 如果列表非空，判断当前文本框是与区间最大文本框在同一区域
-                    else:
-                        has_same_position = False
-                        # 遍历每个区间最大文本框，判断当前文本框位置是否与区间最大文本框列表的某个文本框位于同一行且交叉
-                        for area_max_box in area_max_box_list:
-                            if (area_max_box['ymin'] - config.THRESHOLD_HEIGHT_DIFFERENCE <= ymin
-                                    and ymax <= area_max_box['ymax'] + config.THRESHOLD_HEIGHT_DIFFERENCE):
-                                if self.compute_iou((xmin, xmax, ymin, ymax), (
-                                        area_max_box['xmin'], area_max_box['xmax'], area_max_box['ymin'],
-                                        area_max_box['ymax'])) != -1:
-                                    # 如果高度差异不一样
-                                    if abs(abs(area_max_box['ymax'] - area_max_box['ymin']) - abs(
-                                            ymax - ymin)) < config.THRESHOLD_HEIGHT_DIFFERENCE:
-                                        has_same_position = True
-                                    # 如果在同一行，则计算当前面积是不是最大
-                                    # 判断面积大小，若当前面积更大，则将当前行的最大区域坐标点更新
-                                    if has_same_position and current_area > area_max_box['area']:
-                                        area_max_box['area'] = current_area
-                                        area_max_box['xmin'] = xmin
-                                        area_max_box['xmax'] = xmax
-                                        area_max_box['ymin'] = ymin
-                                        area_max_box['ymax'] = ymax
-                        # 如果遍历了所有的区间最大文本框列表，发现是新的一行，则直接添加
-                        if not has_same_position:
-                            new_large_area = {
-                                'area': current_area,
-                                'xmin': xmin,
-                                'xmax': xmax,
-                                'ymin': ymin,
-                                'ymax': ymax
-                            }
-                            if new_large_area not in area_max_box_list:
-                                area_max_box_list.append(new_large_area)
-                                break
-                current_no += 1
-            _area_max_box_list = list()
-            for area_max_box in area_max_box_list:
-                if area_max_box not in _area_max_box_list:
-                    _area_max_box_list.append(area_max_box)
-            _area_max_box_dict[f'{start_no}->{end_no}'] = _area_max_box_list
-        return _area_max_box_dict
+        """
+        获取每个区间内每一行字幕的最大文本框
+        :return dict {'起始帧号->结束帧号': [{'area', 'xmin', 'xmax', 'ymin', 'ymax'}]}
+        """
+        area_max_box_lists = get_area_max_boxes(to_detection_store(subtitle_frame_no_box_dict),
+                                                sub_frame_no_list_continuous, config.THRESHOLD_HEIGHT_DIFFERENCE)
+        return {f'{start_no}->{end_no}': area_max_box_list
+                for (start_no, end_no), area_max_box_list in zip(sub_frame_no_list_continuous, area_max_box_lists)}
 
     def get_subtitle_frame_no_box_dict_with_united_coordinates(self, subtitle_frame_no_box_dict):
         """
         将多个视频帧的文本区域坐标统一
         """
-        subtitle_frame_no_box_dict_with_united_coordinates = dict()
-        frame_no_list = self.find_continuous_ranges_with_same_mask(subtitle_frame_no_box_dict)
-        area_max_box_dict = self.get_area_max_box_dict(frame_no_list, subtitle_frame_no_box_dict)
-        for start_no, end_no in frame_no_list:
-            current_no = start_no
-            while True:
-                area_max_box_list = area_max_box_dict[f'{start_no}->{end_no}']
-                current_boxes = subtitle_frame_no_box_dict[current_no]
-                new_subtitle_frame_no_box_list = []
-                for current_box in current_boxes:
-                    current_xmin, current_xmax, current_ymin, current_ymax = current_box
-                    for max_box in area_max_box_list:
-                        large_xmin = max_box['xmin']
-                        large_xmax = max_box['xmax']
-                        large_ymin = max_box['ymin']
-                        large_ymax = max_box['ymax']
-                        box1 = (current_xmin, current_xmax, current_ymin, current_ymax)
-                        box2 = (large_xmin, large_xmax, large_ymin, large_ymax)
-                        res = self.compute_iou(box1, box2)
-                        if res != -1:
-                            new_subtitle_frame_no_box = (large_xmin, large_xmax, large_ymin, large_ymax)
-                            if new_subtitle_frame_no_box not in new_subtitle_frame_no_box_list:
-                                new_subtitle_frame_no_box_list.append(new_subtitle_frame_no_box)
-                subtitle_frame_no_box_dict_with_united_coordinates[current_no] = new_subtitle_frame_no_box_list
-                current_no += 1
-                if current_no > end_no:
-                    break
-        return subtitle_frame_no_box_dict_with_united_coordinates
+        subtitle_store = to_detection_store(subtitle_frame_no_box_dict)
+        frame_no_list = get_same_mask_ranges(subtitle_store)
+        area_max_box_lists = get_area_max_boxes(subtitle_store, frame_no_list, config.THRESHOLD_HEIGHT_DIFFERENCE)
+        return get_united_boxes(subtitle_store, frame_no_list, area_max_box_lists)
 
     def prevent_missed_detection(self, subtitle_frame_no_box_dict):
         """
@@ -649,22 +877,22 @@ class SubtitleRemover:
     @staticmethod
     def is_current_frame_no_start(frame_no, continuous_frame_no_list):
         """
-        判断给定的帧号是否为开头，是的话返回结束帧号，不是的话返回-1
+        判断给定的帧号是否为区间开头
+        :param continuous_frame_no_list IntervalIndex或者区间列表，逐帧调用时应传入IntervalIndex避免重复建立索引
         """
-        for start_no, end_no in continuous_frame_no_list:
-            if start_no == frame_no:
-                return True
-        return False
+        if not isinstance(continuous_frame_no_list, IntervalIndex):
+            continuous_frame_no_list = IntervalIndex(continuous_frame_no_list)
+        return continuous_frame_no_list.is_start(frame_no)
 
     @staticmethod
     def find_frame_no_end(frame_no, continuous_frame_no_list):
         """
-        判断给定的帧号是否为开头，是的话返回结束帧号，不是的话返回-1
+        获取给定帧号所在区间的结束帧号，不在任何区间内时返回-1
+        :param continuous_frame_no_list IntervalIndex或者区间列表，逐帧调用时应传入IntervalIndex避免重复建立索引
         """
-        for start_no, end_no in continuous_frame_no_list:
-            if start_no <= frame_no <= end_no:
-                return end_no
-        return -1
+        if not isinstance(continuous_frame_no_list, IntervalIndex):
+            continuous_frame_no_list = IntervalIndex(continuous_frame_no_list)
+        return continuous_frame_no_list.find_end(frame_no)
 
     def update_progress(self, tbar, increment):
         tbar.update(increment)
@@ -679,6 +907,7 @@ class SubtitleRemover:
         scene_div_points = self.sub_detector.get_scene_div_frame_no(self.video_path)
         continuous_frame_no_list = self.sub_detector.split_range_by_scene(continuous_frame_no_list,
                                                                           scene_div_points)
+        interval_index = IntervalIndex(continuous_frame_no_list)
         self.video_inpaint = VideoInpaint(config.PROPAINTER_MAX_LOAD_NUM)
         print('[Processing] start removing subtitles...')
         index = 0
@@ -696,12 +925,12 @@ class SubtitleRemover:
             # 如果有水印，判断该帧是不是开头帧
             else:
                 # 如果是开头帧，则批推理到尾帧
-                if self.is_current_frame_no_start(index, continuous_frame_no_list):
+                if self.is_current_frame_no_start(index, interval_index):
                     # print(f'No 1 Current index: {index}')
                     start_frame_no = index
                     print(f'find start: {start_frame_no}')
                     # 找到结束帧
-                    end_frame_no = self.find_frame_no_end(index, continuous_frame_no_list)
+                    end_frame_no = self.find_frame_no_end(index, interval_index)
                     # 判断当前帧号是不是字幕起始位置
                     # 如果获取的结束帧号不为-1则说明
                     if end_frame_no != -1:
@@ -786,34 +1015,31 @@ class SubtitleRemover:
             print(continuous_frame_no_list)
             continuous_frame_no_list = self.sub_detector.filter_and_merge_intervals(continuous_frame_no_list)
             print(continuous_frame_no_list)
-            start_end_map = dict()
-            for interval in continuous_frame_no_list:
-                start, end = interval
-                start_end_map[start] = end
-            current_frame_index = 0
+            interval_index = IntervalIndex(continuous_frame_no_list)
             print('[Processing] start removing subtitles...')
-            while True:
-                ret, frame = self.video_cap.read()
-                # 如果读取到为，则结束
-                if not ret:
-                    break
-                current_frame_index += 1
-                # 判断当前帧号是不是字幕区间开始, 如果不是，则直接写
-                if current_frame_index not in start_end_map.keys():
-                    self.video_writer.write(frame)
-                    print(f'write frame: {current_frame_index}')
-                    self.update_progress(tbar, increment=1)
-                    if self.gui_mode:
-                        self.preview_frame = cv2.hconcat([frame, frame])
-                # 如果是区间开始，则找到尾巴
-                else:
+
+            def read_batches():
+                """
+                读取视频帧，无字幕的帧单独作为一个任务，字幕区间内的帧按STTN_MAX_LOAD_NUM分批，返回 (起始帧号, 视频帧列表, mask)
+                """
+                current_frame_index = 0
+                while True:
+                    ret, frame = self.video_cap.read()
+                    # 如果读取到为，则结束
+                    if not ret:
+                        break
+                    current_frame_index += 1
+                    # 判断当前帧号是不是字幕区间开始, 如果不是，则直接写
+                    if not self.is_current_frame_no_start(current_frame_index, interval_index):
+                        yield current_frame_index, [frame], None
+                        continue
+                    # 如果是区间开始，则找到尾巴
                     start_frame_index = current_frame_index
-                    end_frame_index = start_end_map[current_frame_index]
+                    end_frame_index = self.find_frame_no_end(current_frame_index, interval_index)
                     print(f'processing frame {start_frame_index} to {end_frame_index}')
                     # 用于存储需要去字幕的视频帧
                     frames_need_inpaint = list()
                     frames_need_inpaint.append(frame)
-                    inner_index = 0
                     # 接着往下读，直到读取到尾巴
                     for j in range(end_frame_index - start_frame_index):
                         ret, frame = self.video_cap.read()
@@ -835,46 +1061,94 @@ class SubtitleRemover:
                     # 1. 获取当前批次使用的mask
                     mask = create_mask(self.mask_size, mask_area_coordinates)
                     print(f'inpaint with mask: {mask_area_coordinates}')
+                    batch_start = start_frame_index
                     for batch in batch_generator(frames_need_inpaint, config.STTN_MAX_LOAD_NUM):
-                        # 2. 调用批推理
-                        if len(batch) >= 1:
-                            inpainted_frames = sttn_inpaint(batch, mask)
-                            for i, inpainted_frame in enumerate(inpainted_frames):
-                                self.video_writer.write(inpainted_frame)
-                                print(f'write frame: {start_frame_index + inner_index} with mask')
-                                inner_index += 1
-                                if self.gui_mode:
-                                    self.preview_frame = cv2.hconcat([batch[i], inpainted_frame])
-                        self.update_progress(tbar, increment=len(batch))
+                        yield batch_start, batch, mask
+                        batch_start += len(batch)
+
+            def inpaint_batch(task):
+                start_frame_index, batch, mask = task
+                if mask is None:
+                    return start_frame_index, batch, batch, False
+                # 2. 调用批推理
+                return start_frame_index, batch, sttn_inpaint(batch, mask), True
+
+            def write_batch(result):
+                start_frame_index, batch, inpainted_frames, with_mask = result
+                for i, inpainted_frame in enumerate(inpainted_frames):
+                    self.video_writer.write(inpainted_frame)
+                    print(f'write frame: {start_frame_index + i}' + (' with mask' if with_mask else ''))
+                    if self.gui_mode:
+                        self.preview_frame = cv2.hconcat([batch[i], inpainted_frame])
+                self.update_progress(tbar, increment=len(batch))
+
+            # 读取、修复与写入三个阶段并行进行
+            pipeline = PipelineExecutor(config.INPAINT_PIPELINE_QUEUE_SIZE)
+            pipeline.run(read_batches(), inpaint_batch, write_batch)
+            pipeline.print_stats()
 
     def lama_mode(self, tbar):
         print('use lama mode')
         sub_list = self.sub_detector.find_subtitle_frame_no(sub_remover=self)
         if self.lama_inpaint is None:
             self.lama_inpaint = LamaInpaint()
-        index = 0
         print('[Processing] start removing subtitles...')
-        while True:
-            ret, frame = self.video_cap.read()
-            if not ret:
-                break
-            original_frame = frame
-            index += 1
-            if index in sub_list.keys():
-                mask = create_mask(self.mask_size, sub_list[index])
-                if config.LAMA_SUPER_FAST:
-                    frame = cv2.inpaint(frame, mask, 3, cv2.INPAINT_TELEA)
-                else:
-                    frame = self.lama_inpaint(frame, mask)
-            if self.gui_mode:
-                self.preview_frame = cv2.hconcat([original_frame, frame])
-            if self.is_picture:
-                cv2.imencode(self.ext, frame)[1].tofile(self.video_out_name)
+
+        def read_frames():
+            """
+            每次预读LAMA_LOOKAHEAD_FRAMES帧，返回 [(帧号, 视频帧, mask)]，无字幕的帧mask为None，
+            文本框相同的相邻帧共用同一个mask对象
+            """
+            index = 0
+            lookahead = max(1, config.LAMA_LOOKAHEAD_FRAMES)
+            tasks = []
+            last_boxes, last_mask = None, None
+            while True:
+                ret, frame = self.video_cap.read()
+                if not ret:
+                    break
+                index += 1
+                mask = None
+                if index in sub_list.keys():
+                    boxes = sub_list[index]
+                    if boxes != last_boxes:
+                        last_boxes, last_mask = boxes, create_mask(self.mask_size, boxes)
+                    mask = last_mask
+                tasks.append((index, frame, mask))
+                if len(tasks) >= lookahead:
+                    yield tasks
+                    tasks = []
+            if tasks:
+                yield tasks
+
+        def inpaint_frames(tasks):
+            frames = [frame for _, frame, _ in tasks]
+            inpaint_ids = [i for i, (_, _, mask) in enumerate(tasks) if mask is not None]
+            if config.LAMA_SUPER_FAST:
+                inpainted_frames = [cv2.inpaint(frames[i], tasks[i][2], 3, cv2.INPAINT_TELEA) for i in inpaint_ids]
             else:
-                self.video_writer.write(frame)
-            tbar.update(1)
-            self.progress_remover = 100 * float(index) / float(self.frame_count) // 2
-            self.progress_total = 50 + self.progress_remover
+                inpainted_frames = self.lama_inpaint.inpaint_batch([frames[i] for i in inpaint_ids], [tasks[i][2] for i in inpaint_ids])
+            results = list(frames)
+            for i, frame in zip(inpaint_ids, inpainted_frames):
+                results[i] = frame
+            return [(index, original_frame, frame) for (index, original_frame, _), frame in zip(tasks, results)]
+
+        def write_frames(results):
+            for index, original_frame, frame in results:
+                if self.gui_mode:
+                    self.preview_frame = cv2.hconcat([original_frame, frame])
+                if self.is_picture:
+                    cv2.imencode(self.ext, frame)[1].tofile(self.video_out_name)
+                else:
+                    self.video_writer.write(frame)
+                tbar.update(1)
+                self.progress_remover = 100 * float(index) / float(self.frame_count) // 2
+                self.progress_total = 50 + self.progress_remover
+
+        # 读取、修复与写入三个阶段并行进行
+        pipeline = PipelineExecutor(config.INPAINT_PIPELINE_QUEUE_SIZE)
+        pipeline.run(read_frames(), inpaint_frames, write_frames)
+        pipeline.print_stats()
 
     def run(self):
         # 记录开始时间
@@ -970,6 +1244,22 @@ class SubtitleRemover:
             self.video_temp_file.close()
 
 
+def find_subtitle_frame_no_in_range(task):
+    """
+    多进程字幕检测的子进程任务，检测指定帧号范围内的字幕
+    :param task (任务序号, (视频路径, 字幕区域, 起始帧号, 结束帧号, 推理线程数))，结束帧号为None时读到视频末尾
+    :return (任务序号, (未经统一的检测结果DetectionStore, 检测统计信息))
+    """
+    index, (video_path, sub_area, start_frame_no, end_frame_no, cpu_threads) = task
+    sub_detector = SubtitleDetect(video_path, sub_area, cpu_threads=cpu_threads)
+    video_cap = cv2.VideoCapture(video_path)
+    frame_reader = ThreadedFrameReader(video_cap, config.SUBTITLE_DETECT_QUEUE_SIZE, config.SUBTITLE_DETECT_DOWNSCALE,
+                                       start_frame_no=start_frame_no, end_frame_no=end_frame_no)
+    subtitle_store = sub_detector.detect_frames(frame_reader, lambda current_frame_no, increment: None)
+    video_cap.release()
+    return index, (subtitle_store, sub_detector.stats)
+
+
 # 读取配置文件，获取字幕区域比例并转换为像素坐标
 def read_subtitle_area_from_config(video_path):
     import yaml
@@ -0,0 +1,706 @@
+"""
+性能基准测试工具，用于对比不同参数设置下各处理阶段的速度
+用法示例：
+    python backend/tools/benchmark.py --cpu detect-batch --video test/test2.mp4 --batch-sizes 1 2 4 8
+    python backend/tools/benchmark.py --cpu detect-sparse --intervals 5 10
+    python backend/tools/benchmark.py detection-store --frames 200000
+    python backend/tools/benchmark.py box-tracks --frames 20000
+    python backend/tools/benchmark.py interval-index --intervals 5000
+    python backend/tools/benchmark.py sttn-strips --strips 2
+    python backend/tools/benchmark.py sttn-preprocess --max-frames 50
+    python backend/tools/benchmark.py --cpu sttn-accumulate --frames 50
+    python backend/tools/benchmark.py --cpu sttn-attention --frames 10 20 40
+    python backend/tools/benchmark.py composite --width 3840 --height 2160
+    python backend/tools/benchmark.py --cpu sttn-backends --frames 10 20 --threads 4
+    python backend/tools/benchmark.py --cpu lama-crop --video test/test2.mp4 --frames 5
+    python backend/tools/benchmark.py --cpu lama-backends --video test/test2.mp4 --frames 5 --threads 4
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+TEST_VIDEO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'test', 'test2.mp4')
+
+
+def read_video_frames(video_path, max_frames=None):
+    """
+    读取视频帧到内存中，避免解码耗时影响推理速度的统计
+    """
+    video_cap = cv2.VideoCapture(video_path)
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        ret, frame = video_cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    video_cap.release()
+    return frames
+
+
+def benchmark_detect_batch(args):
+    """
+    统计不同批次大小下字幕检测的速度(frames/s)
+    """
+    from backend.main import SubtitleDetect
+    frames = read_video_frames(args.video, args.max_frames)
+    sub_detector = SubtitleDetect(args.video)
+    # 预热，排除模型加载与首次推理的耗时
+    sub_detector.detect_subtitle_batch(frames[:1])
+    print(f'frames: {len(frames)}, size: {frames[0].shape[1]}x{frames[0].shape[0]}')
+    for batch_size in args.batch_sizes:
+        start = time.time()
+        for i in range(0, len(frames), batch_size):
+            sub_detector.detect_subtitle_batch(frames[i:i + batch_size])
+        cost = time.time() - start
+        print(f'batch size: {batch_size:>3}, time cost: {cost:.2f}s, speed: {len(frames) / cost:.2f} frames/s')
+
+
+def benchmark_detect_sparse(args):
+    """
+    对比稀疏采样检测与逐帧检测的速度与精度
+    精度按帧统计：两种方式得到的文本框集合一致的帧所占比例
+    """
+    from backend.main import SubtitleDetect, config
+    # 关闭检测缓存，否则第二次起的检测直接读取缓存，无法测出实际耗时
+    config.DETECTION_CACHE_ENABLED = False
+    sub_detector = SubtitleDetect(args.video)
+    # 预热，排除模型加载与首次推理的耗时
+    sub_detector.detect_subtitle_batch(read_video_frames(args.video, 1))
+    results = {}
+    for sample_interval in [1] + args.intervals:
+        config.SUBTITLE_DETECT_SAMPLE_INTERVAL = sample_interval
+        start = time.time()
+        results[sample_interval] = sub_detector.find_subtitle_frame_no()
+        cost = time.time() - start
+        dense = results[1]
+        frame_count = sub_detector.stats['frames']
+        matched = sum(1 for frame_no in range(1, frame_count + 1)
+                      if sub_detector.are_same_boxes(dense.get(frame_no, []), results[sample_interval].get(frame_no, [])))
+        ranges = SubtitleDetect.find_continuous_ranges(results[sample_interval]) if results[sample_interval] else []
+        print(f'interval: {sample_interval:>3}, time cost: {cost:.2f}s, '
+              f'detected frames: {sub_detector.stats["detected"]}/{frame_count}, '
+              f'frame accuracy: {100 * matched / max(frame_count, 1):.2f}%, subtitle ranges: {len(ranges)}')
+
+
+def make_synthetic_detections(frame_count, seed=0, jitter=3):
+    """
+    生成合成的字幕检测结果：字幕每隔1-5秒切换一次，约20%的帧没有字幕，每帧1-2行文本框
+    :param jitter 检测框坐标随机抖动的最大像素数
+    :return (帧号数组, 坐标数组)
+    """
+    rng = np.random.default_rng(seed)
+    frame_no_list, box_list = [], []
+    frame_no = 1
+    while frame_no <= frame_count:
+        duration = int(rng.integers(25, 125))
+        if rng.random() < 0.8:
+            lines = int(rng.integers(1, 3))
+            boxes = [(int(rng.integers(200, 600)), int(rng.integers(1300, 1700)), 900 + 60 * line, 950 + 60 * line)
+                     for line in range(lines)]
+            for current_no in range(frame_no, min(frame_no + duration, frame_count + 1)):
+                # 模拟检测框的抖动
+                for box in boxes:
+                    frame_no_list.append(current_no)
+                    box_list.append([value + int(rng.integers(-jitter, jitter + 1)) for value in box])
+        frame_no += duration
+    return np.array(frame_no_list, dtype=np.int32), np.array(box_list, dtype=np.int32).reshape(-1, 4)
+
+
+def benchmark_detection_store(args):
+    """
+    对比 {帧号: 文本框列表} 字典与列式存储DetectionStore的内存占用与常用操作的耗时
+    """
+    from backend.tools.detection_store import DetectionStore, DetectionStoreBuilder
+    frame_no, boxes = make_synthetic_detections(args.frames)
+    starts = np.flatnonzero(np.r_[True, frame_no[1:] != frame_no[:-1]])
+    ends = np.r_[starts[1:], len(frame_no)]
+    print(f'frames: {args.frames}, frames with subtitles: {len(starts)}, boxes: {len(frame_no)}')
+
+    def build_dict():
+        subtitle_frame_no_box_dict = {}
+        for start, end in zip(starts, ends):
+            subtitle_frame_no_box_dict[int(frame_no[start])] = [tuple(box) for box in boxes[start:end].tolist()]
+        return subtitle_frame_no_box_dict
+
+    def build_store():
+        detection_builder = DetectionStoreBuilder()
+        for start, end in zip(starts, ends):
+            detection_builder.add(int(frame_no[start]), boxes[start:end])
+        return detection_builder.build()
+
+    for name, build in [('dict', build_dict), ('store', build_store)]:
+        tracemalloc.start()
+        start_time = time.time()
+        result = build()
+        build_time = time.time() - start_time
+        memory, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # 模拟SubtitleRemover中逐帧判断是否有字幕并读取文本框
+        start_time = time.time()
+        for current_no in range(1, args.frames + 1):
+            if current_no in result:
+                result[current_no]
+        lookup_time = time.time() - start_time
+        start_time = time.time()
+        sorted(result.keys())
+        keys_time = time.time() - start_time
+        print(f'{name:>5}: memory {memory / 1024 / 1024:.2f}MB (peak {peak / 1024 / 1024:.2f}MB), '
+              f'build {build_time:.3f}s, lookup {lookup_time:.3f}s, sorted keys {keys_time:.3f}s')
+        if name == 'dict':
+            expected = result
+    assert DetectionStore.from_dict(expected) == result and dict(result) == expected
+
+
+def benchmark_box_tracks(args):
+    """
+    对比box_tracks与原实现(tests/test_box_tracks.py中的LegacyBoxTracks)的耗时，结果一致性由该测试验证
+    检测结果可以来自字幕检测缓存文件(backend/cache/detection/*_subtitle_*.npz)，否则使用合成数据
+    """
+    from backend.main import SubtitleDetect, config
+    from backend.tools.detection_store import DetectionStore
+    from tests.test_box_tracks import LegacyBoxTracks
+    if args.cache:
+        with np.load(args.cache) as data:
+            raw_store = DetectionStore(data['frame_no'], data['boxes'])
+    else:
+        raw_store = DetectionStore(*make_synthetic_detections(args.frames, jitter=args.jitter))
+    raw_dict = dict(raw_store)
+    print(f'frames with subtitles: {len(raw_store)}, boxes: {len(raw_store.frame_no)}')
+    sub_detector = SubtitleDetect(TEST_VIDEO_PATH)
+    legacy = LegacyBoxTracks(config)
+    unified_dict, unified_store = run_timing_step('unify_regions', lambda: legacy.unify_regions(raw_dict),
+                                                  lambda: sub_detector.unify_regions(raw_store))
+    steps = [
+        ('find_continuous_ranges_with_same_mask',
+         lambda: legacy.find_continuous_ranges_with_same_mask(unified_dict),
+         lambda: sub_detector.find_continuous_ranges_with_same_mask(unified_store)),
+        ('get_subtitle_frame_no_box_dict_with_united_coordinates',
+         lambda: legacy.get_subtitle_frame_no_box_dict_with_united_coordinates(unified_dict),
+         lambda: sub_detector.get_subtitle_frame_no_box_dict_with_united_coordinates(unified_store)),
+    ]
+    for name, legacy_func, new_func in steps:
+        run_timing_step(name, legacy_func, new_func)
+    print(f'tracks: {len(np.unique(unified_store.track_id))}')
+
+
+def run_timing_step(name, legacy_func, new_func):
+    """
+    分别运行原实现与新实现并打印耗时
+    """
+    start_time = time.time()
+    legacy_result = legacy_func()
+    legacy_time = time.time() - start_time
+    start_time = time.time()
+    new_result = new_func()
+    new_time = time.time() - start_time
+    print(f'{name}: legacy {legacy_time:.3f}s, new {new_time:.3f}s')
+    return legacy_result, new_result
+
+
+def benchmark_interval_index(args):
+    """
+    对比IntervalIndex与原线性扫描实现的区间查询耗时，并验证结果一致
+    """
+    from backend.tools.interval_index import IntervalIndex
+    rng = np.random.default_rng(0)
+    # 生成互不重叠的字幕区间与场景切换点
+    lengths = rng.integers(1, 150, size=args.intervals)
+    gaps = rng.integers(1, 100, size=args.intervals)
+    starts = np.cumsum(gaps + np.r_[0, lengths[:-1]])
+    intervals = [(int(start), int(start + length - 1)) for start, length in zip(starts, lengths)]
+    frame_count = intervals[-1][1] + 100
+    points = sorted(set(rng.integers(1, frame_count, size=args.intervals // 2).tolist()))
+    queries = rng.integers(1, frame_count, size=args.queries).tolist()
+    print(f'intervals: {len(intervals)}, scene points: {len(points)}, frames: {frame_count}, queries: {len(queries)}')
+
+    def legacy_is_start(frame_no):
+        for start_no, end_no in intervals:
+            if start_no == frame_no:
+                return True
+        return False
+
+    def legacy_find_end(frame_no):
+        for start_no, end_no in intervals:
+            if start_no <= frame_no <= end_no:
+                return end_no
+        return -1
+
+    def legacy_split_range_by_scene():
+        result_intervals = []
+        for start, end in intervals:
+            for p in [p for p in points if start <= p <= end]:
+                if start < p:
+                    result_intervals.append((start, p - 1))
+                start = p
+            result_intervals.append((start, end))
+        return result_intervals
+
+    start_time = time.time()
+    interval_index = IntervalIndex(intervals)
+    build_time = time.time() - start_time
+    print(f'build index: {build_time * 1000:.2f}ms')
+    for name, legacy_func, new_func in [('is_start', legacy_is_start, interval_index.is_start),
+                                        ('find_end', legacy_find_end, interval_index.find_end)]:
+        start_time = time.time()
+        legacy_result = [legacy_func(frame_no) for frame_no in queries]
+        legacy_time = time.time() - start_time
+        start_time = time.time()
+        new_result = [new_func(frame_no) for frame_no in queries]
+        new_time = time.time() - start_time
+        print(f'{name:>15}: {"same" if legacy_result == new_result else "DIFFERENT"}, '
+              f'legacy {legacy_time / len(queries) * 1e6:.2f}us/query, index {new_time / len(queries) * 1e6:.2f}us/query')
+    start_time = time.time()
+    legacy_result = legacy_split_range_by_scene()
+    legacy_time = time.time() - start_time
+    start_time = time.time()
+    new_result = interval_index.split_by_points(points)
+    new_time = time.time() - start_time
+    print(f'{"split_by_scene":>15}: {"same" if legacy_result == new_result else "DIFFERENT"}, '
+          f'legacy {legacy_time * 1000:.2f}ms, index {new_time * 1000:.2f}ms')
+
+
+def benchmark_sttn_strips(args):
+    """
+    验证多个修复区域批量推理与逐区域推理的结果一致，并对比耗时
+    """
+    from backend.inpaint.sttn_inpaint import STTNInpaint
+    sttn_inpaint = STTNInpaint()
+    frames = read_video_frames(args.video, args.max_frames)
+    height = frames[0].shape[0]
+    split_h = int(frames[0].shape[1] * 3 / 16)
+    # 从底部向上依次取若干个修复区域
+    areas = [(max(0, height - (k + 1) * split_h), height - k * split_h) for k in range(args.strips)]
+    strip_frames = [[cv2.resize(frame[y0:y1], (sttn_inpaint.model_input_width, sttn_inpaint.model_input_height))
+                     for frame in frames] for y0, y1 in areas]
+    print(f'frames: {len(frames)}, strips: {len(areas)} {areas}')
+    # 预热
+    sttn_inpaint.inpaint(list(strip_frames[0][:sttn_inpaint.neighbor_stride]))
+    start_time = time.time()
+    sequential = [sttn_inpaint.inpaint(list(frames)) for frames in strip_frames]
+    sequential_time = time.time() - start_time
+    start_time = time.time()
+    batched = sttn_inpaint.inpaint_batch([list(frames) for frames in strip_frames])
+    batched_time = time.time() - start_time
+    max_diff = max(float(np.max(np.abs(np.asarray(a, dtype=np.float32) - np.asarray(b, dtype=np.float32))))
+                   for sequential_frames, batched_frames in zip(sequential, batched)
+                   for a, b in zip(sequential_frames, batched_frames))
+    print(f'sequential: {sequential_time:.2f}s, batched: {batched_time:.2f}s, max pixel difference: {max_diff:.2f}')
+
+
+def benchmark_sttn_preprocess(args):
+    """
+    对比STTN原预处理流程(deepcopy、逐帧cv2.resize、PIL转换)与张量预处理的耗时、内存分配与结果差异
+    tracemalloc只统计NumPy与PIL在主机上的分配，torch张量的分配在使用CUDA时由显存峰值统计
+    """
+    import copy
+    import torch
+    from torchvision import transforms
+    from backend.inpaint.sttn_inpaint import STTNInpaint
+    from backend.inpaint.utils.sttn_utils import Stack, ToTorchFormatTensor
+    # 原预处理流程使用的PIL转换
+    to_tensors = transforms.Compose([Stack(), ToTorchFormatTensor()])
+    sttn_inpaint = STTNInpaint()
+    frames = read_video_frames(args.video, args.max_frames)
+    height = frames[0].shape[0]
+    split_h = int(frames[0].shape[1] * 3 / 16)
+    inpaint_area = [(max(0, height - (k + 1) * split_h), height - k * split_h, 0, frames[0].shape[1]) for k in range(args.strips)]
+    print(f'frames: {len(frames)}, size: {frames[0].shape[1]}x{height}, strips: {len(inpaint_area)} {inpaint_area}')
+
+    def legacy_preprocess():
+        frames_hr = copy.deepcopy(frames)
+        frames_scaled = [[cv2.resize(frame[y0:y1], (sttn_inpaint.model_input_width, sttn_inpaint.model_input_height))
+                          for frame in frames_hr] for y0, y1, _, _ in inpaint_area]
+        feats = torch.stack([to_tensors(strip_frames) for strip_frames in frames_scaled]) * 2 - 1
+        return feats.to(sttn_inpaint.device)
+
+    def tensor_preprocess():
+        return sttn_inpaint.preprocess_strips(frames, inpaint_area)
+
+    results = {}
+    for name, preprocess in [('legacy', legacy_preprocess), ('tensor', tensor_preprocess)]:
+        # 预热
+        preprocess()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+        tracemalloc.start()
+        start_time = time.time()
+        for _ in range(args.repeat):
+            results[name] = preprocess()
+        if torch.cuda.is_available():
+            torch.cuda.synchronize()
+        cost = (time.time() - start_time) / args.repeat
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        device_peak = f', device peak {torch.cuda.max_memory_allocated() / 1024 / 1024:.2f}MB' if torch.cuda.is_available() else ''
+        print(f'{name:>6}: {cost * 1000:.2f}ms/batch, host peak {peak / 1024 / 1024:.2f}MB{device_peak}')
+    # 两种方式的差异来自cv2.resize对缩放结果的取整，正常情况下不超过半个像素值
+    max_diff = float(torch.max(torch.abs(results['legacy'] - results['tensor'])))
+    print(f'max difference: {max_diff:.4f} ({max_diff * 127.5:.2f} pixel values)')
+
+
+def benchmark_sttn_accumulate(args):
+    """
+    对比STTN补全窗口的原合成方式(逐窗口拷贝回主机、逐帧转换并混合)与设备上累加的耗时和主机内存分配
+    模型输出使用随机张量代替，只统计合成部分；tracemalloc只统计NumPy的分配，不包含torch张量
+    """
+    import torch
+    from backend import config
+    from backend.inpaint.sttn_inpaint import CompletionAccumulator
+    height, width = 120, 640
+    neighbor_stride = config.STTN_NEIGHBOR_STRIDE
+    windows = []
+    for f in range(0, args.frames, neighbor_stride):
+        start, end = max(0, f - neighbor_stride), min(args.frames, f + neighbor_stride + 1)
+        windows.append((start, torch.rand(args.strips, end - start, 3, height, width, device=config.device) * 2 - 1))
+    print(f'frames: {args.frames}, strips: {args.strips}, windows: {len(windows)}, device: {config.device}')
+
+    def legacy_accumulate():
+        comp_frames = [[None] * args.frames for _ in range(args.strips)]
+        for start, pred_img in windows:
+            pred_img = (pred_img.reshape(-1, 3, height, width) + 1) / 2
+            pred_img = pred_img.cpu().permute(0, 2, 3, 1).numpy() * 255
+            pred_img = pred_img.reshape(args.strips, -1, *pred_img.shape[1:])
+            for k in range(args.strips):
+                for i in range(pred_img.shape[1]):
+                    img = np.array(pred_img[k, i]).astype(np.uint8)
+                    if comp_frames[k][start + i] is None:
+                        comp_frames[k][start + i] = img
+                    else:
+                        comp_frames[k][start + i] = comp_frames[k][start + i].astype(np.float32) * 0.5 + img.astype(np.float32) * 0.5
+        return comp_frames
+
+    def device_accumulate():
+        accumulator = CompletionAccumulator(args.strips, args.frames, height, width, config.device)
+        for start, pred_img in windows:
+            accumulator.add(start, pred_img)
+        return accumulator.result()
+
+    results = {}
+    for name, accumulate, transfers in [('legacy', legacy_accumulate, len(windows)), ('device', device_accumulate, 1)]:
+        # 预热
+        accumulate()
+        tracemalloc.start()
+        start_time = time.time()
+        results[name] = accumulate()
+        cost = time.time() - start_time
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{name:>6}: {cost / args.frames * 1000:.2f}ms/frame, host peak {peak / 1024 / 1024:.2f}MB, '
+              f'device to host transfers: {transfers}')
+    # 原实现对重叠帧按0.5权重依次混合，新实现取平均值，两者在重叠帧上会有差异
+    max_diff = max(float(np.max(np.abs(np.asarray(a, dtype=np.float32) - np.asarray(b, dtype=np.float32))))
+                   for legacy_frames, device_frames in zip(results['legacy'], results['device'])
+                   for a, b in zip(legacy_frames, device_frames))
+    print(f'max pixel difference: {max_diff:.2f}')
+
+
+def run_sttn_attention(backend, frame_count, chunk_size, seed=0):
+    """
+    在独立进程中用随机初始化的STTN生成器运行一次Transformer推理，返回耗时与推理期间新增的峰值内存(MB)
+    """
+    import resource
+    import torch
+    from backend.inpaint.sttn.auto_sttn import InpaintGenerator
+    torch.manual_seed(seed)
+    model = InpaintGenerator().eval()
+    model.set_attention_backend(backend, chunk_size)
+    feat = torch.randn(frame_count, 256, 30, 160)
+    with torch.no_grad():
+        # 预热
+        model.infer(feat[:1])
+        # Linux上ru_maxrss的单位为KB
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_time = time.time()
+        model.infer(feat)
+        cost = time.time() - start_time
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return cost, (peak - baseline) / 1024
+
+
+def benchmark_sttn_attention(args):
+    """
+    对比STTN各注意力实现在CPU上随帧数变化的耗时与峰值内存，并验证输出一致
+    每次测试在新进程中进行，峰值内存按进程常驻内存的最大值统计
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    import torch
+    from backend.inpaint.sttn.auto_sttn import InpaintGenerator
+    torch.manual_seed(0)
+    model = InpaintGenerator().eval()
+    feat = torch.randn(min(args.frames), 256, 30, 160)
+    outputs = {}
+    with torch.no_grad():
+        for backend in args.backends:
+            model.set_attention_backend(backend, args.chunk_size)
+            outputs[backend] = model.infer(feat)
+    for backend in args.backends:
+        max_diff = float(torch.max(torch.abs(outputs[backend] - outputs[args.backends[0]])))
+        print(f'{backend:>8}: max difference to {args.backends[0]}: {max_diff:.2e}')
+    for frame_count in args.frames:
+        for backend in args.backends:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                cost, peak = executor.submit(run_sttn_attention, backend, frame_count, args.chunk_size).result()
+            print(f'frames: {frame_count:>3}, {backend:>8}: {cost:.2f}s, peak memory {peak:.0f}MB')
+
+
+def benchmark_sttn_backends(args):
+    """
+    对比STTN生成器在CPU上使用PyTorch(eager)、TorchScript与ONNX Runtime推理的耗时，并验证输出一致
+    使用随机初始化的生成器，ONNX模型导出到临时目录
+    """
+    import tempfile
+    import torch
+    from backend.inpaint.sttn.auto_sttn import InpaintGenerator
+    from backend.inpaint.sttn_onnx import TransformerWrapper, export_onnx, OnnxInpaintGenerator
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    model = InpaintGenerator().eval()
+    model.set_attention_backend('math')
+    frames = torch.randn(max(args.frames), 3, 120, 640)
+    with torch.no_grad():
+        feats = model.encoder(frames[:2])
+        scripted = {'encoder': torch.jit.freeze(torch.jit.trace(model.encoder, frames[:2])),
+                    'transformer': torch.jit.freeze(torch.jit.trace(TransformerWrapper(model).eval(), feats[None])),
+                    'decoder': torch.jit.freeze(torch.jit.trace(model.decoder, feats))}
+
+    def run_eager(x):
+        enc = model.encoder(x)
+        return model.decoder(model.infer(enc))
+
+    def run_torchscript(x):
+        enc = scripted['encoder'](x)
+        return scripted['decoder'](scripted['transformer'](enc[None])[0])
+
+    with tempfile.TemporaryDirectory() as onnx_dir:
+        export_onnx(model, onnx_dir)
+        onnx_model = OnnxInpaintGenerator('cpu', onnx_dir, providers=['CPUExecutionProvider'],
+                                          intra_op_threads=args.threads)
+
+        def run_onnx(x):
+            enc = onnx_model.encoder(x)
+            return onnx_model.decoder(onnx_model.infer(enc))
+
+        for frame_count in args.frames:
+            x = frames[:frame_count]
+            outputs = {}
+            for name, run in [('eager', run_eager), ('torchscript', run_torchscript), ('onnx', run_onnx)]:
+                with torch.no_grad():
+                    # 预热
+                    run(x)
+                    start_time = time.time()
+                    for _ in range(args.repeat):
+                        outputs[name] = run(x)
+                    cost = (time.time() - start_time) / args.repeat
+                max_diff = float(torch.max(torch.abs(outputs[name] - outputs['eager'])))
+                print(f'frames: {frame_count:>3}, {name:>11}: {cost:.2f}s, max difference to eager: {max_diff:.2e}')
+
+
+def benchmark_composite(args):
+    """
+    对比STTN原合成方式(整个修复区域缩放后做浮点混合)与MaskCompositor的耗时，并验证结果一致
+    """
+    from backend.tools.mask_composite import MaskCompositor
+    rng = np.random.default_rng(0)
+    width, height = args.width, args.height
+    split_h = int(width * 3 / 16)
+    area = (height - split_h, height, 0, width)
+    # 底部居中的一行字幕
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.rectangle(mask, (width // 4, height - split_h // 2), (width * 3 // 4, height - split_h // 4), 255, thickness=-1)
+    _, binary_mask = cv2.threshold(mask, 127, 1, cv2.THRESH_BINARY)
+    binary_mask = binary_mask[:, :, None]
+    frames = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(args.frames)]
+    comps = [rng.integers(0, 256, (120, 640, 3), dtype=np.uint8) for _ in range(args.frames)]
+    print(f'frames: {args.frames}, size: {width}x{height}, mask pixels: {int(binary_mask.sum())}')
+
+    def legacy_composite():
+        results = []
+        for frame, comp in zip(frames, comps):
+            frame = frame.copy()
+            comp = cv2.resize(comp, (width, split_h))
+            comp = cv2.cvtColor(np.array(comp).astype(np.uint8), cv2.COLOR_BGR2RGB)
+            mask_area = binary_mask[area[0]:area[1], :]
+            frame[area[0]:area[1], :, :] = mask_area * comp + (1 - mask_area) * frame[area[0]:area[1], :, :]
+            results.append(frame)
+        return results
+
+    def mask_composite():
+        compositor = MaskCompositor(binary_mask)
+        return [compositor.composite(frame.copy(), comp, area, rgb=True) for frame, comp in zip(frames, comps)]
+
+    results = {}
+    for name, composite in [('legacy', legacy_composite), ('mask', mask_composite)]:
+        start_time = time.time()
+        results[name] = composite()
+        cost = time.time() - start_time
+        print(f'{name:>6}: {cost / args.frames * 1000:.2f}ms/frame')
+    # 缩放时插值系数的取整方式不同，个别像素可能相差1
+    max_diff = max(int(np.max(np.abs(a.astype(np.int16) - b.astype(np.int16)))) for a, b in zip(results['legacy'], results['mask']))
+    print(f'max pixel difference: {max_diff}')
+
+
+def benchmark_lama_crop(args):
+    """
+    对比LaMa整帧推理与按mask局部区域推理在720p、1080p与4K下的吞吐量(frames/s)，以及两者在mask内的平均像素差
+    """
+    import torch
+    from backend.inpaint.lama_inpaint import LamaInpaint
+    frames = read_video_frames(args.video, args.frames)
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    lama_inpaint = LamaInpaint(device)
+    print(f'device: {device}, frames: {len(frames)}, margin: {lama_inpaint.crop_margin}')
+    for width, height in [(1280, 720), (1920, 1080), (3840, 2160)]:
+        resized_frames = [cv2.resize(frame, (width, height)) for frame in frames]
+        # 底部居中的一行字幕
+        split_h = int(width * 3 / 16)
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.rectangle(mask, (width // 4, height - split_h // 2), (width * 3 // 4, height - split_h // 4), 255, thickness=-1)
+        results = {}
+        for name, crop_inference in [('full', False), ('crop', True)]:
+            lama_inpaint.crop_inference = crop_inference
+            # 预热
+            lama_inpaint(resized_frames[0], mask)
+            start_time = time.time()
+            results[name] = [lama_inpaint(frame, mask) for frame in resized_frames]
+            cost = time.time() - start_time
+            print(f'{width}x{height} {name:>4}: {len(resized_frames) / cost:.2f} frames/s')
+        mask_pixels = mask > 0
+        mean_diff = np.mean([np.abs(a[mask_pixels].astype(np.float32) - b[mask_pixels].astype(np.float32)).mean()
+                             for a, b in zip(results['full'], results['crop'])])
+        print(f'{width}x{height} mean pixel difference inside mask: {mean_diff:.2f}')
+
+
+def benchmark_lama_backends(args):
+    """
+    对比LaMa使用TorchScript、ONNX Runtime(fp32)与ONNX Runtime(int8)在CPU上的吞吐量(frames/s)，
+    并以TorchScript的结果为基准计算mask内的PSNR
+    """
+    import torch
+    from backend.inpaint.lama_inpaint import LamaInpaint
+    from backend.inpaint.lama_onnx import OnnxLamaModel, convert, psnr
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+    device = torch.device('cpu')
+    lama_inpaint = LamaInpaint(device)
+    models = {'torch': lama_inpaint.model}
+    for name, precision in [('onnx', 'fp32'), ('onnx-int8', 'int8')]:
+        models[name] = OnnxLamaModel(convert(precision), device, providers=['CPUExecutionProvider'],
+                                     intra_op_threads=args.threads)
+    for width, height in [(1280, 720), (1920, 1080)]:
+        frames = [cv2.resize(frame, (width, height)) for frame in read_video_frames(args.video, args.frames)]
+        # 底部居中的一行字幕
+        split_h = int(width * 3 / 16)
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.rectangle(mask, (width // 4, height - split_h // 2), (width * 3 // 4, height - split_h // 4), 255, thickness=-1)
+        mask_pixels = mask > 0
+        results = {}
+        for name, model in models.items():
+            lama_inpaint.model = model
+            # 预热
+            lama_inpaint(frames[0], mask)
+            start_time = time.time()
+            results[name] = lama_inpaint.inpaint_batch(frames, mask)
+            cost = time.time() - start_time
+            quality = psnr([frame[mask_pixels] for frame in results['torch']], [frame[mask_pixels] for frame in results[name]])
+            print(f'{width}x{height} {name:>9}: {len(frames) / cost:.2f} frames/s, PSNR to torch inside mask: {quality:.2f}dB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能基准测试")
+    parser.add_argument("--cpu", action="store_true", help="屏蔽GPU，仅使用CPU进行测试")
+    sub_parsers = parser.add_subparsers(dest="command", required=True)
+
+    detect_batch_parser = sub_parsers.add_parser("detect-batch", help="字幕检测批次大小与速度的关系")
+    detect_batch_parser.add_argument("--video", default=TEST_VIDEO_PATH, help="测试视频路径")
+    detect_batch_parser.add_argument("--max-frames", type=int, default=200, help="参与测试的最大帧数")
+    detect_batch_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="待测试的批次大小")
+    detect_batch_parser.set_defaults(func=benchmark_detect_batch)
+
+    detect_sparse_parser = sub_parsers.add_parser("detect-sparse", help="稀疏采样检测与逐帧检测的速度与精度对比")
+    detect_sparse_parser.add_argument("--video", default=TEST_VIDEO_PATH, help="测试视频路径")
+    detect_sparse_parser.add_argument("--intervals", type=int, nargs="+", default=[2, 5, 10, 15], help="待测试的采样间隔")
+    detect_sparse_parser.set_defaults(func=benchmark_detect_sparse)
+
+    detection_store_parser = sub_parsers.add_parser("detection-store", help="字典与列式存储检测结果的内存与耗时对比")
+    detection_store_parser.add_argument("--frames", type=int, default=200000, help="合成检测结果的帧数")
+    detection_store_parser.set_defaults(func=benchmark_detection_store)
+
+    box_tracks_parser = sub_parsers.add_parser("box-tracks", help="文本框统一与区间计算的原实现与新实现的耗时对比")
+    box_tracks_parser.add_argument("--cache", help="字幕检测缓存文件路径，不指定时使用合成数据")
+    box_tracks_parser.add_argument("--frames", type=int, default=20000, help="合成检测结果的帧数")
+    box_tracks_parser.add_argument("--jitter", type=int, default=25, help="合成检测框坐标随机抖动的最大像素数")
+    box_tracks_parser.set_defaults(func=benchmark_box_tracks)
+
+    interval_index_parser = sub_parsers.add_parser("interval-index", help="区间索引与线性扫描的查询耗时对比")
+    interval_index_parser.add_argument("--intervals", type=int, default=5000, help="字幕区间数量")
+    interval_index_parser.add_argument("--queries", type=int, default=2000, help="查询次数")
+    interval_index_parser.set_defaults(func=benchmark_interval_index)
+
+    sttn_strips_parser = sub_parsers.add_parser("sttn-strips", help="STTN多区域批量推理与逐区域推理的结果与耗时对比")
+    sttn_strips_parser.add_argument("--video", default=TEST_VIDEO_PATH, help="测试视频路径")
+    sttn_strips_parser.add_argument("--max-frames", type=int, default=50, help="参与测试的最大帧数")
+    sttn_strips_parser.add_argument("--strips", type=int, default=2, help="修复区域数量")
+    sttn_strips_parser.set_defaults(func=benchmark_sttn_strips)
+
+    sttn_preprocess_parser = sub_parsers.add_parser("sttn-preprocess", help="STTN原预处理流程与张量预处理的耗时与内存对比")
+    sttn_preprocess_parser.add_argument("--video", default=TEST_VIDEO_PATH, help="测试视频路径")
+    sttn_preprocess_parser.add_argument("--max-frames", type=int, default=50, help="参与测试的最大帧数")
+    sttn_preprocess_parser.add_argument("--strips", type=int, default=1, help="修复区域数量")
+    sttn_preprocess_parser.add_argument("--repeat", type=int, default=5, help="重复次数")
+    sttn_preprocess_parser.set_defaults(func=benchmark_sttn_preprocess)
+
+    sttn_accumulate_parser = sub_parsers.add_parser("sttn-accumulate", help="STTN补全窗口在主机上逐帧混合与设备上累加的耗时与内存对比")
+    sttn_accumulate_parser.add_argument("--frames", type=int, default=50, help="帧数")
+    sttn_accumulate_parser.add_argument("--strips", type=int, default=1, help="修复区域数量")
+    sttn_accumulate_parser.set_defaults(func=benchmark_sttn_accumulate)
+
+    sttn_attention_parser = sub_parsers.add_parser("sttn-attention", help="STTN各注意力实现随帧数变化的耗时与峰值内存对比")
+    sttn_attention_parser.add_argument("--frames", type=int, nargs="+", default=[10, 20, 40], help="待测试的帧数")
+    sttn_attention_parser.add_argument("--backends", nargs="+", default=['math', 'sdpa', 'chunked'], help="待测试的注意力实现")
+    sttn_attention_parser.add_argument("--chunk-size", type=int, default=1024, help="chunked实现每块的查询数量")
+    sttn_attention_parser.set_defaults(func=benchmark_sttn_attention)
+
+    sttn_backends_parser = sub_parsers.add_parser("sttn-backends", help="STTN生成器使用PyTorch、TorchScript与ONNX Runtime推理的耗时对比")
+    sttn_backends_parser.add_argument("--frames", type=int, nargs="+", default=[10, 20], help="待测试的帧数")
+    sttn_backends_parser.add_argument("--threads", type=int, default=0, help="推理线程数，0为默认值")
+    sttn_backends_parser.add_argument("--repeat", type=int, default=3, help="重复次数")
+    sttn_backends_parser.set_defaults(func=benchmark_sttn_backends)
+
+    composite_parser = sub_parsers.add_parser("composite", help="修复结果整区域浮点混合与按mask外接矩形合成的耗时对比")
+    composite_parser.add_argument("--width", type=int, default=3840, help="视频宽度")
+    composite_parser.add_argument("--height", type=int, default=2160, help="视频高度")
+    composite_parser.add_argument("--frames", type=int, default=20, help="帧数")
+    composite_parser.set_defaults(func=benchmark_composite)
+
+    lama_crop_parser = sub_parsers.add_parser("lama-crop", help="LaMa整帧推理与按mask局部区域推理的吞吐量对比")
+    lama_crop_parser.add_argument("--video", default=TEST_VIDEO_PATH, help="测试视频路径")
+    lama_crop_parser.add_argument("--frames", type=int, default=5, help="每种分辨率参与测试的帧数")
+    lama_crop_parser.set_defaults(func=benchmark_lama_crop)
+
+    lama_backends_parser = sub_parsers.add_parser("lama-backends", help="LaMa使用TorchScript与ONNX Runtime(fp32/int8)在CPU上的吞吐量与PSNR对比")
+    lama_backends_parser.add_argument("--video", default=TEST_VIDEO_PATH, help="测试视频路径")
+    lama_backends_parser.add_argument("--frames", type=int, default=5, help="每种分辨率参与测试的帧数")
+    lama_backends_parser.add_argument("--threads", type=int, default=0, help="推理线程数，0为默认值")
+    lama_backends_parser.set_defaults(func=benchmark_lama_backends)
+
+    args = parser.parse_args()
+    if args.cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    # paddleocr会解析命令行参数，这里清空以免与本工具的参数冲突
+    sys.argv = sys.argv[:1]
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
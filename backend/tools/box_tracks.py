@@ -0,0 +1,257 @@
+"""
+字幕文本框的时序跟踪
+将相邻帧中位置相近的文本框关联为轨迹，统一轨迹内的文本框坐标，并计算文本框完全一致的连续帧区间
+所有计算都基于DetectionStore的数组完成，避免逐帧逐框的Python循环与shapely多边形运算
+"""
+import numpy as np
+
+from backend.tools.detection_store import DetectionStore
+
+
+def normalize_boxes(boxes):
+    """
+    将 (xmin, xmax, ymin, ymax) 坐标数组规范为 xmin <= xmax, ymin <= ymax 的int64数组
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    x = np.sort(boxes[:, :2], axis=1)
+    y = np.sort(boxes[:, 2:], axis=1)
+    return np.concatenate([x, y], axis=1)
+
+
+def box_areas(boxes):
+    boxes = normalize_boxes(boxes)
+    return (boxes[:, 1] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 2])
+
+
+def box_intersection_matrix(boxes1, boxes2):
+    """
+    计算两组文本框两两之间的相交面积，文本框视为闭区域，边缘或顶点接触也算相交(相交面积为0)
+    :return (相交面积矩阵, 是否相交矩阵)，形状均为 (len(boxes1), len(boxes2))
+    """
+    boxes1, boxes2 = normalize_boxes(boxes1)[:, None, :], normalize_boxes(boxes2)[None, :, :]
+    width = np.minimum(boxes1[..., 1], boxes2[..., 1]) - np.maximum(boxes1[..., 0], boxes2[..., 0])
+    height = np.minimum(boxes1[..., 3], boxes2[..., 3]) - np.maximum(boxes1[..., 2], boxes2[..., 2])
+    overlap = (width >= 0) & (height >= 0)
+    return np.where(overlap, width * height, 0), overlap
+
+
+def box_iou_matrix(boxes1, boxes2):
+    """
+    计算两组文本框两两之间的IoU，与原shapely实现一致：不相交时为-1，并集面积为0时为0
+    """
+    intersection, overlap = box_intersection_matrix(boxes1, boxes2)
+    union = box_areas(boxes1)[:, None] + box_areas(boxes2)[None, :] - intersection
+    iou = np.divide(intersection, union, out=np.zeros(intersection.shape, dtype=np.float64), where=union > 0)
+    return np.where(overlap, iou, -1.0)
+
+
+def boxes_intersect(box1, box2):
+    """
+    判断两个文本框是否相交(包括边缘接触)，用于逐框判断的场景，避免创建数组的开销
+    """
+    xmin1, xmax1 = sorted(box1[:2])
+    ymin1, ymax1 = sorted(box1[2:])
+    xmin2, xmax2 = sorted(box2[:2])
+    ymin2, ymax2 = sorted(box2[2:])
+    return max(xmin1, xmin2) <= min(xmax1, xmax2) and max(ymin1, ymin2) <= min(ymax1, ymax2)
+
+
+def get_frame_layout(store):
+    """
+    获取每一帧文本框在数组中的起止位置
+    :return (有文本框的帧号数组, 起始位置数组, 文本框数量数组)
+    """
+    frames = store.frames
+    starts = store.offsets[frames].astype(np.int64)
+    counts = store.offsets[frames + 1].astype(np.int64) - starts
+    return frames, starts, counts
+
+
+def link_tracks(store, tolerance_x, tolerance_y):
+    """
+    将相邻帧中同一位置(帧内序号相同)的文本框关联为轨迹，并统一轨迹内的坐标
+    与原unify_regions的逻辑一致：轨迹的锚点为第一个文本框，后续文本框与锚点的偏差在容差内时使用锚点坐标，
+    超出容差时以当前文本框作为新锚点，开始新的轨迹(滞后判断，文本框缓慢漂移时不会每帧都切换坐标)
+    :return DetectionStore 统一后的坐标，track_id为轨迹编号(按首次出现的顺序从0开始)
+    """
+    box_count = len(store.frame_no)
+    if box_count == 0:
+        return DetectionStore()
+    frames, starts, counts = get_frame_layout(store)
+    frame_index = np.repeat(np.arange(len(frames)), counts)
+    slot = np.arange(box_count) - starts[frame_index]
+    # 前一个有文本框的帧在同一序号上有文本框时才与之关联
+    has_prev = np.zeros(box_count, dtype=bool)
+    has_prev[frame_index > 0] = counts[frame_index[frame_index > 0] - 1] > slot[frame_index > 0]
+    # 按 (帧内序号, 帧) 排序后，同一条关联链上的文本框连续存放
+    order = np.lexsort((frame_index, slot))
+    boxes = store.boxes[order].astype(np.int64)
+    chain_start = ~has_prev[order]
+    tolerance = np.array([tolerance_x, tolerance_x, tolerance_y, tolerance_y])
+    # similar_next[i]表示第i+1个文本框与第i个文本框在同一关联链上且相似，为False时第i个文本框如果是锚点则只包含它自己
+    similar_next = np.zeros(box_count, dtype=bool)
+    similar_next[:-1] = ~chain_start[1:] & np.all(np.abs(np.diff(boxes, axis=0)) <= tolerance, axis=1)
+    candidates = np.flatnonzero(similar_next)
+    # 只包含一个文本框的轨迹坐标不变，只需要对可能包含多个文本框的锚点向后查找
+    unified = boxes.copy()
+    is_anchor = np.ones(box_count, dtype=bool)
+    i = 0
+    while True:
+        k = int(np.searchsorted(candidates, i))
+        if k >= len(candidates):
+            break
+        i = int(candidates[k])
+        anchor = boxes[i]
+        # 按倍增的窗口向后查找第一个与锚点不相似或者开始新关联链的位置
+        end = box_count
+        position, window = i + 2, 16
+        while position < box_count:
+            stop = min(box_count, position + window)
+            breaks = chain_start[position:stop] | np.any(np.abs(boxes[position:stop] - anchor) > tolerance, axis=1)
+            hits = np.flatnonzero(breaks)
+            if len(hits) > 0:
+                end = position + int(hits[0])
+                break
+            position, window = stop, window * 2
+        unified[i:end] = anchor
+        is_anchor[i + 1:end] = False
+        i = end
+    track_id = np.cumsum(is_anchor) - 1
+    # 按首次出现的位置重新编号
+    result_boxes = np.empty_like(unified)
+    result_boxes[order] = unified
+    result_track_id = np.empty_like(track_id)
+    result_track_id[order] = track_id
+    _, first_index = np.unique(result_track_id, return_index=True)
+    rank = np.empty(len(first_index), dtype=np.int64)
+    rank[np.argsort(first_index, kind='stable')] = np.arange(len(first_index))
+    return DetectionStore(store.frame_no, result_boxes, rank[result_track_id])
+
+
+def get_continuous_ranges(store):
+    """
+    获取字幕出现的连续帧区间
+    :return [(起始帧号, 结束帧号)]
+    """
+    frames = store.frames
+    if len(frames) == 0:
+        return []
+    range_starts = np.flatnonzero(np.r_[True, np.diff(frames) != 1])
+    range_ends = np.r_[range_starts[1:] - 1, len(frames) - 1]
+    return list(zip(frames[range_starts].tolist(), frames[range_ends].tolist()))
+
+
+def get_same_mask_ranges(store):
+    """
+    获取文本框完全一致(数量、顺序与坐标都相同)的连续帧区间
+    :return [(起始帧号, 结束帧号)]
+    """
+    frames, starts, counts = get_frame_layout(store)
+    if len(frames) == 0:
+        return []
+    frame_count = len(frames)
+    new_range = np.ones(frame_count, dtype=bool)
+    new_range[1:] = (np.diff(frames) != 1) | (counts[1:] != counts[:-1])
+    # 与前一帧帧号连续且文本框数量相同的帧，逐框比较坐标
+    compare_frames = np.flatnonzero(~new_range)
+    if len(compare_frames) > 0:
+        compare_counts = counts[compare_frames]
+        box_frame = np.repeat(compare_frames, compare_counts)
+        # 文本框在所在帧内的序号
+        slot = np.arange(len(box_frame)) - np.repeat(np.cumsum(compare_counts) - compare_counts, compare_counts)
+        box_index = starts[box_frame] + slot
+        prev_box_index = starts[box_frame - 1] + slot
+        differ = np.any(store.boxes[box_index] != store.boxes[prev_box_index], axis=1)
+        new_range |= np.bincount(box_frame, weights=differ, minlength=frame_count) > 0
+    range_starts = np.flatnonzero(new_range)
+    range_ends = np.r_[range_starts[1:] - 1, frame_count - 1]
+    return list(zip(frames[range_starts].tolist(), frames[range_ends].tolist()))
+
+
+def update_area_max_boxes(area_max_box_list, boxes, threshold_height_difference):
+    """
+    用一帧的文本框更新区间最大文本框列表(原地修改)，逻辑与原get_area_max_box_dict中对单帧的处理一致
+    :param area_max_box_list 区间最大文本框列表 [{'area', 'xmin', 'xmax', 'ymin', 'ymax'}]
+    :param boxes 当前帧的文本框列表 [(xmin, xmax, ymin, ymax)]
+    :return 列表是否发生了变化
+    """
+    changed = False
+    for xmin, xmax, ymin, ymax in boxes:
+        current_area = abs(xmax - xmin) * abs(ymax - ymin)
+        if len(area_max_box_list) < 1:
+            area_max_box_list.append({'area': current_area, 'xmin': xmin, 'xmax': xmax, 'ymin': ymin, 'ymax': ymax})
+            changed = True
+            continue
+        has_same_position = False
+        # 当前文本框与某个区间最大文本框位于同一行且相交时，认为是同一行字幕，面积更大时更新该行的最大文本框
+        for area_max_box in area_max_box_list:
+            if (area_max_box['ymin'] - threshold_height_difference <= ymin
+                    and ymax <= area_max_box['ymax'] + threshold_height_difference):
+                if boxes_intersect((xmin, xmax, ymin, ymax), (area_max_box['xmin'], area_max_box['xmax'],
+                                                              area_max_box['ymin'], area_max_box['ymax'])):
+                    if abs(abs(area_max_box['ymax'] - area_max_box['ymin']) - abs(ymax - ymin)) < threshold_height_difference:
+                        has_same_position = True
+                    if has_same_position and current_area > area_max_box['area']:
+                        area_max_box.update(area=current_area, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax)
+                        changed = True
+        # 新的一行字幕，加入列表后不再处理该帧剩余的文本框
+        if not has_same_position:
+            new_large_area = {'area': current_area, 'xmin': xmin, 'xmax': xmax, 'ymin': ymin, 'ymax': ymax}
+            if new_large_area not in area_max_box_list:
+                area_max_box_list.append(new_large_area)
+                changed = True
+                break
+    return changed
+
+
+def get_area_max_boxes(store, ranges, threshold_height_difference):
+    """
+    获取每个区间内每一行字幕的最大文本框
+    区间内的帧与上一个处理的帧文本框完全一致，且上一帧没有改变最大文本框列表时，再次处理也不会产生变化，直接跳过，
+    对于get_same_mask_ranges得到的区间，每个区间通常只需要处理一到两帧
+    :return list 与ranges一一对应的最大文本框列表
+    """
+    result = []
+    for start_no, end_no in ranges:
+        area_max_box_list = []
+        last_boxes, changed = None, True
+        for frame_no in range(start_no, end_no + 1):
+            boxes = store.get_boxes(frame_no)
+            if not changed and np.array_equal(boxes, last_boxes):
+                continue
+            changed = update_area_max_boxes(area_max_box_list, boxes.tolist(), threshold_height_difference)
+            last_boxes = boxes
+        unique_box_list = []
+        for area_max_box in area_max_box_list:
+            if area_max_box not in unique_box_list:
+                unique_box_list.append(area_max_box)
+        result.append(unique_box_list)
+    return result
+
+
+def get_united_boxes(store, ranges, area_max_box_lists):
+    """
+    将区间内每一帧的文本框替换为与之相交的区间最大文本框
+    同一区间内文本框列表相同的帧结果相同，按文本框列表缓存计算结果
+    :return DetectionStore
+    """
+    frame_no_list, box_list = [], []
+    for (start_no, end_no), area_max_box_list in zip(ranges, area_max_box_lists):
+        max_boxes = np.array([[box['xmin'], box['xmax'], box['ymin'], box['ymax']] for box in area_max_box_list],
+                             dtype=np.int64).reshape(-1, 4)
+        united_cache = {}
+        for frame_no in range(start_no, end_no + 1):
+            boxes = store.get_boxes(frame_no)
+            cache_key = boxes.tobytes()
+            if cache_key not in united_cache:
+                _, overlap = box_intersection_matrix(boxes, max_boxes)
+                united = []
+                for _, j in zip(*np.nonzero(overlap)):
+                    united_box = tuple(max_boxes[j].tolist())
+                    if united_box not in united:
+                        united.append(united_box)
+                united_cache[cache_key] = united
+            for united_box in united_cache[cache_key]:
+                frame_no_list.append(frame_no)
+                box_list.append(united_box)
+    return DetectionStore(np.array(frame_no_list, dtype=np.int32), np.array(box_list, dtype=np.int64).reshape(-1, 4))
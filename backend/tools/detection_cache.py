@@ -0,0 +1,192 @@
+"""
+字幕检测结果与场景切换帧号的磁盘缓存
+同一个视频更换inpaint算法或参数重新处理时，可以直接读取缓存，跳过字幕检测与场景检测
+缓存文件名格式：{视频指纹}_{类型}_{参数摘要}.npz
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from backend.tools.detection_store import DetectionStore
+
+# 缓存格式版本号，缓存内容的格式变化时修改，使旧缓存失效
+CACHE_FORMAT_VERSION = 1
+# 计算视频指纹时采样的帧数
+FINGERPRINT_SAMPLE_FRAMES = 8
+
+# 视频指纹缓存，避免同一次运行中重复计算 {(路径, 文件大小, 修改时间): 指纹}
+_fingerprint_memo = {}
+
+
+def get_video_fingerprint(video_path):
+    """
+    计算视频指纹：文件大小、帧数、帧率、分辨率，以及均匀采样的若干帧缩略图的哈希
+    """
+    stat = os.stat(video_path)
+    memo_key = (os.path.abspath(video_path), stat.st_size, stat.st_mtime)
+    if memo_key in _fingerprint_memo:
+        return _fingerprint_memo[memo_key]
+    video_cap = cv2.VideoCapture(video_path)
+    frame_count = int(video_cap.get(cv2.CAP_PROP_FRAME_COUNT) + 0.5)
+    md5 = hashlib.md5()
+    md5.update(str((stat.st_size, frame_count, video_cap.get(cv2.CAP_PROP_FPS),
+                    int(video_cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                    int(video_cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))).encode())
+    sample_count = min(FINGERPRINT_SAMPLE_FRAMES, frame_count)
+    for i in range(sample_count):
+        video_cap.set(cv2.CAP_PROP_POS_FRAMES, i * frame_count // sample_count)
+        ret, frame = video_cap.read()
+        if not ret:
+            continue
+        # 使用缩小后的灰度图计算哈希，降低计算量
+        thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (64, 36), interpolation=cv2.INTER_AREA)
+        md5.update(thumb.tobytes())
+    video_cap.release()
+    fingerprint = md5.hexdigest()[:16]
+    _fingerprint_memo[memo_key] = fingerprint
+    return fingerprint
+
+
+def get_model_signature(model_dir, filenames=('inference.pdmodel', 'inference.pdiparams')):
+    """
+    模型文件的标识：各文件的大小与修改时间，替换或升级模型后缓存失效
+    """
+    signature = []
+    for filename in filenames:
+        path = os.path.join(model_dir, filename)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append([filename, stat.st_size, stat.st_mtime])
+    return signature
+
+
+def get_settings_digest(settings):
+    """
+    计算影响结果的参数摘要
+    """
+    settings = dict(settings, version=CACHE_FORMAT_VERSION)
+    return hashlib.md5(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class DetectionCache:
+    """
+    检测结果磁盘缓存，缓存目录总大小超过上限时，按最近使用时间淘汰最久未使用的缓存
+    """
+
+    def __init__(self, cache_dir, max_size_mb):
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+
+    def get_cache_path(self, video_path, kind, settings):
+        fingerprint = get_video_fingerprint(video_path)
+        return os.path.join(self.cache_dir, f'{fingerprint}_{kind}_{get_settings_digest(settings)}.npz')
+
+    def load(self, video_path, kind, settings):
+        """
+        读取缓存
+        :return dict 缓存的数组，没有缓存时返回None
+        """
+        cache_path = self.get_cache_path(video_path, kind, settings)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with np.load(cache_path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except Exception as e:
+            print(f'[Warning] failed to load cache {cache_path}: {e}')
+            return None
+        # 更新访问时间，用于LRU淘汰
+        os.utime(cache_path)
+        return arrays
+
+    def save(self, video_path, kind, settings, **arrays):
+        """
+        保存缓存，先写入临时文件再重命名，避免中断时留下不完整的缓存文件
+        """
+        cache_path = self.get_cache_path(video_path, kind, settings)
+        temp_path = None
+        try:
+            # 缓存目录无法创建或不可写时只打印警告，不影响去字幕流程
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(temp_path, cache_path)
+        except Exception as e:
+            print(f'[Warning] failed to save cache {cache_path}: {e}')
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.evict()
+
+    def load_subtitle_store(self, video_path, settings):
+        arrays = self.load(video_path, 'subtitle', settings)
+        if arrays is None:
+            return None
+        return DetectionStore(arrays['frame_no'], arrays['boxes'])
+
+    def save_subtitle_store(self, video_path, settings, subtitle_store):
+        self.save(video_path, 'subtitle', settings, frame_no=subtitle_store.frame_no, boxes=subtitle_store.boxes)
+
+    def load_scene_div_frame_no(self, video_path, settings):
+        arrays = self.load(video_path, 'scene', settings)
+        if arrays is None:
+            return None
+        return arrays['frame_no'].tolist()
+
+    def save_scene_div_frame_no(self, video_path, settings, scene_div_frame_no_list):
+        self.save(video_path, 'scene', settings, frame_no=np.array(scene_div_frame_no_list, dtype=np.int32))
+
+    def list_cache_files(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.npz')]
+
+    def evict(self):
+        """
+        缓存目录超过大小上限时，删除最久未使用的缓存
+        """
+        cache_files = sorted(self.list_cache_files(), key=os.path.getmtime)
+        total_size = sum(os.path.getsize(path) for path in cache_files)
+        for path in cache_files:
+            if total_size <= self.max_size:
+                break
+            total_size -= os.path.getsize(path)
+            os.remove(path)
+
+    def invalidate(self, video_path=None):
+        """
+        删除缓存
+        :param video_path 只删除指定视频的缓存，为None时清空所有缓存
+        """
+        fingerprint = get_video_fingerprint(video_path) if video_path is not None else None
+        removed = 0
+        for path in self.list_cache_files():
+            if fingerprint is None or os.path.basename(path).startswith(f'{fingerprint}_'):
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+if __name__ == '__main__':
+    from backend import config
+    parser = argparse.ArgumentParser(description="字幕检测缓存管理")
+    parser.add_argument("--invalidate", metavar="VIDEO_PATH", help="删除指定视频的缓存")
+    parser.add_argument("--clear", action="store_true", help="清空所有缓存")
+    args = parser.parse_args()
+    detection_cache = DetectionCache(config.DETECTION_CACHE_DIR, config.DETECTION_CACHE_MAX_SIZE)
+    if args.clear:
+        print(f'removed {detection_cache.invalidate()} cache files')
+    elif args.invalidate:
+        print(f'removed {detection_cache.invalidate(args.invalidate)} cache files')
+    else:
+        cache_files = detection_cache.list_cache_files()
+        total_size = sum(os.path.getsize(path) for path in cache_files)
+        print(f'{len(cache_files)} cache files, {total_size / 1024 / 1024:.2f}MB in {detection_cache.cache_dir}')
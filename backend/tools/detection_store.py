@@ -0,0 +1,161 @@
+"""
+列式存储的字幕检测结果
+长视频的检测结果有几十万帧，使用 {帧号: [(xmin, xmax, ymin, ymax), ...]} 的字典存储时，每个文本框都是一个Python元组，
+内存占用与复制开销都很大，这里改为使用并列的NumPy数组存储
+"""
+from collections.abc import Mapping
+
+import numpy as np
+
+
+def dt_boxes_to_coordinates(dt_boxes):
+    """
+    将检测模型返回的四点检测框转换为坐标数组，与SubtitleDetect.get_coordinates的计算方式一致
+    :param dt_boxes 检测框数组，形状为 (n, 4, 2)
+    :return 坐标数组，形状为 (n, 4)，每行为 (xmin, xmax, ymin, ymax)
+    """
+    points = np.asarray(dt_boxes).reshape(-1, 4, 2).astype(np.int32)
+    xmin = np.maximum(points[:, 0, 0], points[:, 3, 0])
+    xmax = np.minimum(points[:, 1, 0], points[:, 2, 0])
+    ymin = np.maximum(points[:, 0, 1], points[:, 1, 1])
+    ymax = np.minimum(points[:, 2, 1], points[:, 3, 1])
+    return np.stack([xmin, xmax, ymin, ymax], axis=1)
+
+
+class DetectionStore(Mapping):
+    """
+    字幕检测结果，按帧号排序，同一帧的文本框连续存放
+    - frame_no: int32[n] 每个文本框所在的帧号
+    - boxes: int16[n, 4] 每个文本框的坐标 (xmin, xmax, ymin, ymax)
+    - track_id: int32[n] 每个文本框所属的轨迹编号，-1表示未分配
+    实现了Mapping接口，store[帧号] 返回 [(xmin, xmax, ymin, ymax), ...]，可以替代原来的字典使用
+    """
+
+    def __init__(self, frame_no=None, boxes=None, track_id=None):
+        if frame_no is None:
+            frame_no = np.zeros(0, dtype=np.int32)
+            boxes = np.zeros((0, 4), dtype=np.int16)
+        frame_no = np.asarray(frame_no, dtype=np.int32)
+        boxes = np.clip(np.asarray(boxes).reshape(-1, 4), np.iinfo(np.int16).min, np.iinfo(np.int16).max).astype(np.int16)
+        if track_id is None:
+            track_id = np.full(len(frame_no), -1, dtype=np.int32)
+        track_id = np.asarray(track_id, dtype=np.int32)
+        # 按帧号稳定排序，保持同一帧内文本框的顺序
+        if len(frame_no) > 1 and np.any(frame_no[1:] < frame_no[:-1]):
+            order = np.argsort(frame_no, kind='stable')
+            frame_no, boxes, track_id = frame_no[order], boxes[order], track_id[order]
+        self.frame_no = frame_no
+        self.boxes = boxes
+        self.track_id = track_id
+        # 有文本框的帧号
+        self.frames = frame_no[np.r_[True, frame_no[1:] != frame_no[:-1]]] if len(frame_no) > 0 else frame_no
+        # 按帧号索引的偏移数组，第i帧的文本框为 boxes[offsets[i]:offsets[i + 1]]，查询某一帧时不需要查找
+        max_frame_no = int(frame_no[-1]) if len(frame_no) > 0 else -1
+        self.offsets = np.searchsorted(frame_no, np.arange(max_frame_no + 2)).astype(np.int32)
+
+    @classmethod
+    def from_dict(cls, subtitle_frame_no_box_dict):
+        """
+        从 {帧号: 文本框列表} 字典创建
+        """
+        frame_no_list, box_list = [], []
+        for frame_no, boxes in subtitle_frame_no_box_dict.items():
+            for box in boxes:
+                frame_no_list.append(frame_no)
+                box_list.append(box)
+        return cls(np.array(frame_no_list, dtype=np.int32), np.array(box_list, dtype=np.int32).reshape(-1, 4))
+
+    @classmethod
+    def concatenate(cls, stores):
+        """
+        合并多个检测结果
+        """
+        stores = list(stores)
+        if len(stores) == 0:
+            return cls()
+        return cls(np.concatenate([store.frame_no for store in stores]),
+                   np.concatenate([store.boxes for store in stores]),
+                   np.concatenate([store.track_id for store in stores]))
+
+    def get_range(self, frame_no):
+        """
+        获取某一帧的文本框在数组中的起止位置，没有该帧时起止位置相同
+        """
+        if 0 <= frame_no < len(self.offsets) - 1:
+            return self.offsets[frame_no], self.offsets[frame_no + 1]
+        return 0, 0
+
+    def get_boxes(self, frame_no):
+        """
+        获取某一帧的坐标数组，没有该帧时返回空数组
+        """
+        start, end = self.get_range(frame_no)
+        return self.boxes[start:end]
+
+    def __getitem__(self, frame_no):
+        start, end = self.get_range(frame_no)
+        if start == end:
+            raise KeyError(frame_no)
+        return [tuple(box) for box in self.boxes[start:end].tolist()]
+
+    def __contains__(self, frame_no):
+        start, end = self.get_range(frame_no)
+        return start != end
+
+    def __iter__(self):
+        return iter(self.frames.tolist())
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __repr__(self):
+        return f'DetectionStore(frames={len(self.frames)}, boxes={len(self.frame_no)})'
+
+
+def to_detection_store(subtitle_frame_no_box_dict):
+    """
+    将 {帧号: 文本框列表} 字典转换为DetectionStore，已经是DetectionStore时直接返回
+    """
+    if isinstance(subtitle_frame_no_box_dict, DetectionStore):
+        return subtitle_frame_no_box_dict
+    return DetectionStore.from_dict(subtitle_frame_no_box_dict)
+
+
+class DetectionStoreBuilder:
+    """
+    逐帧收集检测结果，最后一次性拼接为DetectionStore，帧可以乱序添加
+    """
+    # 积累的小数组数量达到该值时合并一次，减少大量小数组的内存开销
+    COMPACT_CHUNKS = 4096
+
+    def __init__(self):
+        self.frame_no_list = []
+        self.count_list = []
+        self.box_chunks = []
+        self.frame_no_array = np.zeros(0, dtype=np.int32)
+        self.box_array = np.zeros((0, 4), dtype=np.int16)
+
+    def add(self, frame_no, boxes):
+        """
+        :param frame_no 帧号
+        :param boxes 该帧的坐标数组，形状为 (n, 4)，空数组会被忽略
+        """
+        if len(boxes) == 0:
+            return
+        self.frame_no_list.append(frame_no)
+        self.count_list.append(len(boxes))
+        self.box_chunks.append(boxes)
+        if len(self.box_chunks) >= self.COMPACT_CHUNKS:
+            self.compact()
+
+    def compact(self):
+        if len(self.box_chunks) == 0:
+            return
+        self.frame_no_array = np.concatenate([self.frame_no_array,
+                                              np.repeat(np.array(self.frame_no_list, dtype=np.int32), self.count_list)])
+        self.box_array = np.concatenate([self.box_array, np.concatenate(self.box_chunks).astype(np.int16)])
+        self.frame_no_list, self.count_list, self.box_chunks = [], [], []
+
+    def build(self):
+        self.compact()
+        return DetectionStore(self.frame_no_array, self.box_array)
@@ -1,4 +1,9 @@
+import atexit
 import multiprocessing
+import os
+from collections import deque
+from multiprocessing import shared_memory
+
 import cv2
 import numpy as np
 
@@ -31,45 +36,178 @@ def batch_generator(data, max_batch_size):
         yield data[last_batch_start:]
 
 
-def inference_task(batch_data):
-    inpainted_frame_dict = dict()
-    for data in batch_data:
-        index, original_frame, coords_list = data
-        mask_size = original_frame.shape[:2]
-        mask = create_mask(mask_size, coords_list)
-        inpaint_frame = inpaint(original_frame, mask)
-        inpainted_frame_dict[index] = inpaint_frame
-    return inpainted_frame_dict
+# 自动确定CPU推理的工作进程数时的上限，每个进程各载入一份模型，进程过多时内存占用过大
+LAMA_MAX_WORKER_PROCESSES = 4
+
+# 工作进程中常驻的LaMa模型，由init_lama_worker在进程启动时载入
+_worker_lama_inpaint = None
+
+
+def init_lama_worker(device, model_path, num_threads):
+    global _worker_lama_inpaint
+    import torch
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    _worker_lama_inpaint = LamaInpaint(torch.device(device), model_path)
+
+
+def lama_worker_task(shm_name, frame_shape, mask_count):
+    """
+    在工作进程中修复共享内存中的帧，共享内存依次存放帧与mask_count个mask，修复结果写回帧所在的位置
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frame = np.ndarray(frame_shape, dtype=np.uint8, buffer=shm.buf)
+        masks = np.ndarray((mask_count, *frame_shape[:2]), dtype=np.uint8, buffer=shm.buf, offset=frame.nbytes)
+        inpainted_frame = frame
+        for mask in masks:
+            inpainted_frame = _worker_lama_inpaint(inpainted_frame, mask)
+        frame[:] = inpainted_frame
+        del frame, masks
+    finally:
+        shm.close()
+
+
+class LamaWorkerPool:
+    """
+    常驻的LaMa多进程推理池，每个工作进程启动时载入一次模型
+    帧与mask通过共享内存传给工作进程，修复结果写回同一块共享内存，结果按提交顺序返回
+    """
+
+    def __init__(self, processes=None, device=None, model_path=None, max_pending=None):
+        """
+        :param processes 工作进程数，为None时使用config.LAMA_WORKER_PROCESSES
+        :param device 工作进程中模型所在的设备，为None时与LamaInpaint一致，有GPU时使用cuda
+        :param model_path big-lama模型路径，为None时使用默认路径
+        :param max_pending 同时提交给工作进程的最大帧数，用于限制共享内存的占用，为None时为工作进程数的2倍
+        """
+        if device is None:
+            import torch
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        if processes is None:
+            processes = self.get_default_processes(device)
+        self.processes = processes
+        self.max_pending = max_pending if max_pending is not None else processes * 2
+        # CPU推理时平分CPU核数，避免各进程的线程相互争抢
+        num_threads = max(1, multiprocessing.cpu_count() // processes) if device == 'cpu' else 0
+        self.pool = multiprocessing.get_context('spawn').Pool(processes, initializer=init_lama_worker,
+                                                              initargs=(device, model_path, num_threads))
+
+    @staticmethod
+    def get_default_processes(device):
+        """
+        默认工作进程数：GPU推理时只用一个进程，避免每个进程各载入一份模型占满显存；
+        CPU推理时使用config.LAMA_WORKER_PROCESSES，为0时取CPU核数，且不超过LAMA_MAX_WORKER_PROCESSES
+        """
+        if device != 'cpu':
+            return 1
+        if config.LAMA_WORKER_PROCESSES > 0:
+            return config.LAMA_WORKER_PROCESSES
+        return max(1, min(multiprocessing.cpu_count(), LAMA_MAX_WORKER_PROCESSES))
 
+    def submit(self, frame, masks):
+        """
+        将帧与mask写入新的共享内存并提交给工作进程
+        :return (共享内存, AsyncResult)
+        """
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        masks = [np.asarray(mask, dtype=np.uint8).reshape(*frame.shape[:2], -1)[:, :, 0] for mask in masks]
+        mask_size = frame.shape[0] * frame.shape[1]
+        shm = shared_memory.SharedMemory(create=True, size=frame.nbytes + mask_size * len(masks))
+        shared_frame = np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf)
+        shared_frame[:] = frame
+        shared_masks = np.ndarray((len(masks), *frame.shape[:2]), dtype=np.uint8, buffer=shm.buf, offset=frame.nbytes)
+        for shared_mask, mask in zip(shared_masks, masks):
+            shared_mask[:] = mask
+        del shared_frame, shared_masks
+        return shm, self.pool.apply_async(lama_worker_task, (shm.name, frame.shape, len(masks)))
 
-def parallel_inference(inputs, batch_size=None, pool_size=None):
+    @staticmethod
+    def collect(shm, frame_shape, async_result):
+        """
+        等待工作进程完成，从共享内存中取出修复结果并释放共享内存
+        """
+        try:
+            async_result.get()
+            return np.ndarray(frame_shape, dtype=np.uint8, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def imap(self, tasks):
+        """
+        按顺序修复多帧，最多同时提交max_pending帧
+        :param tasks 可迭代的 (key, 帧, mask列表)
+        :return 生成 (key, 修复后的帧)，顺序与tasks一致
+        """
+        pending = deque()
+        try:
+            for key, frame, masks in tasks:
+                pending.append((key, np.shape(frame), *self.submit(frame, masks)))
+                if len(pending) >= self.max_pending:
+                    key, frame_shape, shm, async_result = pending.popleft()
+                    yield key, self.collect(shm, frame_shape, async_result)
+            while pending:
+                key, frame_shape, shm, async_result = pending.popleft()
+                yield key, self.collect(shm, frame_shape, async_result)
+        finally:
+            # 中途出错或停止迭代时释放未取回结果的共享内存
+            for _, _, shm, _ in pending:
+                shm.close()
+                shm.unlink()
+
+    def inpaint(self, frame, masks):
+        """
+        依次使用masks中的每个mask修复一帧
+        """
+        shm, async_result = self.submit(frame, masks)
+        return self.collect(shm, np.shape(frame), async_result)
+
+    def close(self):
+        """
+        等待已提交的任务完成后关闭工作进程
+        """
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+_default_pool = None
+
+
+def get_lama_worker_pool():
     """
-    并行推理，同时保持结果顺序
+    返回进程内共用的LamaWorkerPool，首次调用时创建，进程退出时关闭
     """
-    if pool_size is None:
-        pool_size = multiprocessing.cpu_count()
-    # 使用上下文管理器自动管理进程池
-    with multiprocessing.Pool(processes=pool_size) as pool:
-        batched_inputs = list(batch_generator(inputs, batch_size))
-        # 使用map函数保证输入输出的顺序是一致的
-        batch_results = pool.map(inference_task, batched_inputs)
-    # 将批推理结果展平
-    index_inpainted_frames = [item for sublist in batch_results for item in sublist]
-    return index_inpainted_frames
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = LamaWorkerPool()
+        atexit.register(_default_pool.close)
+    return _default_pool
 
 
-def inpaint(img, mask):
-    lama_inpaint_instance = LamaInpaint()
-    img_inpainted = lama_inpaint_instance(img, mask)
-    return img_inpainted
+def inpaint(img, mask, pool=None):
+    return inpaint_with_multiple_masks(img, [mask], pool)
 
 
-def inpaint_with_multiple_masks(censored_img, mask_list):
-    inpainted_frame = censored_img
-    if mask_list:
-        for mask in mask_list:
-            inpainted_frame = inpaint(inpainted_frame, mask)
-    return inpainted_frame
+def inpaint_with_multiple_masks(censored_img, mask_list, pool=None):
+    if not mask_list:
+        return censored_img
+    if pool is None:
+        pool = get_lama_worker_pool()
+    return pool.inpaint(censored_img, mask_list)
 
 
 def create_mask(size, coords_list):
@@ -91,25 +229,31 @@ def create_mask(size, coords_list):
     return mask
 
 
-def inpaint_video(video_path, sub_list):
-    index = 0
-    frame_to_inpaint_list = []
-    video_cap = cv2.VideoCapture(video_path)
-    while True:
-        # 读取视频帧
-        ret, frame = video_cap.read()
-        if not ret:
-            break
-        index += 1
-        if index in sub_list.keys():
-            frame_to_inpaint_list.append((index, frame, sub_list[index]))
-        if len(frame_to_inpaint_list) > config.PROPAINTER_MAX_LOAD_NUM:
-            batch_results = parallel_inference(frame_to_inpaint_list)
-            for index, frame in batch_results:
-                file_name = f'/home/yao/Documents/Project/video-subtitle-remover/test/temp/{index}.png'
-                cv2.imwrite(file_name, frame)
-                print(f"success write: {file_name}")
-            frame_to_inpaint_list.clear()
+def inpaint_video(video_path, sub_list, output_dir, pool=None):
+    """
+    使用LamaWorkerPool修复视频中有字幕的帧，修复结果按帧号保存为图片
+    """
+    if pool is None:
+        pool = get_lama_worker_pool()
+    os.makedirs(output_dir, exist_ok=True)
+
+    def read_tasks():
+        index = 0
+        video_cap = cv2.VideoCapture(video_path)
+        while True:
+            # 读取视频帧
+            ret, frame = video_cap.read()
+            if not ret:
+                break
+            index += 1
+            if index in sub_list.keys():
+                yield index, frame, [create_mask(frame.shape[:2], sub_list[index])]
+        video_cap.release()
+
+    for index, frame in pool.imap(read_tasks()):
+        file_name = os.path.join(output_dir, f'{index}.png')
+        cv2.imwrite(file_name, frame)
+        print(f"success write: {file_name}")
     print(f'finished')
 
 
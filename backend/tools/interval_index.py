@@ -0,0 +1,74 @@
+"""
+帧号区间索引
+字幕区间按起始帧号排序后，使用二分查找回答"某一帧是否为区间开头/所在区间在哪一帧结束/区间被哪些场景切换点分割"等查询，
+避免在逐帧处理的循环中线性扫描整个区间列表
+"""
+from bisect import bisect_left, bisect_right
+
+
+class IntervalIndex:
+    """
+    闭区间 [起始帧号, 结束帧号] 的有序索引，区间之间不重叠(find_continuous_ranges等方法得到的区间都满足)
+    """
+
+    def __init__(self, intervals):
+        """
+        :param intervals [(起始帧号, 结束帧号)]
+        """
+        self.intervals = sorted((int(start), int(end)) for start, end in intervals)
+        self.starts = [start for start, _ in self.intervals]
+        self.ends = [end for _, end in self.intervals]
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def __iter__(self):
+        return iter(self.intervals)
+
+    def find(self, frame_no):
+        """
+        获取包含该帧的区间序号，不在任何区间内时返回-1
+        """
+        index = bisect_right(self.starts, frame_no) - 1
+        if index >= 0 and frame_no <= self.ends[index]:
+            return index
+        return -1
+
+    def is_start(self, frame_no):
+        """
+        判断该帧是否为某个区间的起始帧
+        """
+        index = bisect_left(self.starts, frame_no)
+        return index < len(self.starts) and self.starts[index] == frame_no
+
+    def find_end(self, frame_no):
+        """
+        获取包含该帧的区间的结束帧号，不在任何区间内时返回-1
+        """
+        index = self.find(frame_no)
+        return self.ends[index] if index >= 0 else -1
+
+    def find_next_start(self, frame_no):
+        """
+        获取起始帧号大于该帧的第一个区间的起始帧号，没有时返回None
+        """
+        index = bisect_right(self.starts, frame_no)
+        return self.starts[index] if index < len(self.starts) else None
+
+    def split_by_points(self, points):
+        """
+        按分割点(如场景切换帧号)切分区间，分割点所在帧作为新区间的起始帧
+        :param points 分割点帧号列表
+        :return [(起始帧号, 结束帧号)]
+        """
+        points = sorted(points)
+        result_intervals = []
+        for start, end in self.intervals:
+            # 只遍历落在当前区间内的分割点
+            for point in points[bisect_left(points, start):bisect_right(points, end)]:
+                if start < point:
+                    result_intervals.append((start, point - 1))
+                start = point
+            result_intervals.append((start, end))
+        return result_intervals
+
@@ -0,0 +1,67 @@
+"""
+按mask将修复结果合成回原始帧
+mask在一个字幕区间内不变，预先计算mask各连通区域的紧凑外接矩形及矩形内的布尔索引，
+合成时只处理这些矩形内的像素，且全程使用uint8，不再对整帧或整个修复区域做浮点混合
+"""
+import cv2
+import numpy as np
+
+
+class MaskCompositor:
+    """
+    mask中非0的像素使用修复结果，其余像素保持原始帧不变
+    """
+
+    def __init__(self, mask):
+        """
+        :param mask 形状为(高, 宽)或(高, 宽, 通道)的mask，非0的像素为需要修复的区域
+        """
+        mask = np.asarray(mask)
+        if mask.ndim == 3:
+            mask = mask.any(axis=2)
+        self.mask = mask > 0
+        count, _, stats, _ = cv2.connectedComponentsWithStats(self.mask.astype(np.uint8), connectivity=8)
+        # 各连通区域的外接矩形 (ymin, ymax, xmin, xmax)，不包含ymax与xmax
+        self.boxes = [(y, y + h, x, x + w) for x, y, w, h, _ in stats[1:count].tolist()]
+        self.box_masks = [self.mask[ymin:ymax, xmin:xmax] for ymin, ymax, xmin, xmax in self.boxes]
+        # 所有连通区域的外接矩形，mask为空时为None
+        if self.boxes:
+            self.bbox = (min(box[0] for box in self.boxes), max(box[1] for box in self.boxes),
+                         min(box[2] for box in self.boxes), max(box[3] for box in self.boxes))
+        else:
+            self.bbox = None
+
+    def composite(self, frame, comp, area=None, rgb=False):
+        """
+        将修复结果合成到原始帧，在原地修改frame
+        :param frame 原始帧(BGR, uint8)
+        :param comp 修复结果(uint8)，对应frame中area所在的矩形，尺寸与矩形不同时按双线性插值缩放(与cv2.resize一致)，
+                    只计算mask外接矩形内的像素
+        :param area 修复结果在frame中的位置 (ymin, ymax, xmin, xmax)，为None时对应整帧
+        :param rgb 修复结果是否为RGB，为True时只对外接矩形内的像素转换颜色空间
+        :return frame
+        """
+        if area is None:
+            area = (0, frame.shape[0], 0, frame.shape[1])
+        area_ymin, area_ymax, area_xmin, area_xmax = area
+        scale_y = comp.shape[0] / (area_ymax - area_ymin)
+        scale_x = comp.shape[1] / (area_xmax - area_xmin)
+        for (ymin, ymax, xmin, xmax), box_mask in zip(self.boxes, self.box_masks):
+            # 与修复结果所在的矩形求交
+            top, bottom = max(ymin, area_ymin), min(ymax, area_ymax)
+            left, right = max(xmin, area_xmin), min(xmax, area_xmax)
+            if top >= bottom or left >= right:
+                continue
+            if scale_y == 1 and scale_x == 1:
+                comp_roi = comp[top - area_ymin:bottom - area_ymin, left - area_xmin:right - area_xmin]
+            else:
+                # 只缩放外接矩形内的像素，采样位置与cv2.resize相同(像素中心对齐)
+                matrix = np.float32([[scale_x, 0, (left - area_xmin + 0.5) * scale_x - 0.5],
+                                     [0, scale_y, (top - area_ymin + 0.5) * scale_y - 0.5]])
+                comp_roi = cv2.warpAffine(comp, matrix, (right - left, bottom - top),
+                                          flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
+            if rgb:
+                comp_roi = cv2.cvtColor(comp_roi, cv2.COLOR_RGB2BGR)
+            np.copyto(frame[top:bottom, left:right], comp_roi,
+                      where=box_mask[top - ymin:bottom - ymin, left - xmin:right - xmin, None])
+        return frame
@@ -0,0 +1,262 @@
+import queue
+import sys
+import threading
+import time
+
+import cv2
+
+
+class ThreadedFrameReader:
+    """
+    视频帧读取器，在后台解码线程中读取视频帧并放入有界队列，使解码与推理并行
+    迭代得到 (帧号, 视频帧)，视频第一帧的帧号为1
+    """
+
+    def __init__(self, video_cap, queue_size=16, downscale=1, start_frame_no=1, end_frame_no=None):
+        """
+        :param video_cap cv2.VideoCapture对象
+        :param queue_size 队列长度，小于1时不使用后台线程，在调用方线程中同步解码
+        :param downscale 解码后缩小的倍数，缩小操作在解码线程中完成
+        :param start_frame_no 读取的起始帧号，大于1时先跳转到该帧
+        :param end_frame_no 读取的结束帧号(包含)，为None时读取到视频结尾
+        """
+        self.video_cap = video_cap
+        self.queue_size = queue_size
+        self.downscale = downscale
+        self.start_frame_no = start_frame_no
+        self.end_frame_no = end_frame_no
+        # 各阶段耗时统计：decode为解码线程的解码耗时，put_wait为解码线程等待队列空位的耗时(消费者是瓶颈)，
+        # get_wait为调用方等待视频帧的耗时(解码是瓶颈)
+        self.stats = {'decode': 0.0, 'put_wait': 0.0, 'get_wait': 0.0}
+        self._stop = threading.Event()
+        self._exception_info = None
+
+    def read(self, frame_no):
+        """
+        读取并缩放一帧，返回None表示读取结束
+        """
+        if self.end_frame_no is not None and frame_no > self.end_frame_no:
+            return None
+        start = time.time()
+        if frame_no == self.start_frame_no and frame_no > 1:
+            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, frame_no - 1)
+        ret, frame = self.video_cap.read()
+        if ret and self.downscale > 1:
+            frame = cv2.resize(frame, (round(frame.shape[1] / self.downscale), round(frame.shape[0] / self.downscale)),
+                               interpolation=cv2.INTER_AREA)
+        self.stats['decode'] += time.time() - start
+        return frame if ret else None
+
+    def __iter__(self):
+        if self.queue_size < 1:
+            frame_no = self.start_frame_no
+            while not self._stop.is_set():
+                frame = self.read(frame_no)
+                if frame is None:
+                    break
+                yield frame_no, frame
+                frame_no += 1
+            return
+        frame_queue = queue.Queue(self.queue_size)
+        self._stop.clear()
+        decode_thread = threading.Thread(target=self._decode_thread, args=(frame_queue,), daemon=True)
+        decode_thread.start()
+        try:
+            while True:
+                start = time.time()
+                frame_no, frame = frame_queue.get()
+                self.stats['get_wait'] += time.time() - start
+                if frame is None:
+                    break
+                yield frame_no, frame
+        finally:
+            # 调用方提前结束迭代时，通知解码线程退出并清空队列，避免解码线程阻塞在put上
+            self._stop.set()
+            while decode_thread.is_alive():
+                while not frame_queue.empty():
+                    frame_queue.get_nowait()
+                decode_thread.join(timeout=0.1)
+        if self._exception_info is not None:
+            raise self._exception_info[1].with_traceback(self._exception_info[2])
+
+    def _decode_thread(self, out_queue):
+        frame_no = self.start_frame_no
+        try:
+            while not self._stop.is_set():
+                frame = self.read(frame_no)
+                if frame is None:
+                    break
+                start = time.time()
+                out_queue.put((frame_no, frame))
+                self.stats['put_wait'] += time.time() - start
+                frame_no += 1
+        # 解码线程中的异常交给调用方线程重新抛出
+        except BaseException:
+            self._exception_info = sys.exc_info()
+        finally:
+            out_queue.put((None, None))
+
+    def close(self):
+        self._stop.set()
+
+    def print_stats(self, consumer_name, consumer_time):
+        """
+        打印解码与消费两侧的耗时，等待时间较长的一侧不是瓶颈
+        """
+        print(f'[Info] decode busy {self.stats["decode"]:.2f}s, waiting {self.stats["put_wait"]:.2f}s; '
+              f'{consumer_name} busy {consumer_time:.2f}s, waiting {self.stats["get_wait"]:.2f}s')
+
+
+class PipelineExecutor:
+    """
+    读取/推理/写入三阶段流水线，读取与写入各在一个后台线程中进行，推理在调用方线程中进行，阶段之间用有界队列连接
+    每个阶段只有一个线程且按先进先出处理，写入顺序与读取顺序一致；下游阶段处理不过来时，上游阶段阻塞在队列上(背压)
+    """
+    STAGES = ('read', 'infer', 'write')
+    # 队列中表示没有更多任务的标记
+    _END = object()
+
+    def __init__(self, queue_size=1):
+        """
+        :param queue_size 阶段之间的队列长度，小于1时不使用后台线程，三个阶段在调用方线程中依次执行
+        """
+        self.queue_size = queue_size
+        # 各阶段的耗时统计：busy为处理任务的耗时，wait为等待上游任务或下游队列空位的耗时
+        self.stats = {stage: {'busy': 0.0, 'wait': 0.0} for stage in self.STAGES}
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._exception_info = None
+
+    def run(self, tasks, infer_func, write_func):
+        """
+        :param tasks 可迭代对象，在读取线程中迭代，每个元素为一个任务(如一段视频帧)
+        :param infer_func 推理函数，在调用方线程中依次处理每个任务，返回值交给写入函数
+        :param write_func 写入函数，在写入线程中按任务顺序调用
+        """
+        start = time.time()
+        try:
+            if self.queue_size < 1:
+                self._run_serial(tasks, infer_func, write_func)
+            else:
+                self._run_pipelined(tasks, infer_func, write_func)
+        finally:
+            self.elapsed += time.time() - start
+        if self._exception_info is not None:
+            exception_info, self._exception_info = self._exception_info, None
+            raise exception_info[1].with_traceback(exception_info[2])
+
+    def _run_serial(self, tasks, infer_func, write_func):
+        task_iter = iter(tasks)
+        while True:
+            start = time.time()
+            task = next(task_iter, self._END)
+            self.stats['read']['busy'] += time.time() - start
+            if task is self._END:
+                break
+            start = time.time()
+            result = infer_func(task)
+            self.stats['infer']['busy'] += time.time() - start
+            start = time.time()
+            write_func(result)
+            self.stats['write']['busy'] += time.time() - start
+
+    def _run_pipelined(self, tasks, infer_func, write_func):
+        read_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue(self.queue_size)
+        self._stop.clear()
+        read_thread = threading.Thread(target=self._read_thread, args=(tasks, read_queue), daemon=True)
+        write_thread = threading.Thread(target=self._write_thread, args=(write_func, write_queue), daemon=True)
+        read_thread.start()
+        write_thread.start()
+        finished = False
+        try:
+            while True:
+                task = self._get(read_queue, 'infer')
+                if task is self._END:
+                    break
+                start = time.time()
+                result = infer_func(task)
+                self.stats['infer']['busy'] += time.time() - start
+                if not self._put(write_queue, result, 'infer'):
+                    break
+            finished = self._put(write_queue, self._END, 'infer')
+        finally:
+            # 正常结束时等待写入线程写完剩余的结果，否则通知读取与写入线程退出
+            if finished:
+                write_thread.join()
+            self._stop.set()
+            read_thread.join()
+            write_thread.join()
+
+    def _read_thread(self, tasks, out_queue):
+        try:
+            task_iter = iter(tasks)
+            while not self._stop.is_set():
+                start = time.time()
+                task = next(task_iter, self._END)
+                self.stats['read']['busy'] += time.time() - start
+                if task is self._END:
+                    break
+                if not self._put(out_queue, task, 'read'):
+                    break
+        # 后台线程中的异常交给调用方线程重新抛出
+        except BaseException:
+            self._exception_info = self._exception_info or sys.exc_info()
+        finally:
+            self._put(out_queue, self._END, 'read')
+
+    def _write_thread(self, write_func, in_queue):
+        try:
+            while True:
+                result = self._get(in_queue, 'write')
+                if result is self._END:
+                    break
+                start = time.time()
+                write_func(result)
+                self.stats['write']['busy'] += time.time() - start
+        except BaseException:
+            self._exception_info = self._exception_info or sys.exc_info()
+            self._stop.set()
+
+    def _put(self, out_queue, item, stage):
+        """
+        放入队列，队列已满时等待，返回False表示流水线已停止
+        """
+        start = time.time()
+        try:
+            while not self._stop.is_set():
+                try:
+                    out_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.stats[stage]['wait'] += time.time() - start
+
+    def _get(self, in_queue, stage):
+        """
+        从队列中取出，队列为空时等待，流水线已停止时返回_END
+        """
+        start = time.time()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return in_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return self._END
+        finally:
+            self.stats[stage]['wait'] += time.time() - start
+
+    def utilization(self):
+        """
+        各阶段忙碌时间占总耗时的比例，比例最高的阶段是瓶颈
+        """
+        return {stage: self.stats[stage]['busy'] / self.elapsed if self.elapsed > 0 else 0.0 for stage in self.STAGES}
+
+    def print_stats(self):
+        utilization = self.utilization()
+        print(f'[Info] pipeline total {self.elapsed:.2f}s; ' + ', '.join(
+            f'{stage} busy {self.stats[stage]["busy"]:.2f}s ({100 * utilization[stage]:.0f}%), '
+            f'waiting {self.stats[stage]["wait"]:.2f}s' for stage in self.STAGES))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与backend中各模块一致，将项目根目录加入搜索路径，以便导入backend包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,232 @@
+"""
+box_tracks与原基于Python循环和shapely的实现(LegacyBoxTracks)的结果一致性
+检测数据分别来自合成数据与tests/data/detections.json
+"""
+import json
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.tools.box_tracks import (link_tracks, get_continuous_ranges, get_same_mask_ranges, get_area_max_boxes,
+                                      get_united_boxes)
+from backend.tools.detection_store import DetectionStore
+
+pytest.importorskip('shapely')
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# 与config.py中的默认值一致
+CONFIG = SimpleNamespace(PIXEL_TOLERANCE_X=20, PIXEL_TOLERANCE_Y=20, THRESHOLD_HEIGHT_DIFFERENCE=20)
+
+
+class LegacyBoxTracks:
+    """
+    原基于Python循环与shapely的文本框统一实现，作为参照验证box_tracks的结果是否一致
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+    def are_similar(self, region1, region2):
+        xmin1, xmax1, ymin1, ymax1 = region1
+        xmin2, xmax2, ymin2, ymax2 = region2
+        return abs(xmin1 - xmin2) <= self.config.PIXEL_TOLERANCE_X and abs(xmax1 - xmax2) <= self.config.PIXEL_TOLERANCE_X and \
+            abs(ymin1 - ymin2) <= self.config.PIXEL_TOLERANCE_Y and abs(ymax1 - ymax2) <= self.config.PIXEL_TOLERANCE_Y
+
+    def unify_regions(self, raw_regions):
+        keys = sorted(raw_regions.keys())
+        last_key = keys[0]
+        unify_value_map = {last_key: raw_regions[last_key]}
+        for key in keys[1:]:
+            new_unify_values = []
+            for idx, region in enumerate(raw_regions[key]):
+                last_standard_region = unify_value_map[last_key][idx] if idx < len(unify_value_map[last_key]) else None
+                if last_standard_region and self.are_similar(region, last_standard_region):
+                    new_unify_values.append(last_standard_region)
+                else:
+                    new_unify_values.append(region)
+            unify_value_map[key] = new_unify_values
+            last_key = key
+        return {key: unify_value_map[key] for key in keys}
+
+    @staticmethod
+    def find_continuous_ranges(subtitle_frame_no_box_dict):
+        numbers = sorted(list(subtitle_frame_no_box_dict.keys()))
+        ranges = []
+        start = numbers[0]
+        for i in range(1, len(numbers)):
+            if numbers[i] - numbers[i - 1] != 1:
+                ranges.append((start, numbers[i - 1]))
+                start = numbers[i]
+        ranges.append((start, numbers[-1]))
+        return ranges
+
+    @staticmethod
+    def find_continuous_ranges_with_same_mask(subtitle_frame_no_box_dict):
+        numbers = sorted(list(subtitle_frame_no_box_dict.keys()))
+        ranges = []
+        start = numbers[0]
+        for i in range(1, len(numbers)):
+            if numbers[i] - numbers[i - 1] != 1:
+                ranges.append((start, numbers[i - 1]))
+                start = numbers[i]
+            if numbers[i] - numbers[i - 1] == 1:
+                if subtitle_frame_no_box_dict[numbers[i]] != subtitle_frame_no_box_dict[numbers[i - 1]]:
+                    ranges.append((start, numbers[i - 1]))
+                    start = numbers[i]
+        ranges.append((start, numbers[-1]))
+        return ranges
+
+    @staticmethod
+    def compute_iou(box1, box2):
+        from shapely.geometry import Polygon
+
+        def to_polygon(box):
+            xmin, xmax, ymin, ymax = box
+            return Polygon([[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax]])
+        box1_polygon, box2_polygon = to_polygon(box1), to_polygon(box2)
+        intersection = box1_polygon.intersection(box2_polygon)
+        if intersection.is_empty:
+            return -1
+        union_area = box1_polygon.area + box2_polygon.area - intersection.area
+        return intersection.area / union_area if union_area > 0 else 0
+
+    def get_area_max_box_dict(self, sub_frame_no_list_continuous, subtitle_frame_no_box_dict):
+        threshold = self.config.THRESHOLD_HEIGHT_DIFFERENCE
+        _area_max_box_dict = dict()
+        for start_no, end_no in sub_frame_no_list_continuous:
+            area_max_box_list = []
+            for current_no in range(start_no, end_no + 1):
+                for xmin, xmax, ymin, ymax in subtitle_frame_no_box_dict[current_no]:
+                    current_area = abs(xmax - xmin) * abs(ymax - ymin)
+                    if len(area_max_box_list) < 1:
+                        area_max_box_list.append({'area': current_area, 'xmin': xmin, 'xmax': xmax, 'ymin': ymin, 'ymax': ymax})
+                        continue
+                    has_same_position = False
+                    for area_max_box in area_max_box_list:
+                        if area_max_box['ymin'] - threshold <= ymin and ymax <= area_max_box['ymax'] + threshold:
+                            if self.compute_iou((xmin, xmax, ymin, ymax), (area_max_box['xmin'], area_max_box['xmax'],
+                                                                           area_max_box['ymin'], area_max_box['ymax'])) != -1:
+                                if abs(abs(area_max_box['ymax'] - area_max_box['ymin']) - abs(ymax - ymin)) < threshold:
+                                    has_same_position = True
+                                if has_same_position and current_area > area_max_box['area']:
+                                    area_max_box.update(area=current_area, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax)
+                    if not has_same_position:
+                        new_large_area = {'area': current_area, 'xmin': xmin, 'xmax': xmax, 'ymin': ymin, 'ymax': ymax}
+                        if new_large_area not in area_max_box_list:
+                            area_max_box_list.append(new_large_area)
+                            break
+            _area_max_box_list = list()
+            for area_max_box in area_max_box_list:
+                if area_max_box not in _area_max_box_list:
+                    _area_max_box_list.append(area_max_box)
+            _area_max_box_dict[f'{start_no}->{end_no}'] = _area_max_box_list
+        return _area_max_box_dict
+
+    def get_subtitle_frame_no_box_dict_with_united_coordinates(self, subtitle_frame_no_box_dict):
+        result = dict()
+        frame_no_list = self.find_continuous_ranges_with_same_mask(subtitle_frame_no_box_dict)
+        area_max_box_dict = self.get_area_max_box_dict(frame_no_list, subtitle_frame_no_box_dict)
+        for start_no, end_no in frame_no_list:
+            area_max_box_list = area_max_box_dict[f'{start_no}->{end_no}']
+            for current_no in range(start_no, end_no + 1):
+                new_box_list = []
+                for current_box in subtitle_frame_no_box_dict[current_no]:
+                    for max_box in area_max_box_list:
+                        large_box = (max_box['xmin'], max_box['xmax'], max_box['ymin'], max_box['ymax'])
+                        if self.compute_iou(current_box, large_box) != -1 and large_box not in new_box_list:
+                            new_box_list.append(large_box)
+                result[current_no] = new_box_list
+        return result
+
+
+def make_synthetic_detections(frame_count, seed, jitter):
+    """
+    生成合成的字幕检测结果：字幕每隔若干帧切换一次，部分帧没有字幕，每帧1-3个文本框
+    :param jitter 检测框坐标随机抖动的最大像素数，大于容差时同一字幕也会被拆分为多条轨迹
+    """
+    rng = np.random.default_rng(seed)
+    frame_no_list, box_list = [], []
+    frame_no = 1
+    while frame_no <= frame_count:
+        duration = int(rng.integers(1, 60))
+        if rng.random() < 0.8:
+            lines = int(rng.integers(1, 4))
+            boxes = [(int(rng.integers(200, 600)), int(rng.integers(1300, 1700)), 900 + 60 * line, 950 + 60 * line)
+                     for line in range(lines)]
+            for current_no in range(frame_no, min(frame_no + duration, frame_count + 1)):
+                for box in boxes:
+                    frame_no_list.append(current_no)
+                    box_list.append([value + int(rng.integers(-jitter, jitter + 1)) for value in box])
+        frame_no += duration
+    return DetectionStore(np.array(frame_no_list, dtype=np.int32), np.array(box_list, dtype=np.int32).reshape(-1, 4))
+
+
+def load_fixture_detections():
+    with open(os.path.join(DATA_DIR, 'detections.json')) as f:
+        data = json.load(f)
+    return DetectionStore(np.array(data['frame_no'], dtype=np.int32), np.array(data['boxes'], dtype=np.int32))
+
+
+STORES = {
+    'fixture': load_fixture_detections,
+    'synthetic-small-jitter': lambda: make_synthetic_detections(3000, seed=0, jitter=3),
+    'synthetic-large-jitter': lambda: make_synthetic_detections(3000, seed=1, jitter=25),
+}
+
+
+@pytest.fixture(params=list(STORES))
+def raw_store(request):
+    return STORES[request.param]()
+
+
+@pytest.fixture
+def legacy():
+    return LegacyBoxTracks(CONFIG)
+
+
+def unify(store):
+    return link_tracks(store, CONFIG.PIXEL_TOLERANCE_X, CONFIG.PIXEL_TOLERANCE_Y)
+
+
+def test_link_tracks(raw_store, legacy):
+    unified = unify(raw_store)
+    assert dict(unified) == legacy.unify_regions(dict(raw_store))
+    # 轨迹编号按首次出现的顺序从0开始连续编号
+    _, first_index = np.unique(unified.track_id, return_index=True)
+    assert np.array_equal(unified.track_id[np.sort(first_index)], np.arange(len(first_index)))
+
+
+def test_get_continuous_ranges(raw_store, legacy):
+    assert get_continuous_ranges(raw_store) == legacy.find_continuous_ranges(dict(raw_store))
+
+
+def test_get_same_mask_ranges(raw_store, legacy):
+    unified = unify(raw_store)
+    assert get_same_mask_ranges(unified) == legacy.find_continuous_ranges_with_same_mask(dict(unified))
+
+
+def test_get_area_max_boxes(raw_store, legacy):
+    unified = unify(raw_store)
+    ranges = get_same_mask_ranges(unified)
+    expected = legacy.get_area_max_box_dict(ranges, dict(unified))
+    actual = get_area_max_boxes(unified, ranges, CONFIG.THRESHOLD_HEIGHT_DIFFERENCE)
+    assert actual == [expected[f'{start_no}->{end_no}'] for start_no, end_no in ranges]
+
+
+def test_get_united_boxes(raw_store, legacy):
+    unified = unify(raw_store)
+    ranges = get_same_mask_ranges(unified)
+    area_max_box_lists = get_area_max_boxes(unified, ranges, CONFIG.THRESHOLD_HEIGHT_DIFFERENCE)
+    expected = legacy.get_subtitle_frame_no_box_dict_with_united_coordinates(dict(unified))
+    # 原实现保留没有文本框的帧，DetectionStore中只有有文本框的帧
+    assert dict(get_united_boxes(unified, ranges, area_max_box_lists)) == {
+        frame_no: boxes for frame_no, boxes in expected.items() if boxes}
+
+
+def test_empty_store():
+    store = DetectionStore()
+    assert len(unify(store)) == 0
+    assert get_continuous_ranges(store) == []
+    assert get_same_mask_ranges(store) == []
@@ -0,0 +1,89 @@
+"""
+LaMa的ONNX导出：使用与big-lama中FFC结构相同的小模型，检查傅里叶变换能否导出，且ONNX Runtime的输出与torch一致
+"""
+import os
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('onnxruntime')
+pytest.importorskip('onnxscript')
+nn = torch.nn
+
+try:
+    from backend.inpaint.lama_onnx import OnnxLamaModel, export_module, make_sample_inputs, quantize_module
+except Exception as e:
+    # config在导入时需要backend/models与ffmpeg目录下的文件
+    pytest.skip(f'backend.config is not importable: {e}', allow_module_level=True)
+
+
+class FourierUnit(nn.Module):
+    """
+    与LaMa的FourierUnit相同：rfftn后将实部、虚部作为通道做卷积，再irfftn回空间域
+    """
+
+    def __init__(self, channels):
+        super().__init__()
+        self.conv = nn.Conv2d(channels * 2, channels * 2, 1, bias=False)
+        self.bn = nn.BatchNorm2d(channels * 2)
+
+    def forward(self, x):
+        batch = x.shape[0]
+        ffted = torch.fft.rfftn(x, dim=(-2, -1), norm='ortho')
+        ffted = torch.stack((ffted.real, ffted.imag), dim=-1)
+        ffted = ffted.permute(0, 1, 4, 2, 3).contiguous()
+        ffted = ffted.view((batch, -1,) + ffted.size()[3:])
+        ffted = torch.relu(self.bn(self.conv(ffted)))
+        ffted = ffted.view((batch, -1, 2,) + ffted.size()[2:]).permute(0, 1, 3, 4, 2).contiguous()
+        ffted = torch.complex(ffted[..., 0], ffted[..., 1])
+        return torch.fft.irfftn(ffted, s=x.shape[-2:], dim=(-2, -1), norm='ortho')
+
+
+class TinyLama(nn.Module):
+    """
+    输入输出与big-lama相同的小模型：(image, mask) -> 修复后的图像
+    """
+
+    def __init__(self, channels=8):
+        super().__init__()
+        self.head = nn.Conv2d(4, channels, 3, padding=1)
+        self.fourier_unit = FourierUnit(channels)
+        self.tail = nn.Conv2d(channels, 3, 3, padding=1)
+
+    def forward(self, image, mask):
+        x = torch.relu(self.head(torch.cat([image * (1 - mask), mask], dim=1)))
+        return torch.sigmoid(self.tail(x + self.fourier_unit(x)))
+
+
+@pytest.fixture(scope='module')
+def traced_model():
+    torch.manual_seed(0)
+    model = TinyLama().eval()
+    with torch.no_grad():
+        return torch.jit.trace(model, make_sample_inputs())
+
+
+@pytest.fixture(scope='module')
+def onnx_path(traced_model, tmp_path_factory):
+    # 导出后的校验不通过时export_module抛出异常
+    return export_module(traced_model, str(tmp_path_factory.mktemp('onnx') / 'tiny-lama.onnx'), atol=1e-4)
+
+
+@pytest.mark.parametrize('batch, height, width', [(1, 64, 64), (2, 120, 640), (3, 72, 48)])
+def test_onnx_matches_torch(traced_model, onnx_path, batch, height, width):
+    image, mask = make_sample_inputs(batch, height, width)
+    with torch.no_grad():
+        expected = traced_model(image, mask)
+    actual = OnnxLamaModel(onnx_path, 'cpu', providers=['CPUExecutionProvider'])(image, mask)
+    assert actual.shape == expected.shape
+    assert np.allclose(actual.numpy(), expected.numpy(), atol=1e-4)
+
+
+def test_int8_checked_against_torch(traced_model, onnx_path, tmp_path):
+    int8_path = str(tmp_path / 'tiny-lama.int8.onnx')
+    assert quantize_module(traced_model, onnx_path, int8_path, min_psnr=30) == int8_path
+    # PSNR达不到下限时删除量化结果并抛出异常
+    with pytest.raises(RuntimeError):
+        quantize_module(traced_model, onnx_path, int8_path, min_psnr=200)
+    assert not os.path.exists(int8_path)
@@ -0,0 +1,53 @@
+"""
+STTN各注意力实现(math、sdpa、chunked)的结果一致性
+"""
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from backend.inpaint.sttn.auto_sttn import Attention, InpaintGenerator, MultiHeadedAttention
+
+# 与InpaintGenerator一致的分块尺寸与特征尺寸(模型输入120x640经编码器缩小4倍)
+PATCH_SIZE = [(80, 15), (32, 6), (10, 5), (5, 3)]
+FEAT_HEIGHT, FEAT_WIDTH = 30, 160
+
+
+@pytest.mark.parametrize('b, t', [(1, 3), (2, 2)])
+@pytest.mark.parametrize('backend, chunk_size', [('sdpa', 1024), ('chunked', 1024), ('chunked', 7)])
+def test_multi_headed_attention_backends_match_math(b, t, backend, chunk_size):
+    torch.manual_seed(0)
+    attention = MultiHeadedAttention(PATCH_SIZE, d_model=256).eval()
+    x = torch.randn(b * t, 256, FEAT_HEIGHT, FEAT_WIDTH)
+    with torch.no_grad():
+        expected = attention(x, b, 256)
+        attention.attention.backend, attention.attention.chunk_size = backend, chunk_size
+        actual = attention(x, b, 256)
+    assert torch.allclose(actual, expected, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize('backend', ['sdpa', 'chunked'])
+def test_attention_backends_match_math(backend):
+    torch.manual_seed(0)
+    query, key, value = torch.randn(3, 2, 50, 48).unbind(0)
+    expected, _ = Attention('math')(query, key, value)
+    actual, p_attn = Attention(backend, chunk_size=16)(query, key, value)
+    assert p_attn is None
+    assert torch.allclose(actual, expected, rtol=1e-4, atol=1e-5)
+
+
+def test_generator_infer_backends_match_math():
+    torch.manual_seed(0)
+    model = InpaintGenerator().eval()
+    feat = torch.randn(2 * 3, 256, FEAT_HEIGHT, FEAT_WIDTH)
+    outputs = {}
+    with torch.no_grad():
+        for backend in Attention.BACKENDS:
+            model.set_attention_backend(backend, chunk_size=500)
+            outputs[backend] = model.infer(feat, 2)
+    for backend in ('sdpa', 'chunked'):
+        assert torch.allclose(outputs[backend], outputs['math'], rtol=1e-4, atol=1e-4)
+
+
+def test_set_attention_backend_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        InpaintGenerator().set_attention_backend('flash')
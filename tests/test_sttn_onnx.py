@@ -0,0 +1,40 @@
+"""
+STTN生成器的ONNX导出：使用随机初始化的InpaintGenerator，检查编码器、Transformer与解码器在不同 (区域数, 帧数) 下与torch的输出一致
+"""
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('onnxruntime')
+
+try:
+    from backend.inpaint.sttn_onnx import OnnxInpaintGenerator, export_onnx
+    from backend.inpaint.sttn.auto_sttn import InpaintGenerator
+except Exception as e:
+    # config在导入时需要backend/models与ffmpeg目录下的文件
+    pytest.skip(f'backend.config is not importable: {e}', allow_module_level=True)
+
+
+@pytest.fixture(scope='module')
+def model():
+    torch.manual_seed(0)
+    return InpaintGenerator().eval()
+
+
+@pytest.fixture(scope='module')
+def onnx_generator(model, tmp_path_factory):
+    onnx_dir = str(tmp_path_factory.mktemp('sttn_onnx'))
+    # 导出后的校验不通过时export_onnx抛出异常
+    export_onnx(model, onnx_dir)
+    return OnnxInpaintGenerator('cpu', onnx_dir, providers=['CPUExecutionProvider'])
+
+
+@pytest.mark.parametrize('strip_count, frame_count', [(1, 3), (2, 5)])
+def test_onnx_matches_torch(model, onnx_generator, strip_count, frame_count):
+    torch.manual_seed(strip_count)
+    frames = torch.rand(strip_count * frame_count, 3, 120, 640) * 2 - 1
+    with torch.no_grad():
+        feats = model.encoder(frames)
+        assert torch.allclose(onnx_generator.encoder(frames), feats, atol=1e-4)
+        pred_feats = model.infer(feats, strip_count)
+        assert torch.allclose(onnx_generator.infer(feats, strip_count), pred_feats, atol=1e-4)
+        assert torch.allclose(onnx_generator.decoder(pred_feats), model.decoder(pred_feats), atol=1e-4)
@@ -0,0 +1,64 @@
+"""
+STTN多个修复区域批量推理与逐区域推理的结果一致性，使用随机初始化的InpaintGenerator
+"""
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+try:
+    from backend import config
+    from backend.inpaint.sttn_inpaint import STTNInpaint
+    from backend.inpaint.sttn.auto_sttn import InpaintGenerator
+except Exception as e:
+    # config在导入时需要backend/models与ffmpeg目录下的文件
+    pytest.skip(f'backend.config is not importable: {e}', allow_module_level=True)
+
+
+def make_sttn_inpaint(seed=0):
+    """
+    创建使用随机权重的STTNInpaint，不载入预训练模型
+    """
+    torch.manual_seed(seed)
+    sttn_inpaint = STTNInpaint.__new__(STTNInpaint)
+    sttn_inpaint.device = torch.device('cpu')
+    sttn_inpaint.model = InpaintGenerator().eval()
+    sttn_inpaint.model_input_width, sttn_inpaint.model_input_height = 640, 120
+    sttn_inpaint.neighbor_stride = 5
+    sttn_inpaint.ref_length = 10
+    return sttn_inpaint
+
+
+def make_strip_frames(strip_count, frame_count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [[rng.integers(0, 256, (120, 640, 3), dtype=np.uint8) for _ in range(frame_count)] for _ in range(strip_count)]
+
+
+def assert_frames_close(actual, expected):
+    assert len(actual) == len(expected)
+    for actual_frames, expected_frames in zip(actual, expected):
+        assert len(actual_frames) == len(expected_frames)
+        for a, b in zip(actual_frames, expected_frames):
+            # 输出为uint8，批量与逐个推理的浮点误差可能使个别像素取整后相差1
+            assert np.allclose(a.astype(np.int16), b.astype(np.int16), rtol=0, atol=1)
+
+
+@pytest.mark.parametrize('strip_count, frame_count', [(2, 12), (3, 7)])
+def test_inpaint_batch_matches_sequential(monkeypatch, strip_count, frame_count):
+    monkeypatch.setattr(config, 'STTN_BATCH_STRIPS', True)
+    sttn_inpaint = make_sttn_inpaint()
+    strip_frames = make_strip_frames(strip_count, frame_count)
+    sequential = [sttn_inpaint.inpaint(frames) for frames in strip_frames]
+    batched = sttn_inpaint.inpaint_batch(strip_frames)
+    assert_frames_close(batched, sequential)
+
+
+def test_complete_strips_batch_toggle(monkeypatch):
+    sttn_inpaint = make_sttn_inpaint()
+    feats = torch.rand(2, 8, 3, 120, 640) * 2 - 1
+    enc_feats = sttn_inpaint.encode(feats)
+    monkeypatch.setattr(config, 'STTN_BATCH_STRIPS', True)
+    batched = sttn_inpaint.complete_strips(enc_feats)
+    monkeypatch.setattr(config, 'STTN_BATCH_STRIPS', False)
+    sequential = sttn_inpaint.complete_strips(enc_feats)
+    assert_frames_close(batched, sequential)